@@ -27,14 +27,12 @@ class Binaries(Enum):
     DPKG = auto()
     FIND = auto()
     FLOCK = auto()
-    GROUPADD = auto()
-    GROUPMOD = auto()
     LSOF = auto()
+    MKFS_EROFS = auto()
     MKFS_VFAT = auto()
     MKNOD = auto()
     MKSQUASHFS = auto()
     MODPROBE = auto()
-    MTOOLS_MMD = auto()
     MTOOLS_MCOPY = auto()
     NBD_CLIENT = auto()
     OBJCOPY = auto()
@@ -47,10 +45,9 @@ class Binaries(Enum):
     SWUPD = auto()
     SYNC = auto()
     SYSTEMCTL = auto()
+    SYSTEMD_NSPAWN = auto()
     SYSTEMD_REPART = auto()
     TAR = auto()
-    USERADD = auto()
-    USERMOD = auto()
     VERITYSETUP = auto()
 
 
@@ -92,14 +89,12 @@ def _find_binaries() -> typing.Dict[Binaries, str]:
         Binaries.DPKG: _check_for_binary("dpkg"),
         Binaries.FIND: _check_for_binary("find"),
         Binaries.FLOCK: _check_for_binary("flock"),
-        Binaries.GROUPADD: _check_for_binary("groupadd"),
-        Binaries.GROUPMOD: _check_for_binary("groupmod"),
         Binaries.LSOF: _check_for_binary("lsof"),
+        Binaries.MKFS_EROFS: _check_for_binary("mkfs.erofs"),
         Binaries.MKFS_VFAT: _check_for_binary("mkfs.vfat"),
         Binaries.MKNOD: _check_for_binary("mknod"),
         Binaries.MKSQUASHFS: _check_for_binary("mksquashfs"),
         Binaries.MODPROBE: _check_for_binary("modprobe"),
-        Binaries.MTOOLS_MMD: _check_for_binary("mmd"),
         Binaries.MTOOLS_MCOPY: _check_for_binary("mcopy"),
         Binaries.NBD_CLIENT: _check_for_binary("nbd-client"),
         Binaries.OBJCOPY: _check_for_binary("objcopy"),
@@ -110,10 +105,9 @@ def _find_binaries() -> typing.Dict[Binaries, str]:
         Binaries.SWUPD: _check_for_binary("swupd"),
         Binaries.SYNC: _check_for_binary("sync"),
         Binaries.SYSTEMCTL: _check_for_binary("systemctl"),
+        Binaries.SYSTEMD_NSPAWN: _check_for_binary("systemd-nspawn"),
         Binaries.SYSTEMD_REPART: _check_for_binary("systemd-repart"),
         Binaries.TAR: _check_for_binary("tar"),
-        Binaries.USERADD: _check_for_binary("useradd"),
-        Binaries.USERMOD: _check_for_binary("usermod"),
         Binaries.DEBOOTSTRAP: _check_for_binary("debootstrap"),
         Binaries.VERITYSETUP: _check_for_binary("veritysetup"),
         Binaries.PACMAN_KEY: _check_for_binary("pacman-key"),
@@ -134,9 +128,11 @@ class BinaryManager:
                 Binaries.APT_GET,
                 Binaries.DEBOOTSTRAP,
                 Binaries.DPKG,
+                Binaries.MKFS_EROFS,
                 Binaries.PACMAN,
                 Binaries.PACMAN_KEY,
                 Binaries.SWUPD,
+                Binaries.SYSTEMD_NSPAWN,
             ]
         )
 
@@ -13,10 +13,14 @@ from __future__ import annotations
 from .binarymanager import Binaries
 from .exceptions import GenerateError, ParseError
 from .execobject import ExecObject
+from .helper.file import Removal, remove_all
+from .helper import sed
+from .helper.systemd import flush_systemd_enable
 from .location import Location
 from .printer import debug, fail, h3, success, verbose
 from .systemcontext import SystemContext
 
+from contextlib import ExitStack
 import os
 import os.path
 import typing
@@ -157,19 +161,59 @@ class Command:
         )
 
     def _run_hooks(self, system_context: SystemContext, hook_name: str) -> None:
+        if hook_name == "_teardown" and system_context.has_systemd_enables:
+            # Units enabled by systemd_enable are queued till now:
+            flush_systemd_enable(
+                system_context, systemctl_command=self._binary(Binaries.SYSTEMCTL)
+            )
+
         if system_context.hooks_were_run(hook_name):
             verbose(f'Already ran "{hook_name}", skipping.')
             return
 
         h3(f'Running "{hook_name}" hooks.')
 
-        for hook in system_context.hooks(hook_name):
-            command_info = self._service("command_manager").command(hook.command)
-            if not command_info:
-                raise GenerateError(f'Command "{hook.command}" not found.')
-            command_info.execute_func(
-                hook.location, system_context, hook.args, hook.kwargs
-            )
+        # Consecutive remove hooks are merged, so that the file system gets
+        # walked once for all of them. Consecutive sed hooks write each file
+        # once.
+        removals: typing.List[Removal] = []
+        with ExitStack() as seds:
+            for hook in system_context.hooks(hook_name):
+                if hook.command != "sed":
+                    seds.close()
+                elif not sed.is_active(system_context.fs_directory):
+                    seds.enter_context(sed.batch(system_context.fs_directory))
+
+                if hook.command == "remove" and not hook.kwargs.get(
+                    "outside", False
+                ):
+                    # Expand like call_command does for the remove command:
+                    kwargs = {
+                        k: system_context.expand(v) for (k, v) in hook.kwargs.items()
+                    }
+                    removals += [
+                        Removal(
+                            pattern=system_context.expand(a),
+                            recursive=kwargs.get("recursive", False),
+                            force=kwargs.get("force", False),
+                        )
+                        for a in hook.args
+                    ]
+                    continue
+
+                if removals:
+                    remove_all(system_context, *removals)
+                    removals = []
+
+                command_info = self._service("command_manager").command(hook.command)
+                if not command_info:
+                    raise GenerateError(f'Command "{hook.command}" not found.')
+                command_info.execute_func(
+                    hook.location, system_context, hook.args, hook.kwargs
+                )
+
+        if removals:
+            remove_all(system_context, *removals)
 
         success(f'Hooks "{hook_name}" were run successfully.', verbosity=1)
 
@@ -6,6 +6,7 @@
 
 from cleanroom.binarymanager import Binaries
 from cleanroom.command import Command
+from cleanroom.exceptions import ParseError
 from cleanroom.helper.run import run
 from cleanroom.location import Location
 from cleanroom.systemcontext import SystemContext
@@ -255,7 +256,7 @@ def _install_verity_support(
     trace(f"Data: {data_id} ({data_dev} = {data_dev_esc}.")
     trace(f"Hash: {hash_id} ({hash_dev} = {hash_dev_esc}.")
 
-    os.makedirs(os.path.join(staging_area, "/usr/lib/systemd"), exist_ok=True)
+    os.makedirs(os.path.join(staging_area, "usr/lib/systemd"), exist_ok=True)
 
     # Installing binaries is not a good idea in general, as dependencies are not handled!
     # These binaries are probably safe: systemd binaries tend to have few dependencies and those
@@ -379,8 +380,12 @@ class CreateClrmConfigInitrdCommand(Command):
         """Constructor."""
         super().__init__(
             "_create_clrm_config_initrd",
-            syntax="<INITRD_FILE> [root_hash=<ROOT_HASH>]",
-            help_string="Create an initrd with extra cleanroom config.",
+            syntax="<INITRD_FILE> [root_hash=<ROOT_HASH>] "
+            "[root_fs_type=(squashfs|erofs)] [part=(all|config|verity)]",
+            help_string="Create an initrd with extra cleanroom config.\n\n"
+            'Note: "part=config" leaves out the dm-verity setup (which needs '
+            'the root hash), "part=verity" creates an initrd containing only '
+            "that. Both together are equivalent to the default \"part=all\".",
             file=__file__,
             **services,
         )
@@ -392,7 +397,24 @@ class CreateClrmConfigInitrdCommand(Command):
         self._validate_args_exact(
             location, 1, '"{}" takes an initrd to create.', *args,
         )
-        self._validate_kwargs(location, ("root_hash",), **kwargs)
+        self._validate_kwargs(
+            location, ("root_hash", "root_fs_type", "part"), **kwargs
+        )
+
+        part = kwargs.get("part", "all")
+        if part not in ("all", "config", "verity"):
+            raise ParseError(
+                f'"{self.name}": Unknown part "{part}".', location=location
+            )
+        if part == "verity" and "root_hash" not in kwargs:
+            raise ParseError(
+                f'"{self.name}": part "verity" needs a root_hash.', location=location
+            )
+        if part == "config" and "root_hash" in kwargs:
+            raise ParseError(
+                f'"{self.name}": part "config" does not take a root_hash.',
+                location=location,
+            )
 
     def register_substitutions(self) -> typing.List[typing.Tuple[str, str, str]]:
         return [
@@ -423,6 +445,8 @@ class CreateClrmConfigInitrdCommand(Command):
             return
 
         root_hash = kwargs.get("root_hash", "")
+        root_fs_type = kwargs.get("root_fs_type", "squashfs")
+        part = kwargs.get("part", "all")
         vg = system_context.substitution_expanded("DEFAULT_VG", None)
         image_fs = system_context.substitution_expanded("IMAGE_FS", None)
         image_device = _device_ify(
@@ -433,6 +457,14 @@ class CreateClrmConfigInitrdCommand(Command):
 
         initrd = args[0]
 
+        if part == "verity":
+            staging_area = os.path.join(system_context.cache_directory, "clrm_verity")
+            os.makedirs(staging_area)
+
+            _install_verity_support(staging_area, system_context, root_hash)
+            self._create_cpio(staging_area, initrd)
+            return
+
         staging_area = os.path.join(system_context.cache_directory, "clrm_extra")
         os.makedirs(staging_area)
 
@@ -440,13 +472,17 @@ class CreateClrmConfigInitrdCommand(Command):
             *system_context.substitution_expanded("INITRD_EXTRA_MODULES", "").split(
                 ","
             ),
-            "squashfs",
+            root_fs_type,
             *_install_image_file_support(
                 staging_area, image_fs, image_device, image_options, image_name
             ),
             *_install_lvm_support(staging_area, vg, image_name),
             *_install_sysroot_setup_support(staging_area),
-            *_install_verity_support(staging_area, system_context, root_hash),
+            *(
+                ["dm-verity"]  # verity support will be in a separate initrd
+                if part == "config"
+                else _install_verity_support(staging_area, system_context, root_hash)
+            ),
             *_install_volatile_support(staging_area, system_context),
             *_install_var_mount_support(staging_area, system_context),
             *_install_etc_shadow(staging_area, system_context),
@@ -461,7 +497,9 @@ class CreateClrmConfigInitrdCommand(Command):
             f'INITRD_EXTRA_MODULES is now {system_context.substitution("INITRD_EXTRA_MODULES", "")}.'
         )
 
-        # Create Initrd:
+        self._create_cpio(staging_area, initrd)
+
+    def _create_cpio(self, staging_area: str, initrd: str) -> None:
         run(
             "/bin/sh",
             "-c",
@@ -10,6 +10,7 @@ from cleanroom.command import Command
 from cleanroom.location import Location
 from cleanroom.helper.file import size_extend
 from cleanroom.helper.run import run
+from cleanroom.helper.verity import create_hash_tree
 from cleanroom.systemcontext import SystemContext
 
 
@@ -23,7 +24,8 @@ class CreateDmverityFsimageCommand(Command):
         """Constructor."""
         super().__init__(
             "_create_dmverity_fsimage",
-            syntax="DMVERITY_IMAGE FILE " "[base_image=<BASE_FILE_IMAGE]",
+            syntax="DMVERITY_IMAGE FILE "
+            "[base_image=<BASE_FILE_IMAGE] [builtin=False]",
             help_string="Export a filesystem image.",
             file=__file__,
             **services
@@ -36,7 +38,7 @@ class CreateDmverityFsimageCommand(Command):
         self._validate_args_exact(
             location, 1, "{} needs a filename for the dm-verity image.", *args
         )
-        self._validate_kwargs(location, ("base_image",), **kwargs)
+        self._validate_kwargs(location, ("base_image", "builtin"), **kwargs)
 
     def __call__(
         self,
@@ -50,12 +52,29 @@ class CreateDmverityFsimageCommand(Command):
         base_image = kwargs.get("base_image", "")
         assert base_image
 
+        root_hash: typing.Optional[str] = None
+        uuid: typing.Optional[str] = None
+        if kwargs.get("builtin", False):
+            result = create_hash_tree(base_image, verity_file)
+            (root_hash, uuid) = (result.root_hash, result.uuid)
+        else:
+            (root_hash, uuid) = self._veritysetup_format(base_image, verity_file)
+
+        size_extend(verity_file)
+
+        assert root_hash is not None
+        assert uuid is not None
+
+        system_context.set_substitution("LAST_DMVERITY_UUID", uuid)
+        system_context.set_substitution("LAST_DMVERITY_ROOTHASH", root_hash)
+
+    def _veritysetup_format(
+        self, base_image: str, verity_file: str
+    ) -> typing.Tuple[typing.Optional[str], typing.Optional[str]]:
         result = run(
             self._binary(Binaries.VERITYSETUP), "format", base_image, verity_file
         )
 
-        size_extend(verity_file)
-
         root_hash: typing.Optional[str] = None
         uuid: typing.Optional[str] = None
         for line in result.stdout.split("\n"):
@@ -64,8 +83,4 @@ class CreateDmverityFsimageCommand(Command):
             if line.startswith("UUID:"):
                 uuid = line[10:].strip()
 
-        assert root_hash is not None
-        assert uuid is not None
-
-        system_context.set_substitution("LAST_DMVERITY_UUID", uuid)
-        system_context.set_substitution("LAST_DMVERITY_ROOTHASH", root_hash)
+        return (root_hash, uuid)
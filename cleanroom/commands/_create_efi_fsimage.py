@@ -128,20 +128,14 @@ def _populate_with_efi_emulator(staging_area: str, efi_emulator: str):
 
 
 def _copy_staging_area_into_efi_partition_file(
-    staging_area: str, efi_file: str, *, mmd: str, mcopy: str
+    staging_area: str, efi_file: str, *, mcopy: str
 ):
     trace(f"Staging area: staging: {staging_area}, EFI file: {efi_file}).")
 
-    for (root, dirs, files) in os.walk(staging_area):
-        trace(f"    root: {root}.")
-
-        relative_path = os.path.relpath(root, start=staging_area)
-        for d in dirs:
-            trace(f"        dir: {d}.")
-            run(mmd, "-i", efi_file, f"::{os.path.join(relative_path, d)}")
-        for f in files:
-            trace(f"        file: {f}.")
-            run(mcopy, "-i", efi_file, os.path.join(root, f), f"::{relative_path}")
+    # One recursive mcopy for everything, directories get created as needed:
+    entries = [os.path.join(staging_area, e) for e in sorted(os.listdir(staging_area))]
+    if entries:
+        run(mcopy, "-s", "-i", efi_file, *entries, "::/")
 
 
 class CreateEfiFsimageCommand(Command):
@@ -294,6 +288,5 @@ class CreateEfiFsimageCommand(Command):
             _copy_staging_area_into_efi_partition_file(
                 staging_area,
                 efi_file,
-                mmd=self._binary(Binaries.MTOOLS_MMD),
                 mcopy=self._binary(Binaries.MTOOLS_MCOPY),
             )
@@ -9,12 +9,22 @@ from cleanroom.binarymanager import Binaries
 from cleanroom.command import Command
 from cleanroom.location import Location
 from cleanroom.helper.file import file_size
+from cleanroom.helper.gpt import (
+    ESP_TYPE,
+    ROOT_X86_64_TYPE,
+    ROOT_X86_64_VERITY_TYPE,
+    Partition,
+    layout,
+    write_gpt,
+)
+from cleanroom.helper.reflink import copy_file_into
 from cleanroom.helper.run import run
-from cleanroom.printer import debug
+from cleanroom.printer import debug, verbose
 from cleanroom.systemcontext import SystemContext
 
 import os
 import typing
+import uuid
 
 
 def _write_repart_config(
@@ -47,7 +57,8 @@ class CreateExportImageCommand(Command):
             "root_uuid=<UUID> "
             "verity_fsimage=<VERITY_PARTITION_IMAGE>] "
             "[verity_label=<STRING>] "
-            "verity_uuid=UUID",
+            "verity_uuid=UUID "
+            "[use_repart=False]",
             help_string="Create a filesystem image ready to be exported from clrm.",
             file=__file__,
             **services,
@@ -70,6 +81,7 @@ class CreateExportImageCommand(Command):
                 "verity_fsimage",
                 "verity_label",
                 "verity_uuid",
+                "use_repart",
             ),
             **kwargs,
         )
@@ -110,6 +122,85 @@ class CreateExportImageCommand(Command):
         verity_uuid = kwargs.get("verity_uuid", "")
         assert verity_partition
 
+        if kwargs.get("use_repart", False):
+            self._create_with_repart(
+                system_context,
+                image_filename,
+                efi_partition=efi_partition,
+                efi_label=efi_label,
+                efi_uuid=efi_uuid,
+                root_partition=root_partition,
+                root_label=root_label,
+                root_uuid=root_uuid,
+                verity_partition=verity_partition,
+                verity_label=verity_label,
+                verity_uuid=verity_uuid,
+            )
+            return
+
+        # Derive the remaining UUIDs from the root partition UUID, so that
+        # the image stays reproducible:
+        root_id = uuid.UUID(root_uuid)
+        total_size, placed = layout(
+            (
+                Partition(
+                    type=ESP_TYPE,
+                    size=file_size(None, efi_partition),
+                    uuid=(
+                        uuid.UUID(efi_uuid) if efi_uuid else uuid.uuid5(root_id, "esp")
+                    ),
+                    label=efi_label,
+                ),
+                Partition(
+                    type=ROOT_X86_64_TYPE,
+                    size=file_size(None, root_partition),
+                    uuid=root_id,
+                    label=root_label,
+                ),
+                Partition(
+                    type=ROOT_X86_64_VERITY_TYPE,
+                    size=file_size(None, verity_partition),
+                    uuid=uuid.UUID(verity_uuid),
+                    label=verity_label,
+                ),
+            )
+        )
+
+        debug(
+            f"Creating export image with {total_size} bytes ("
+            + ", ".join(
+                f"{p.partition.label or p.partition.type}: {p.size}@{p.offset}"
+                for p in placed
+            )
+            + ")"
+        )
+
+        with open(image_filename, "wb") as fd:
+            fd.truncate(total_size)
+            write_gpt(
+                fd.fileno(), total_size, placed, disk_uuid=uuid.uuid5(root_id, "disk")
+            )
+            for image, p in zip(
+                (efi_partition, root_partition, verity_partition), placed
+            ):
+                _, method = copy_file_into(image, fd.fileno(), offset=p.offset)
+                verbose(f'Placed "{image}" into export image using {method}.')
+
+    def _create_with_repart(
+        self,
+        system_context: SystemContext,
+        image_filename: str,
+        *,
+        efi_partition: str,
+        efi_label: str,
+        efi_uuid: str,
+        root_partition: str,
+        root_label: str,
+        root_uuid: str,
+        verity_partition: str,
+        verity_label: str,
+        verity_uuid: str,
+    ) -> None:
         efi_size = file_size(None, efi_partition)
         root_size = file_size(None, root_partition)
         verity_size = file_size(None, verity_partition)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""_create_root_erofs_image command.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from cleanroom.binarymanager import Binaries
+from cleanroom.command import Command
+from cleanroom.exceptions import GenerateError, ParseError
+from cleanroom.location import Location
+from cleanroom.helper.file import size_extend
+from cleanroom.helper.run import run
+from cleanroom.systemcontext import SystemContext
+
+import os
+import typing
+
+
+_COMPRESSIONS = ("none", "lz4", "lz4hc", "lzma")
+
+
+class CreateRootErofsImageCommand(Command):
+    """The _create_root_erofs_image Command."""
+
+    def __init__(self, **services: typing.Any) -> None:
+        """Constructor."""
+        super().__init__(
+            "_create_root_erofs_image",
+            syntax="<ROOTFS_IMAGE> [usr_only=True] "
+            "[compression=(none|lz4|lz4hc|lzma)] [dedupe=False] "
+            "[source_directory=<DIR>]",
+            help_string="Create a EROFS root filesystem image",
+            file=__file__,
+            **services
+        )
+
+    def validate(
+        self, location: Location, *args: typing.Any, **kwargs: typing.Any
+    ) -> None:
+        """Validate arguments."""
+        self._validate_args_exact(
+            location, 1, "{} needs a file name for the root filesystem image.", *args
+        )
+        self._validate_kwargs(
+            location,
+            ("usr_only", "compression", "dedupe", "source_directory"),
+            **kwargs
+        )
+
+        compression = kwargs.get("compression", "none")
+        if compression not in _COMPRESSIONS:
+            raise ParseError(
+                f'"{compression}" is not a supported EROFS compression format.',
+                location=location,
+            )
+        if kwargs.get("dedupe", False) and compression == "none":
+            raise ParseError(
+                "EROFS deduplication requires compression to be enabled.",
+                location=location,
+            )
+
+    def __call__(
+        self,
+        location: Location,
+        system_context: SystemContext,
+        *args: typing.Any,
+        **kwargs: typing.Any
+    ) -> None:
+        """Execute command."""
+        usr_only = kwargs.get("usr_only", True)
+        compression = kwargs.get("compression", "none")
+        dedupe = kwargs.get("dedupe", False)
+        source_directory = kwargs.get(
+            "source_directory", system_context.fs_directory
+        )
+
+        rootfs_file = args[0]
+
+        rootfs_label = system_context.substitution_expanded("ROOTFS_PARTLABEL", "")
+        if not rootfs_label:
+            raise GenerateError("ROOTFS_PARTLABEL is unset.")
+
+        extra_args: typing.List[str] = []
+        if compression != "none":
+            extra_args += ["-z", compression]
+        if dedupe:
+            extra_args.append("-Ededupe")
+        if usr_only:
+            # mkfs.erofs has no equivalent to mksquashfs' -keep-as-directory,
+            # so exclude everything but /usr:
+            extra_args += [
+                f"--exclude-path={f}"
+                for f in sorted(os.listdir(source_directory))
+                if f != "usr"
+            ]
+
+        run(
+            self._binary(Binaries.MKFS_EROFS),
+            *extra_args,
+            rootfs_file,
+            ".",
+            work_directory=source_directory
+        )
+        size_extend(rootfs_file)
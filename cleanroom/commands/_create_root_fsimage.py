@@ -30,7 +30,7 @@ class CreateRootFsimageCommand(Command):
 
         super().__init__(
             "_create_root_fsimage",
-            syntax="<ROOTFS_IMAGE> [usr_only=True]",
+            syntax="<ROOTFS_IMAGE> [usr_only=True] [source_directory=<DIR>]",
             help_string="Create a root filesystem image",
             file=__file__,
             **services
@@ -43,7 +43,7 @@ class CreateRootFsimageCommand(Command):
         self._validate_args_exact(
             location, 1, "{} needs a file name for the root filesystem image.", *args
         )
-        self._validate_kwargs(location, ("usr_only",), **kwargs)
+        self._validate_kwargs(location, ("usr_only", "source_directory"), **kwargs)
 
     def __call__(
         self,
@@ -54,6 +54,9 @@ class CreateRootFsimageCommand(Command):
     ) -> None:
         """Execute command."""
         self._usr_only = kwargs.get("usr_only", True)
+        source_directory = kwargs.get(
+            "source_directory", system_context.fs_directory
+        )
 
         rootfs_file = args[0]
 
@@ -77,6 +80,6 @@ class CreateRootFsimageCommand(Command):
             "-noX",
             "-processors",
             "1",
-            work_directory=system_context.fs_directory
+            work_directory=source_directory
         )
         size_extend(rootfs_file)
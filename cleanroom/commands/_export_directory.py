@@ -7,6 +7,9 @@
 
 from cleanroom.binarymanager import Binaries
 from cleanroom.command import Command
+from cleanroom.exceptions import ParseError
+from cleanroom.helper.chunkstore import COMPRESSIONS, ChunkStore
+from cleanroom.helper.digest import DIGEST_COMMENT_PREFIX
 from cleanroom.helper.run import run
 from cleanroom.location import Location
 from cleanroom.systemcontext import SystemContext
@@ -25,7 +28,9 @@ class ExportDirectoryCommand(Command):
             syntax="<DIRECTORY> "
             "compression=<zstd> "
             "compression_level=<5> "
-            "repository=<REPOSITORY_PATH>",
+            "repository=<REPOSITORY_PATH> "
+            "[repository_type=(borg|chunkstore)] "
+            "[digest=<DIGEST>]",
             help_string="Export a directory from cleanroom.",
             file=__file__,
             **services,
@@ -38,14 +43,36 @@ class ExportDirectoryCommand(Command):
         self._validate_args_exact(
             location,
             1,
-            '"{}" needs a borg repository directory ' "to export into.",
+            '"{}" needs a repository directory ' "to export into.",
             *args,
         )
         self._validate_kwargs(
-            location, ("compression", "compression_level", "repository"), **kwargs
+            location,
+            (
+                "compression",
+                "compression_level",
+                "digest",
+                "repository",
+                "repository_type",
+            ),
+            **kwargs,
         )
         self._require_kwargs(location, ("repository",), **kwargs)
 
+        repository_type = kwargs.get("repository_type", "borg")
+        if repository_type not in ("borg", "chunkstore"):
+            raise ParseError(
+                f'"{repository_type}" is not a supported repository type.',
+                location=location,
+            )
+        if repository_type == "chunkstore" and (
+            kwargs.get("compression", "zlib") not in COMPRESSIONS
+        ):
+            raise ParseError(
+                f'Chunk store repositories only support "{", ".join(COMPRESSIONS)}" compression.',
+                location=location,
+            )
+
     def __call__(
         self,
         location: Location,
@@ -61,12 +88,27 @@ class ExportDirectoryCommand(Command):
 
         backup_name = system_context.system_name + "-" + system_context.timestamp
 
+        if kwargs.get("repository_type", "borg") == "chunkstore":
+            store = ChunkStore.create(
+                export_repository,
+                compression=kwargs.get("compression", "zlib"),
+                compression_level=kwargs.get("compression_level", 6),
+            )
+            store.add_archive(
+                backup_name, export_directory, digest=kwargs.get("digest", "")
+            )
+            return
+
         env = os.environ
         env["BORG_UNKNOWN_UNENCRYPTED_ACCESS_IS_OK"] = "yes"
         env["BORG_RELOCATED_REPO_ACCESS_IS_OK"] = "yes"
 
         comp = kwargs.get("compression", "zstd")
         comp_level = kwargs.get("compression_level", 5)
+        digest = kwargs.get("digest", "")
+        extra_args = (
+            ["--comment", f"{DIGEST_COMMENT_PREFIX}{digest}"] if digest else []
+        )
 
         run(
             self._service("binary_manager").binary(Binaries.BORG),
@@ -75,6 +117,7 @@ class ExportDirectoryCommand(Command):
             f"{comp},{comp_level}",
             "--numeric-owner",
             "--noatime",
+            *extra_args,
             f"{export_repository}::{backup_name}",
             ".",
             work_directory=export_directory,
@@ -10,9 +10,27 @@ from cleanroom.location import Location
 from cleanroom.printer import debug, fail, h2, info, msg, success, trace
 from cleanroom.systemcontext import SystemContext
 
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
 import os.path
+import subprocess
+import time
 import typing
+import xml.etree.ElementTree as ET
+
+
+class _TestResult(typing.NamedTuple):
+    name: str
+    args: typing.Tuple[str, ...]
+    returncode: typing.Optional[int]  # None on timeout
+    duration: float
+    stdout: str
+    stderr: str
+
+    @property
+    def passed(self) -> bool:
+        return self.returncode == 0
 
 
 def _environment(system_context: SystemContext) -> typing.Mapping[str, str]:
@@ -40,6 +58,96 @@ def _find_tests(system_context: SystemContext) -> typing.Generator[str, None, No
         yield test
 
 
+def _run_test(
+    system_context: SystemContext,
+    test: str,
+    env: typing.Mapping[str, str],
+    timeout: typing.Optional[float],
+) -> _TestResult:
+    trace(f"{system_context.system_name}::Running test {test}...")
+    start = time.monotonic()
+    try:
+        test_result = run(
+            test,
+            system_context.system_name,
+            env=env,
+            returncode=None,
+            work_directory=system_context.fs_directory,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired as to:
+        return _TestResult(
+            name=os.path.basename(test),
+            args=(test, system_context.system_name),
+            returncode=None,
+            duration=time.monotonic() - start,
+            stdout=to.stdout.decode("utf-8", "replace") if to.stdout else "",
+            stderr=to.stderr.decode("utf-8", "replace") if to.stderr else "",
+        )
+    return _TestResult(
+        name=os.path.basename(test),
+        args=(test, system_context.system_name),
+        returncode=test_result.returncode,
+        duration=time.monotonic() - start,
+        stdout=test_result.stdout or "",
+        stderr=test_result.stderr or "",
+    )
+
+
+def _write_junit(
+    file_name: str, system_name: str, results: typing.List[_TestResult]
+) -> None:
+    suite = ET.Element(
+        "testsuite",
+        name=system_name,
+        tests=str(len(results)),
+        failures=str(sum(1 for r in results if r.returncode not in (0, None))),
+        errors=str(sum(1 for r in results if r.returncode is None)),
+        time=f"{sum(r.duration for r in results):.3f}",
+    )
+    for r in results:
+        case = ET.SubElement(
+            suite,
+            "testcase",
+            classname=system_name,
+            name=r.name,
+            time=f"{r.duration:.3f}",
+        )
+        if r.returncode is None:
+            ET.SubElement(case, "error", message="Timeout")
+        elif r.returncode != 0:
+            ET.SubElement(case, "failure", message=f"Exit code {r.returncode}")
+        ET.SubElement(case, "system-out").text = r.stdout
+        ET.SubElement(case, "system-err").text = r.stderr
+    ET.ElementTree(suite).write(file_name, encoding="utf-8", xml_declaration=True)
+
+
+def _write_json(
+    file_name: str, system_name: str, results: typing.List[_TestResult]
+) -> None:
+    with open(file_name, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "system": system_name,
+                "tests": [
+                    {
+                        "name": r.name,
+                        "passed": r.passed,
+                        "returncode": r.returncode,
+                        "timeout": r.returncode is None,
+                        "duration": round(r.duration, 3),
+                        "stdout": r.stdout,
+                        "stderr": r.stderr,
+                    }
+                    for r in results
+                ],
+            },
+            f,
+            ensure_ascii=False,
+            indent=4,
+        )
+
+
 class TestCommand(Command):
     """The _test Command."""
 
@@ -50,7 +158,10 @@ class TestCommand(Command):
             help_string="Implicitly run to test images.\n\n"
             "Note: Will run all executable files in the "
             '"test" subdirectory of the systems directory and '
-            "will pass the system name as first argument.",
+            "will pass the system name as first argument.\n"
+            "Tests run in parallel and may not modify the system. Results are "
+            'written to "test-results.xml" (JUnit) and "test-results.json" '
+            "in META_DIR.",
             file=__file__,
             **services,
         )
@@ -60,6 +171,11 @@ class TestCommand(Command):
     ) -> None:
         self._validate_no_arguments(location, *args, **kwargs)
 
+    def register_substitutions(self) -> typing.List[typing.Tuple[str, str, str]]:
+        return [
+            ("TEST_TIMEOUT", "300", "Seconds a system test may run (0: no limit)"),
+        ]
+
     def __call__(
         self,
         location: Location,
@@ -72,20 +188,43 @@ class TestCommand(Command):
             f'Running tests for system "{system_context.system_name}"', verbosity=2,
         )
         env = _environment(system_context)
+        timeout = float(system_context.substitution("TEST_TIMEOUT", "300")) or None
 
-        for test in _find_tests(system_context):
-            trace(f"{system_context.system_name}::Running test {test}...")
-            test_result = run(
-                test,
-                system_context.system_name,
-                env=env,
-                returncode=None,
-                work_directory=system_context.fs_directory,
-            )
-            if test_result.returncode == 0:
-                success(
-                    f'{system_context.system_name}::Test "{test}"', verbosity=3,
+        tests = list(_find_tests(system_context))
+        with ThreadPoolExecutor() as executor:
+            results = list(
+                executor.map(
+                    lambda t: _run_test(system_context, t, env, timeout), tests
                 )
+            )
+
+        os.makedirs(system_context.meta_directory, exist_ok=True)
+        _write_junit(
+            os.path.join(system_context.meta_directory, "test-results.xml"),
+            system_context.system_name,
+            results,
+        )
+        _write_json(
+            os.path.join(system_context.meta_directory, "test-results.json"),
+            system_context.system_name,
+            results,
+        )
+
+        failed = [r for r in results if not r.passed]
+        for r in results:
+            test_name = f'{system_context.system_name}::Test "{r.name}"'
+            if r.passed:
+                success(f"{test_name} ({r.duration:.2f}s)", verbosity=3)
+                continue
+
+            report_completed_process(
+                msg,
+                subprocess.CompletedProcess(r.args, r.returncode, r.stdout, r.stderr),
+            )
+            if r.returncode is None:
+                fail(f"{test_name} timed out after {r.duration:.2f}s", force_exit=False)
             else:
-                report_completed_process(msg, test_result)
-                fail(f'{system_context.system_name}::Test "{test}"')
+                fail(f"{test_name} ({r.duration:.2f}s)", force_exit=False)
+
+        if failed:
+            fail(f"{len(failed)} of {len(results)} tests failed.")
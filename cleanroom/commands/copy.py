@@ -23,7 +23,7 @@ class CopyCommand(Command):
             "copy",
             syntax="<SOURCE>+ <DEST> [ignore_missing=False] "
             "[from_outside=True] [to_outside=True] "
-            "[recursive=False] [force=False]",
+            "[recursive=False] [force=False] [preserve=False]",
             help_string="Copy a file within the system.",
             file=__file__,
             **services,
@@ -38,7 +38,14 @@ class CopyCommand(Command):
         )
         self._validate_kwargs(
             location,
-            ("from_outside", "to_outside", "ignore_missing", "recursive", "force"),
+            (
+                "from_outside",
+                "to_outside",
+                "ignore_missing",
+                "recursive",
+                "force",
+                "preserve",
+            ),
             **kwargs,
         )
 
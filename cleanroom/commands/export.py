@@ -9,16 +9,65 @@ from cleanroom.binarymanager import Binaries
 from cleanroom.command import Command
 from cleanroom.exceptions import GenerateError, ParseError
 from cleanroom.location import Location
-from cleanroom.helper.file import exists, file_size
+from cleanroom.helper.chunkstore import (
+    COMPRESSIONS as CHUNK_STORE_COMPRESSIONS,
+    ChunkStore,
+    is_chunk_store,
+)
+from cleanroom.helper.archlinux.pacman import installed_packages
+from cleanroom.helper.digest import DIGEST_COMMENT_PREFIX, tree_digest
+from cleanroom.helper.file import exists
+from cleanroom.helper.reflink import clone_file
 from cleanroom.helper.run import run
+from cleanroom.helper.stages import StageGraph
 from cleanroom.systemcontext import SystemContext
 from cleanroom.printer import debug, h2, info, trace, verbose
 
 
+import hashlib
+import json
 import os
 import typing
 
 
+# Arguments and substitutions that change the exported image:
+_DIGEST_KWARGS = (
+    "efi_emulator",
+    "root_fs_type",
+    "root_fs_compression",
+    "root_fs_dedupe",
+    "usr_only",
+)
+# Parts of the system that go into the initrd:
+_INITRD_INPUTS = (
+    "etc/crypttab",
+    "etc/dracut.conf",
+    "etc/dracut.conf.d",
+    "etc/locale.conf",
+    "etc/lvm",
+    "etc/mkinitcpio.conf",
+    "etc/mkinitcpio.d",
+    "etc/modprobe.d",
+    "etc/modules-load.d",
+    "etc/systemd",
+    "etc/udev",
+    "etc/vconsole.conf",
+    "usr/lib/modules",
+)
+# Installed packages also go into the initrd key, by name and version only:
+# The database also holds install dates, which differ for every build.
+_PACMAN_LOCAL_DB = "var/lib/pacman/local"
+_DIGEST_SUBSTITUTIONS = (
+    "CLRM_IMAGE_FILENAME",
+    "INITRD_EXTRA_MODULES",
+    "INITRD_GENERATOR",
+    "KERNEL_CMDLINE",
+    "KERNEL_FILENAME",
+    "ROOTFS_PARTLABEL",
+    "VRTYFS_PARTLABEL",
+)
+
+
 def _setup_kernel_commandline(base_cmdline: str, root_hash: str) -> str:
     cmdline = " ".join(
         (
@@ -59,9 +108,16 @@ class ExportCommand(Command):
             syntax="REPOSITORY "
             "[efi_key=<KEY>] [efi_cert=<CERT>] "
             "[efi_emulator=/path/to/Clover] "
-            "[repository_compression=zstd] "
-            "[repository_compression_level=5] "
+            "[repository_type=(borg|chunkstore)] "
+            "[repository_compression=(zstd|zlib)] "
+            "[repository_compression_level=(5|6)] "
+            "[root_fs_type=(squashfs|erofs)] "
+            "[root_fs_compression=(none|lz4|lz4hc|lzma)] "
+            "[root_fs_dedupe=False] "
+            "[builtin_verity=False] "
             "[skip_validation=False] "
+            "[skip_unchanged=False] "
+            "[retag_unchanged=False] "
             "[usr_only=True]",
             help_string="Export a filesystem image.",
             file=__file__,
@@ -81,9 +137,16 @@ class ExportCommand(Command):
                 "efi_key",
                 "efi_cert",
                 "efi_emulator",
+                "repository_type",
                 "repository_compression",
                 "repository_compression_level",
+                "root_fs_type",
+                "root_fs_compression",
+                "root_fs_dedupe",
+                "builtin_verity",
                 "skip_validation",
+                "skip_unchanged",
+                "retag_unchanged",
                 "usr_only",
             ),
             **kwargs,
@@ -102,13 +165,49 @@ class ExportCommand(Command):
                     location=location,
                 )
 
-        repo_compression = kwargs.get("repository_compression", "zstd")
-        if repo_compression not in ("none", "lz4", "zstd", "zlib", "lzma",):
+        repository_type = kwargs.get("repository_type", "borg")
+        if repository_type not in ("borg", "chunkstore"):
+            raise ParseError(
+                f'"{repository_type}" is not a supported repository type.',
+                location=location,
+            )
+
+        if kwargs.get("retag_unchanged", False) and repository_type != "chunkstore":
+            raise ParseError(
+                "retag_unchanged is only supported for chunkstore repositories.",
+                location=location,
+            )
+
+        repo_compression = kwargs.get(
+            "repository_compression",
+            "zstd" if repository_type == "borg" else "zlib",
+        )
+        supported_compressions = (
+            ("none", "lz4", "zstd", "zlib", "lzma",)
+            if repository_type == "borg"
+            else CHUNK_STORE_COMPRESSIONS
+        )
+        if repo_compression not in supported_compressions:
             raise ParseError(
                 f'"{repo_compression}" is not a supported repository compression format.',
                 location=location,
             )
 
+        root_fs_type = kwargs.get("root_fs_type", "squashfs")
+        if root_fs_type not in ("squashfs", "erofs"):
+            raise ParseError(
+                f'"{root_fs_type}" is not a supported root filesystem type.',
+                location=location,
+            )
+        if root_fs_type != "erofs" and (
+            "root_fs_compression" in kwargs or "root_fs_dedupe" in kwargs
+        ):
+            raise ParseError(
+                "root_fs_compression and root_fs_dedupe are only supported "
+                "for the erofs root_fs_type.",
+                location=location,
+            )
+
         efi_emulator = kwargs.get("efi_emulator", "")
         if efi_emulator:
             if not os.path.isdir(os.path.join(efi_emulator, "EFI")):
@@ -174,9 +273,21 @@ class ExportCommand(Command):
         key = kwargs.get("efi_key", "")
         skip_validation = kwargs.get("skip_validation", False)
         repository = args[0]
-        repository_compression = kwargs.get("repository_compression", "zstd")
-        repository_compression_level = kwargs.get("repository_compression_level", 5)
+        repository_type = kwargs.get("repository_type", "borg")
+        is_borg = repository_type == "borg"
+        repository_compression = kwargs.get(
+            "repository_compression", "zstd" if is_borg else "zlib"
+        )
+        repository_compression_level = kwargs.get(
+            "repository_compression_level", 5 if is_borg else 6
+        )
+        root_fs_type = kwargs.get("root_fs_type", "squashfs")
+        root_fs_compression = kwargs.get("root_fs_compression", "none")
+        root_fs_dedupe = kwargs.get("root_fs_dedupe", False)
+        builtin_verity = kwargs.get("builtin_verity", False)
         usr_only = kwargs.get("usr_only", True)
+        skip_unchanged = kwargs.get("skip_unchanged", False)
+        retag_unchanged = kwargs.get("retag_unchanged", False)
 
         h2(f'Exporting system "{system_context.system_name}".')
         debug("Running Hooks.")
@@ -185,30 +296,13 @@ class ExportCommand(Command):
         verbose("Preparing system for export.")
         self._execute(location.next_line(), system_context, "_write_deploy_info")
 
-        # Create some extra data:
-        self._create_root_tarball(location, system_context)
-
-        root_partition = self._create_root_fsimage(
-            location, system_context, usr_only=usr_only
-        )
-        assert root_partition
-        (verity_partition, root_hash) = self._create_rootverity_fsimage(
-            location, system_context, rootfs=root_partition,
-        )
-        assert root_hash
+        info("Validating installation for export.")
+        if not skip_validation:
+            _validate_installation(location.next_line(), system_context)
 
         has_kernel = os.path.exists(
             os.path.join(system_context.boot_directory, "vmlinuz")
         )
-        if has_kernel:
-            self._create_clrm_config_initrd(location, system_context, root_hash)
-            self._create_initrd(location, system_context)
-
-        cmdline = system_context.set_or_append_substitution(
-            "KERNEL_CMDLINE", "systemd.volatile=true rootfstype=squashfs"
-        )
-        cmdline = _setup_kernel_commandline(cmdline, root_hash)
-
         kernel_file = ""
         if has_kernel:
             trace(
@@ -218,45 +312,214 @@ class ExportCommand(Command):
                 system_context.boot_directory,
                 system_context.substitution_expanded("KERNEL_FILENAME", ""),
             )
-
             assert kernel_file
+
+        export_repository = os.path.join(
+            system_context.repository_base_directory, repository
+        )
+        digest = self._export_digest(system_context, **kwargs)
+        debug(f"Export digest: {digest}.")
+        if skip_unchanged:
+            previous = self._previous_export(
+                system_context, export_repository, repository_type
+            )
+            if previous and previous[1] == digest:
+                info(
+                    f'System is unchanged since export "{previous[0]}", nothing to export.'
+                )
+                if retag_unchanged:
+                    self._retag_export(system_context, export_repository, previous[0])
+                return
+
+        fs_snapshot = os.path.join(system_context.cache_directory, "export_fs")
+
+        # The root filesystem image is created from a snapshot of the system,
+        # so that initrd generation can modify the system at the same time.
+        def root_tarball_stage() -> typing.Mapping[str, typing.Any]:
+            self._create_root_tarball(
+                location.create_child(description="Create root tarball"),
+                system_context,
+            )
+            self._service("btrfs_helper").create_snapshot(
+                system_context.fs_directory, fs_snapshot, read_only=True
+            )
+            return {"fs_snapshot": fs_snapshot}
+
+        def root_fsimage_stage(fs_snapshot: str) -> typing.Mapping[str, typing.Any]:
+            root_partition = self._create_root_fsimage(
+                location.create_child(description="Create root filesystem image"),
+                system_context,
+                source_directory=fs_snapshot,
+                usr_only=usr_only,
+                root_fs_type=root_fs_type,
+                compression=root_fs_compression,
+                dedupe=root_fs_dedupe,
+            )
+            assert root_partition
+            return {"root_partition": root_partition}
+
+        def verity_stage(root_partition: str) -> typing.Mapping[str, typing.Any]:
+            (verity_partition, root_hash) = self._create_rootverity_fsimage(
+                location.create_child(description="Create dm-verity image"),
+                system_context,
+                rootfs=root_partition,
+                builtin=builtin_verity,
+            )
+            assert root_hash
+            return {"verity_partition": verity_partition, "root_hash": root_hash}
+
+        def clrm_config_initrd_stage(
+            fs_snapshot: str,
+        ) -> typing.Mapping[str, typing.Any]:
+            return {
+                "clrm_config_initrd": self._create_clrm_config_initrd(
+                    location.create_child(description="Create clrm config initrd"),
+                    system_context,
+                    root_fs_type=root_fs_type,
+                )
+            }
+
+        def clrm_verity_initrd_stage(root_hash: str) -> typing.Mapping[str, typing.Any]:
+            return {
+                "clrm_verity_initrd": self._create_clrm_verity_initrd(
+                    location.create_child(description="Create clrm verity initrd"),
+                    system_context,
+                    root_hash,
+                )
+            }
+
+        def initrd_stage(
+            fs_snapshot: str, clrm_config_initrd: str
+        ) -> typing.Mapping[str, typing.Any]:
+            return {
+                "initrd": self._create_initrd(
+                    location.create_child(description="Create initrd"),
+                    system_context,
+                )
+            }
+
+        def efi_kernel_stage(
+            root_hash: str, **initrd_parts: str
+        ) -> typing.Mapping[str, typing.Any]:
+            cmdline = system_context.set_or_append_substitution(
+                "KERNEL_CMDLINE", f"systemd.volatile=true rootfstype={root_fs_type}"
+            )
+            cmdline = _setup_kernel_commandline(cmdline, root_hash)
+
             self._create_complete_kernel(
-                location,
+                location.create_child(description="Create EFI kernel"),
                 system_context,
                 cmdline,
                 kernel_file=kernel_file,
                 efi_key=key,
                 efi_cert=cert,
             )
+            return {"kernel_file": kernel_file}
 
-        efi_partition = os.path.join(
-            system_context.cache_directory, "efi_partition.img"
+        def efi_partition_stage(
+            kernel_file: str, root_hash: str
+        ) -> typing.Mapping[str, typing.Any]:
+            efi_partition = os.path.join(
+                system_context.cache_directory, "efi_partition.img"
+            )
+            self._create_efi_partition(
+                location.create_child(description="Create EFI partition"),
+                system_context,
+                efi_partition=efi_partition,
+                kernel_file=kernel_file,
+                efi_emulator=efi_emulator,
+                root_hash=root_hash,
+            )
+            return {"efi_partition": efi_partition}
+
+        def image_stage(
+            efi_partition: str,
+            root_partition: str,
+            verity_partition: str,
+            root_hash: str,
+        ) -> typing.Mapping[str, typing.Any]:
+            export_directory = self.create_export_directory(system_context)
+            assert export_directory
+            self.create_image(
+                location.create_child(description="Create export image"),
+                system_context,
+                export_directory,
+                efi_partition=efi_partition,
+                root_partition=root_partition,
+                verity_partition=verity_partition,
+                root_hash=root_hash,
+            )
+            return {"export_directory": export_directory}
+
+        graph = StageGraph() if has_kernel else StageGraph(kernel_file="")
+        graph.add_stage("root_tarball", root_tarball_stage, outputs=("fs_snapshot",))
+        graph.add_stage(
+            "root_fsimage",
+            root_fsimage_stage,
+            inputs=("fs_snapshot",),
+            outputs=("root_partition",),
         )
-
-        self._create_efi_partition(
-            location,
-            system_context,
-            efi_partition=efi_partition,
-            kernel_file=kernel_file,
-            efi_emulator=efi_emulator,
-            root_hash=root_hash,
+        graph.add_stage(
+            "verity",
+            verity_stage,
+            inputs=("root_partition",),
+            outputs=("verity_partition", "root_hash"),
+        )
+        if has_kernel:
+            graph.add_stage(
+                "clrm_config_initrd",
+                clrm_config_initrd_stage,
+                inputs=("fs_snapshot",),
+                outputs=("clrm_config_initrd",),
+            )
+            graph.add_stage(
+                "clrm_verity_initrd",
+                clrm_verity_initrd_stage,
+                inputs=("root_hash",),
+                outputs=("clrm_verity_initrd",),
+            )
+            # initrd generation reads INITRD_EXTRA_MODULES as extended
+            # by the clrm config initrd:
+            graph.add_stage(
+                "initrd",
+                initrd_stage,
+                inputs=("fs_snapshot", "clrm_config_initrd"),
+                outputs=("initrd",),
+            )
+            graph.add_stage(
+                "efi_kernel",
+                efi_kernel_stage,
+                inputs=(
+                    "root_hash",
+                    "initrd",
+                    "clrm_config_initrd",
+                    "clrm_verity_initrd",
+                ),
+                outputs=("kernel_file",),
+            )
+        graph.add_stage(
+            "efi_partition",
+            efi_partition_stage,
+            inputs=("kernel_file", "root_hash"),
+            outputs=("efi_partition",),
+        )
+        graph.add_stage(
+            "image",
+            image_stage,
+            inputs=("efi_partition", "root_partition", "verity_partition", "root_hash"),
+            outputs=("export_directory",),
         )
 
-        info("Validating installation for export.")
-        if not skip_validation:
-            _validate_installation(location.next_line(), system_context)
+        try:
+            export_directory = graph.run()["export_directory"]
+        finally:
+            if os.path.isdir(fs_snapshot):
+                self._service("btrfs_helper").delete_subvolume(fs_snapshot)
 
-        export_directory = self.create_export_directory(system_context)
-        assert export_directory
-        self.create_image(
-            location,
-            system_context,
-            export_directory,
-            efi_partition=efi_partition,
-            root_partition=root_partition,
-            verity_partition=verity_partition,
-            root_hash=root_hash,
-        )
+        for (stage, duration) in sorted(
+            graph.timings.items(), key=lambda t: t[1], reverse=True
+        ):
+            info(f'Export stage "{stage}" took {duration:.2f}s.')
 
         system_context.set_substitution("EXPORT_DIRECTORY", export_directory)
 
@@ -269,6 +532,8 @@ class ExportCommand(Command):
             compression=repository_compression,
             compression_level=repository_compression_level,
             repository=repository,
+            repository_type=repository_type,
+            digest=digest,
         )
 
         info("Cleaning up export location.")
@@ -281,7 +546,7 @@ class ExportCommand(Command):
         tarball = "usr/lib/boot/root-fs.tar"
         os.makedirs(system_context.file_name("/usr/lib/boot"))
 
-        if exists(system_context, tarball):
+        if exists(system_context, "/" + tarball):
             raise GenerateError(
                 f'"{self.name}": Root tarball "{tarball}" already exists.',
                 location=location,
@@ -357,25 +622,51 @@ class ExportCommand(Command):
         )
 
     def _create_root_fsimage(
-        self, location: Location, system_context: SystemContext, *, usr_only: bool
+        self,
+        location: Location,
+        system_context: SystemContext,
+        *,
+        source_directory: str,
+        usr_only: bool,
+        root_fs_type: str,
+        compression: str,
+        dedupe: bool,
     ) -> str:
         rootfs_label = system_context.substitution_expanded("ROOTFS_PARTLABEL", "")
         if not rootfs_label:
             raise GenerateError("ROOTFS_PARTLABEL is unset.")
-        squashfs_file = os.path.join(system_context.cache_directory, rootfs_label,)
+        rootfs_file = os.path.join(system_context.cache_directory, rootfs_label,)
 
-        self._execute(
-            location,
-            system_context,
-            "_create_root_fsimage",
-            squashfs_file,
-            usr_only=usr_only,
-        )
+        if root_fs_type == "erofs":
+            self._execute(
+                location,
+                system_context,
+                "_create_root_erofs_image",
+                rootfs_file,
+                usr_only=usr_only,
+                compression=compression,
+                dedupe=dedupe,
+                source_directory=source_directory,
+            )
+        else:
+            self._execute(
+                location,
+                system_context,
+                "_create_root_fsimage",
+                rootfs_file,
+                usr_only=usr_only,
+                source_directory=source_directory,
+            )
 
-        return squashfs_file
+        return rootfs_file
 
     def _create_rootverity_fsimage(
-        self, location: Location, system_context: SystemContext, *, rootfs: str
+        self,
+        location: Location,
+        system_context: SystemContext,
+        *,
+        rootfs: str,
+        builtin: bool = False,
     ) -> typing.Tuple[str, str]:
         vrty_label = system_context.substitution_expanded("VRTYFS_PARTLABEL", "")
         if not vrty_label:
@@ -388,6 +679,7 @@ class ExportCommand(Command):
             "_create_dmverity_fsimage",
             verity_file,
             base_image=rootfs,
+            builtin=builtin,
         )
         root_hash = system_context.substitution("LAST_DMVERITY_ROOTHASH", "")
         assert root_hash
@@ -424,20 +716,9 @@ class ExportCommand(Command):
         assert root_partition
         assert verity_partition
 
-        total_size = (
-            (2 * 1024 * 1024)
-            + file_size(None, efi_partition)
-            + file_size(None, root_partition)
-            + file_size(None, verity_partition)
-        )
-
         root_uuid = _uuid_ify(root_hash[:32]) if root_hash else ""
         verity_uuid = _uuid_ify(root_hash[32:]) if root_hash else ""
 
-        with open(image_filename, "wb") as fd:
-            fd.seek(total_size - 1)
-            fd.write(b"\b")
-
         self._execute(
             location,
             system_context,
@@ -477,7 +758,7 @@ class ExportCommand(Command):
             commandline=cmdline,
         )
 
-    def _create_initrd(self, location: Location, system_context: SystemContext):
+    def _create_initrd(self, location: Location, system_context: SystemContext) -> str:
         location.set_description("Create initrd")
         initrd_parts = os.path.join(system_context.boot_directory, "initrd-parts")
         os.makedirs(initrd_parts, exist_ok=True)
@@ -487,36 +768,194 @@ class ExportCommand(Command):
         )
         assert initrd_generator
 
+        initrd = os.path.join(initrd_parts, f"50-{initrd_generator}")
+
+        cache_file = self._initrd_cache_file(system_context, initrd_generator)
+        if cache_file and os.path.isfile(cache_file):
+            info(f'Reusing cached initrd "{os.path.basename(cache_file)}".')
+            clone_file(cache_file, initrd)
+            return initrd
+
         self._execute(
             location.next_line(),
             system_context,
             f"_create_initrd_{initrd_generator}",
-            os.path.join(initrd_parts, f"50-{initrd_generator}"),
+            initrd,
+        )
+
+        assert os.path.exists(initrd)
+
+        if cache_file:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            clone_file(initrd, f"{cache_file}.tmp")
+            os.rename(f"{cache_file}.tmp", cache_file)
+            debug(f'Stored initrd in cache as "{os.path.basename(cache_file)}".')
+
+        return initrd
+
+    def _initrd_cache_file(
+        self, system_context: SystemContext, initrd_generator: str
+    ) -> str:
+        """Cache file for an initrd generated from the current system.
+
+        The key covers the kernel, its modules, the installed packages (by name
+        and version), the configuration the generators read and the generator
+        itself. Systems sharing all of these share their initrd.
+        """
+        if not system_context.shared_cache_directory:
+            return ""
+
+        generator = self._service("command_manager").command(
+            f"_create_initrd_{initrd_generator}"
         )
+        if generator is None:
+            return ""
 
-        assert os.path.exists(
-            os.path.join(
-                system_context.boot_directory, f"initrd-parts/50-{initrd_generator}"
+        extra = [
+            f"generator={initrd_generator}",
+            "INITRD_EXTRA_MODULES="
+            + system_context.substitution_expanded("INITRD_EXTRA_MODULES", ""),
+        ]
+        extra += [
+            f"package={name}={version}"
+            for (name, version) in installed_packages(
+                os.path.join(system_context.fs_directory, _PACMAN_LOCAL_DB)
             )
+        ]
+        key = tree_digest(
+            generator.file_name,
+            os.path.join(system_context.boot_directory, "vmlinuz"),
+            *[os.path.join(system_context.fs_directory, p) for p in _INITRD_INPUTS],
+            extra=extra,
+        )
+        return os.path.join(
+            system_context.shared_cache_directory, "initrd", f"{initrd_generator}-{key}"
         )
 
     def _create_clrm_config_initrd(
-        self, location: Location, system_context: SystemContext, root_hash:str,
-    ):
+        self, location: Location, system_context: SystemContext, *, root_fs_type: str,
+    ) -> str:
         location.set_description("Create clrm config initrd")
         initrd_parts = os.path.join(system_context.boot_directory, "initrd-parts")
         os.makedirs(initrd_parts, exist_ok=True)
+        initrd = os.path.join(initrd_parts, "99-clrm")
         self._execute(
             location.next_line(),
             system_context,
             "_create_clrm_config_initrd",
-            os.path.join(initrd_parts, "99-clrm"),
+            initrd,
+            root_fs_type=root_fs_type,
+            part="config",
+        )
+
+        assert os.path.exists(initrd)
+        return initrd
+
+    def _create_clrm_verity_initrd(
+        self, location: Location, system_context: SystemContext, root_hash: str,
+    ) -> str:
+        location.set_description("Create clrm verity initrd")
+        initrd_parts = os.path.join(system_context.boot_directory, "initrd-parts")
+        os.makedirs(initrd_parts, exist_ok=True)
+        initrd = os.path.join(initrd_parts, "98-clrm-verity")
+        self._execute(
+            location.next_line(),
+            system_context,
+            "_create_clrm_config_initrd",
+            initrd,
             root_hash=root_hash,
+            part="verity",
         )
 
-        assert os.path.exists(
-            os.path.join(system_context.boot_directory, "initrd-parts/99-clrm")
+        assert os.path.exists(initrd)
+        return initrd
+
+    def _export_digest(
+        self, system_context: SystemContext, **kwargs: typing.Any
+    ) -> str:
+        """Digest of everything that goes into the exported image."""
+        extra = [
+            f"{k}={kwargs[k]}" for k in sorted(kwargs.keys()) if k in _DIGEST_KWARGS
+        ]
+        extra += [
+            f"{s}={system_context.substitution_expanded(s, '')}"
+            for s in _DIGEST_SUBSTITUTIONS
+        ]
+        for k in ("efi_key", "efi_cert"):
+            if kwargs.get(k, ""):
+                with open(kwargs[k], "rb") as f:
+                    extra.append(f"{k}:{hashlib.sha256(f.read()).hexdigest()}")
+
+        directories = [system_context.fs_directory, system_context.boot_directory]
+        if kwargs.get("efi_emulator", ""):
+            directories.append(kwargs["efi_emulator"])
+
+        # The timestamp ends up in os-release, partition labels, file names
+        # and more. Ignore it, so that unchanged systems keep their digest:
+        return tree_digest(
+            *directories,
+            extra=extra,
+            replacements={system_context.timestamp: "@TIMESTAMP@"},
+        )
+
+    def _previous_export(
+        self, system_context: SystemContext, repository: str, repository_type: str
+    ) -> typing.Optional[typing.Tuple[str, str]]:
+        """Return name and digest of the latest export of the system."""
+
+        def is_export(archive: str) -> bool:
+            # Split like firestarter's ArchiveIndex does: "system-foo" must not
+            # pick up exports of "system-foo-bar".
+            (system_name, _, version) = archive.rpartition("-")
+            return system_name == system_context.system_name and bool(version)
+
+        if repository_type == "chunkstore":
+            if not is_chunk_store(repository):
+                return None
+            store = ChunkStore(repository)
+            archives = [a for a in store.archives() if is_export(a)]
+            return (archives[-1], store.digest(archives[-1])) if archives else None
+
+        if not os.path.isdir(repository):
+            return None
+        env = dict(os.environ)
+        env["BORG_UNKNOWN_UNENCRYPTED_ACCESS_IS_OK"] = "yes"
+        env["BORG_RELOCATED_REPO_ACCESS_IS_OK"] = "yes"
+        borg = self._binary(Binaries.BORG)
+
+        result = run(borg, "list", "--short", repository, returncode=None, env=env)
+        if result.returncode != 0:
+            return None
+        archives = sorted(a for a in result.stdout.split("\n") if is_export(a))
+        if not archives:
+            return None
+
+        result = run(
+            borg,
+            "info",
+            "--json",
+            f"{repository}::{archives[-1]}",
+            returncode=None,
+            env=env,
+        )
+        if result.returncode != 0:
+            return None
+        comment = json.loads(result.stdout)["archives"][0].get("comment", "")
+        digest = (
+            comment[len(DIGEST_COMMENT_PREFIX) :]
+            if comment.startswith(DIGEST_COMMENT_PREFIX)
+            else ""
         )
+        return (archives[-1], digest)
+
+    def _retag_export(
+        self, system_context: SystemContext, repository: str, archive: str
+    ) -> None:
+        # The image file keeps its name: The initrd, partition labels and
+        # os-release inside the image refer to it by the old timestamp.
+        name = system_context.system_name + "-" + system_context.timestamp
+        ChunkStore(repository).retag_archive(archive, name)
+        info(f'Retagged export "{archive}" as "{name}".')
 
     def _run_all_exportcommand_hooks(self, system_context: SystemContext) -> None:
         self._run_hooks(system_context, "_teardown")
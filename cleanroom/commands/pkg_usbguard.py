@@ -7,6 +7,7 @@
 
 from cleanroom.command import Command
 from cleanroom.helper.file import create_file, makedirs, remove, move
+from cleanroom.helper.sed import batch
 from cleanroom.location import Location
 from cleanroom.systemcontext import SystemContext
 
@@ -61,27 +62,29 @@ class PkgAvahiCommand(Command):
             ).encode("utf-8"),
         )
 
-        self._execute(
-            location.next_line(),
-            system_context,
-            "sed",
-            "/RuleFile=\\/etc/ cRuleFile=/var/etc/usbguard/rules.conf",
-            "/etc/usbguard/usbguard-daemon.conf",
-        )
-        self._execute(
-            location.next_line(),
-            system_context,
-            "sed",
-            "/IPCAccessControlFiles=\\/etc/ cIPCAccessControlFiles=/var/etc/usbguard/IPCAccessControl.d",
-            "/etc/usbguard/usbguard-daemon.conf",
-        )
-        self._execute(
-            location.next_line(),
-            system_context,
-            "sed",
-            "/ImplicitPolicyTarget=/ cImplicitPolicyTarget=allow",
-            "/etc/usbguard/usbguard-daemon.conf",
-        )
+        # Edit the configuration file once for all changes:
+        with batch(system_context.fs_directory):
+            self._execute(
+                location.next_line(),
+                system_context,
+                "sed",
+                "/RuleFile=\\/etc/ cRuleFile=/var/etc/usbguard/rules.conf",
+                "/etc/usbguard/usbguard-daemon.conf",
+            )
+            self._execute(
+                location.next_line(),
+                system_context,
+                "sed",
+                "/IPCAccessControlFiles=\\/etc/ cIPCAccessControlFiles=/var/etc/usbguard/IPCAccessControl.d",
+                "/etc/usbguard/usbguard-daemon.conf",
+            )
+            self._execute(
+                location.next_line(),
+                system_context,
+                "sed",
+                "/ImplicitPolicyTarget=/ cImplicitPolicyTarget=allow",
+                "/etc/usbguard/usbguard-daemon.conf",
+            )
 
         makedirs(
             system_context, "/usr/share/factory/var/etc/usbguard/IPCaccessControl.d"
@@ -6,7 +6,7 @@
 
 
 from cleanroom.command import Command
-from cleanroom.helper.run import run
+from cleanroom.helper.sed import sed
 from cleanroom.location import Location
 from cleanroom.systemcontext import SystemContext
 
@@ -42,4 +42,8 @@ class SedCommand(Command):
         **kwargs: typing.Any
     ) -> None:
         """Execute command."""
-        run("/usr/bin/sed", "-i", "-e", args[0], system_context.file_name(args[1]))
+        sed(
+            args[0],
+            system_context.file_name(args[1]),
+            root_directory=system_context.fs_directory,
+        )
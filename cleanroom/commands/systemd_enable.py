@@ -5,7 +5,6 @@
 """
 
 
-from cleanroom.binarymanager import Binaries
 from cleanroom.command import Command
 from cleanroom.helper.systemd import systemd_enable
 from cleanroom.location import Location
@@ -44,9 +43,4 @@ class SystemdEnableCommand(Command):
         **kwargs: typing.Any
     ) -> None:
         """Execute command."""
-        systemd_enable(
-            system_context,
-            *args,
-            systemctl_command=self._binary(Binaries.SYSTEMCTL),
-            **kwargs
-        )
+        systemd_enable(system_context, *args, location=location, **kwargs)
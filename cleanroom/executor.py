@@ -7,13 +7,22 @@
 
 from .commandmanager import CommandManager
 from .execobject import ExecObject
+from .helper import accounts, sed
 from .printer import success
 from .systemcontext import SystemContext
 
+from contextlib import ExitStack
 import os
 import typing
 
 
+# Consecutive commands sharing a batch write their changes in one go:
+_BATCHES: typing.Dict[str, typing.Callable[[str], typing.ContextManager]] = {
+    **{c: accounts.transaction for c in accounts.COMMANDS},
+    "sed": sed.batch,
+}
+
+
 class Executor:
     """Run a list of ExecObjects on a system."""
 
@@ -21,6 +30,7 @@ class Executor:
         self,
         *,
         scratch_directory: str,
+        shared_cache_directory: str = "",
         systems_definition_directory: str,
         command_manager: CommandManager,
         repository_base_directory: str,
@@ -30,6 +40,7 @@ class Executor:
         assert systems_definition_directory
 
         self._scratch_directory = scratch_directory
+        self._shared_cache_directory = shared_cache_directory
         self._systems_definition_directory = systems_definition_directory
         self._command_manager = command_manager
         self._timestamp = timestamp
@@ -47,6 +58,7 @@ class Executor:
             system_name=system_name,
             base_system_name=base_system_name or "",
             scratch_directory=self._scratch_directory,
+            shared_cache_directory=self._shared_cache_directory,
             systems_definition_directory=self._systems_definition_directory,
             storage_directory=storage_directory,
             repository_base_directory=self._repository_base_directory,
@@ -54,11 +66,25 @@ class Executor:
         ) as system_context:
             self._command_manager.setup_substitutions(system_context)
 
-            for exec_obj in exec_obj_list:
-                os.chdir(system_context.systems_definition_directory)
-                command = self._command_manager.command(exec_obj.command)
-                assert command
-                command.execute_func(
-                    exec_obj.location, system_context, exec_obj.args, exec_obj.kwargs
-                )
+            with ExitStack() as batch:
+                current_batch = None
+                for exec_obj in exec_obj_list:
+                    next_batch = _BATCHES.get(exec_obj.command)
+                    if next_batch is not current_batch:
+                        batch.close()
+                        if next_batch is not None:
+                            batch.enter_context(
+                                next_batch(system_context.fs_directory)
+                            )
+                        current_batch = next_batch
+
+                    os.chdir(system_context.systems_definition_directory)
+                    command = self._command_manager.command(exec_obj.command)
+                    assert command
+                    command.execute_func(
+                        exec_obj.location,
+                        system_context,
+                        exec_obj.args,
+                        exec_obj.kwargs,
+                    )
         success(f"System {system_name} created successfully.")
@@ -9,18 +9,23 @@
 from cleanroom.firestarter.installtarget import InstallTarget
 import cleanroom.firestarter.tools as tool
 from cleanroom.helper.btrfs import BtrfsHelper
+from cleanroom.helper.reflink import sync_tree
+from cleanroom.printer import verbose
 
 import os
 import typing
 
 
-def _extract_into_snapshot(_, rootfs: str, *, import_snapshot: str) -> int:
-    # Extract data
-    return tool.run(
-        "/usr/bin/bash",
-        "-c",
-        f'( cd "{rootfs}" ; tar -cf - . ) | ( cd "{import_snapshot}" ; tar -xf - )',
-    ).returncode
+def _sync_into_snapshot(
+    _, rootfs: str, *, import_snapshot: str, compare_contents: bool
+) -> int:
+    # Only changed files get written, the rest stays shared with the
+    # snapshot of the previous container version (if any).
+    methods = sync_tree(
+        rootfs, import_snapshot, preserve=True, compare_contents=compare_contents
+    )
+    verbose(f'Updated "{import_snapshot}": {methods}.')
+    return 0
 
 
 class ContainerFilesystemInstallTarget(InstallTarget):
@@ -40,13 +45,25 @@ class ContainerFilesystemInstallTarget(InstallTarget):
         container_dir = os.path.join(parse_result.machines_dir, container_name)
         import_dir = container_dir + "_import"
 
+        btrfs = BtrfsHelper("/usr/bin/btrfs")
+        if btrfs.is_subvolume(import_dir):  # Left over from a failed run
+            btrfs.delete_subvolume(import_dir)
+
         try:
-            btrfs = BtrfsHelper("/usr/bin/btrfs")
-            btrfs.create_subvolume(import_dir)
+            if not parse_result.full_import and btrfs.is_subvolume(container_dir):
+                verbose(f'Updating from previous version in "{container_dir}".')
+                btrfs.create_snapshot(container_dir, import_dir)
+            else:
+                btrfs.create_subvolume(import_dir)
 
-            # Mount filessystems and copy the rootfs into import_dir:
+            # Mount filessystems and sync the rootfs into import_dir:
             result = tool.execute_with_system_mounted(
-                lambda e, r: _extract_into_snapshot(e, r, import_snapshot=import_dir),
+                lambda e, r: _sync_into_snapshot(
+                    e,
+                    r,
+                    import_snapshot=import_dir,
+                    compare_contents=parse_result.compare_contents,
+                ),
                 image_file=image_file,
                 tmp_dir=tmp_dir,
             )
@@ -87,3 +104,19 @@ class ContainerFilesystemInstallTarget(InstallTarget):
             default=False,
             help="Make final snapshot read/write [default is read-only].",
         )
+        subparser.add_argument(
+            "--full-import",
+            dest="full_import",
+            action="store_true",
+            default=False,
+            help="Import into an empty subvolume instead of updating a snapshot "
+            "of the existing container.",
+        )
+        subparser.add_argument(
+            "--compare-contents",
+            dest="compare_contents",
+            action="store_true",
+            default=False,
+            help="Compare file contents when updating, not just size, mode and "
+            "modification time.",
+        )
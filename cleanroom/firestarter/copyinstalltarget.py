@@ -7,25 +7,70 @@
 
 
 from cleanroom.firestarter.installtarget import InstallTarget
+from cleanroom.helper.blockcopy import (
+    copy_blocks_to_all,
+    copy_stream_to_all,
+    report_progress,
+)
 
-from shutil import copy
+import os
 import typing
 
 
+def _destinations(targets: typing.List[str], image_name: str) -> typing.List[str]:
+    return [os.path.join(t, image_name) if os.path.isdir(t) else t for t in targets]
+
+
 class CopyInstallTarget(InstallTarget):
     def __init__(self) -> None:
-        super().__init__("copy", "copy the image to a directory, device or file")
+        super().__init__(
+            "copy",
+            "copy the image to directories, devices, files or stdout (-)",
+            streaming=True,
+        )
 
     def setup_subparser(self, subparser: typing.Any) -> None:
         subparser.add_argument(
-            dest="target", action="store", help="The target to copy into.",
+            dest="targets",
+            metavar="<TARGET>",
+            nargs="+",
+            help="The targets to copy into. The image is read once and written "
+            'to all targets at the same time. "-" writes to stdout, all log '
+            "output goes to stderr then.",
+        )
+        subparser.add_argument(
+            "--no-verify",
+            action="store_false",
+            dest="verify",
+            help="Do not read back and verify the copied image.",
         )
 
+    def writes_to_stdout(self, parse_result: typing.Any) -> bool:
+        return "-" in parse_result.targets
+
     def __call__(
         self, *, parse_result: typing.Any, tmp_dir: str, image_file: str
     ) -> int:
-        assert parse_result.target
-
-        copy(image_file, parse_result.target)
+        (_, errors) = copy_blocks_to_all(
+            image_file,
+            _destinations(parse_result.targets, os.path.basename(image_file)),
+            verify=parse_result.verify,
+            progress=report_progress,
+        )
+        return 1 if errors else 0
 
-        return 0
+    def install_stream(
+        self,
+        *,
+        parse_result: typing.Any,
+        tmp_dir: str,
+        image_name: str,
+        image: typing.BinaryIO,
+    ) -> int:
+        (_, errors) = copy_stream_to_all(
+            image,
+            _destinations(parse_result.targets, image_name),
+            verify=parse_result.verify,
+            progress=report_progress,
+        )
+        return 1 if errors else 0
@@ -9,10 +9,11 @@
 from cleanroom.firestarter.installtarget import InstallTarget
 import cleanroom.firestarter.tools as tool
 import cleanroom.helper.mount as mount
+from cleanroom.helper.blockcopy import copy_blocks
+from cleanroom.helper.reflink import copy_tree
 from cleanroom.printer import debug, trace
 
 import os
-from shutil import copy2, copytree
 from sys import exit
 import typing
 
@@ -22,7 +23,7 @@ def _copy_file(src: str, dest: str, overwrite: bool):
     if not os.path.exists(os.path.join(dest, file)) or overwrite:
         marker = " [FORCE]" if overwrite else ""
         debug(f"Copying {src} into {dest}{marker}.")
-        copy2(src, dest)
+        copy_blocks(src, os.path.join(dest, file))
     else:
         debug(f"Skipped copy of {src} into {dest}.")
 
@@ -63,13 +64,9 @@ def _copy_efi(
             ]
             for d in dirs:
                 trace(f"Copying {os.path.join(efi_src_path, d)} to {efi_path}")
-                copytree(os.path.join(efi_src_path, d), efi_path, dirs_exist_ok=True)
+                copy_tree(os.path.join(efi_src_path, d), efi_path)
 
-            copytree(
-                os.path.join(src, "loader"),
-                os.path.join(dest, "loader"),
-                dirs_exist_ok=True,
-            )
+            copy_tree(os.path.join(src, "loader"), os.path.join(dest, "loader"))
 
     except Exception as e:
         debug(f"Failed to install EFI: {e}.")
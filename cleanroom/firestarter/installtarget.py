@@ -10,22 +10,44 @@ import typing
 
 
 class InstallTarget(object):
-    def __init__(self, name: str, help_string: str) -> None:
+    def __init__(self, name: str, help_string: str, *, streaming: bool = False) -> None:
         self._name = name
         self._help_string = help_string
+        self._streaming = streaming
 
     def __call__(
         self, *, parse_result: typing.Any, tmp_dir: str, image_file: str
     ) -> int:
         assert False
 
+    def install_stream(
+        self,
+        *,
+        parse_result: typing.Any,
+        tmp_dir: str,
+        image_name: str,
+        image: typing.BinaryIO,
+    ) -> int:
+        """Install from a sequential stream of the image.
+
+        Only called for targets created with streaming=True."""
+        assert False
+
     def setup_subparser(self, subparser: typing.Any) -> None:
         assert False
 
+    def writes_to_stdout(self, parse_result: typing.Any) -> bool:
+        """Does the target write data to stdout with these arguments?"""
+        return False
+
     @property
     def help_string(self) -> str:
         return self._help_string
 
+    @property
+    def streaming(self) -> bool:
+        return self._streaming
+
     @property
     def name(self) -> str:
         return self._name
@@ -16,12 +16,16 @@ from cleanroom.firestarter.imagepartitioninstalltarget import (
 )
 from cleanroom.firestarter.mountinstalltarget import MountInstallTarget
 from cleanroom.firestarter.partitioninstalltarget import PartitionInstallTarget
+from cleanroom.firestarter.qemubenchmarkinstalltarget import (
+    QemuBenchmarkInstallTarget,
+)
 from cleanroom.firestarter.qemuinstalltarget import QemuInstallTarget
 from cleanroom.firestarter.qemuimageinstalltarget import QemuImageInstallTarget
 from cleanroom.firestarter.tarballinstalltarget import TarballInstallTarget
 
 from cleanroom.printer import Printer, trace, debug
-from cleanroom.firestarter.tools import BorgMount
+from cleanroom.firestarter.tools import ArchiveIndex, BorgExtractStream, open_image
+from cleanroom.helper.chunkstore import is_chunk_store
 
 from argparse import ArgumentParser
 import os
@@ -58,12 +62,15 @@ def _parse_commandline(
         dest="system_version",
         default="",
         type=str,
-        help="version of system to install.",
+        help="version of system to install [default: latest].",
     )
 
     subparsers = parser.add_subparsers(
         help="Installation target specifics", dest="subcommand", required=True,
     )
+    subparsers.add_parser(
+        "list", help="List the available versions of the system, latest last"
+    )
     for it in install_targets:
         debug(f'Setting up subparser for "{it.name}" with help "{it.help_string}".')
         it.setup_subparser(subparsers.add_parser(it.name, help=it.help_string))
@@ -71,6 +78,15 @@ def _parse_commandline(
     return parser.parse_args(args[1:])
 
 
+def _list_versions(parse_result: typing.Any) -> int:
+    versions = ArchiveIndex.load(parse_result.repository).versions(
+        parse_result.system_name
+    )
+    for v in versions:
+        print(v)
+    return 0 if versions else 1
+
+
 # Main section:
 
 
@@ -81,41 +97,70 @@ def main(*command_args: str) -> int:
         ImagePartitionInstallTarget(),
         MountInstallTarget(),
         PartitionInstallTarget(),
+        QemuBenchmarkInstallTarget(),
         QemuImageInstallTarget(),
         QemuInstallTarget(),
         TarballInstallTarget(),
     ]
 
+    # Nothing is known about the install target while parsing, so keep stdout
+    # free of log output till then:
+    pr = Printer.instance()
+    pr.set_output(sys.stderr)
     parse_result = _parse_commandline(
         *command_args, install_targets=known_install_targets
     )
 
+    install_target = next(
+        (x for x in known_install_targets if x.name == parse_result.subcommand),
+        None,
+    )
+    # Log output would end up in the data otherwise:
+    if install_target is None or not install_target.writes_to_stdout(parse_result):
+        pr.set_output(None)
+
     # Set up printing:
-    pr = Printer.instance()
     pr.set_verbosity(parse_result.verbose)
     pr.show_verbosity_level()
 
     trace(f"Arguments parsed from command line: {parse_result}.")
 
-    install_target = next(
-        x for x in known_install_targets if x.name == parse_result.subcommand
-    )
+    if parse_result.subcommand == "list":
+        return _list_versions(parse_result)
+
     assert install_target
     debug(f"Install target {install_target.name} found.")
 
     with TemporaryDirectory(prefix=f"fs_{install_target.name}") as tmp_dir:
         trace(f"Using temporary directory: {tmp_dir}.")
 
+        if install_target.streaming and not is_chunk_store(parse_result.repository):
+            with BorgExtractStream(
+                system_name=parse_result.system_name,
+                repository=parse_result.repository,
+                version=parse_result.system_version,
+            ) as (image_name, image):
+                debug(f"Streaming {image_name} into install target.")
+                result = install_target.install_stream(
+                    parse_result=parse_result,
+                    tmp_dir=tmp_dir,
+                    image_name=image_name,
+                    image=image,
+                )
+                debug(f"Install target done: return code: {result}.")
+            trace(f"Done, leaving with return code {result}.")
+            return result
+
         image_dir = os.path.join(tmp_dir, "borg")
         os.makedirs(image_dir)
 
-        with BorgMount(
+        with open_image(
             image_dir,
             system_name=parse_result.system_name,
             repository=parse_result.repository,
             version=parse_result.system_version,
         ) as image_file:
-            trace(f"Mounted borg directory with image file: {image_file}.")
+            trace(f"Image file available as: {image_file}.")
             debug(
                 f"Running install target with parse_args={parse_result}, tmp_dir={tmp_dir} and image_file={image_file}."
             )
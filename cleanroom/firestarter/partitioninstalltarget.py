@@ -84,7 +84,7 @@ def parse_arguments(args: typing.Any) -> typing.List[typing.Tuple[str, str, str]
 
 def create_device(dev: str, format: str) -> disk.Device:
     if os.path.isfile(dev):
-        return disk.NbdDevice(dev, disk_format=format)
+        return disk.attach_image(dev, disk_format=format)
     assert format == "raw"
     return disk.Device(dev)
 
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Firestarter: Boot time benchmark in qemu
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from cleanroom.firestarter.installtarget import InstallTarget
+import cleanroom.firestarter.qemutools as qemu_tool
+
+import typing
+
+
+class QemuBenchmarkInstallTarget(InstallTarget):
+    def __init__(self) -> None:
+        super().__init__(
+            "qemu-benchmark",
+            "Boot image headless in qemu and report boot times (needs the "
+            "image to log to ttyS0)",
+        )
+
+    def __call__(
+        self, *, parse_result: typing.Any, tmp_dir: str, image_file: str
+    ) -> int:
+        return qemu_tool.benchmark_qemu(
+            parse_result,
+            drives=[f"{image_file}:raw:read-only"],
+            work_directory=tmp_dir,
+            report_file=parse_result.report,
+            timeout=parse_result.timeout,
+            grace=parse_result.grace,
+        )
+
+    def setup_subparser(self, subparser: typing.Any) -> None:
+        qemu_tool.setup_parser_for_qemu(subparser)
+        subparser.add_argument(
+            "--report",
+            dest="report",
+            action="store",
+            required=True,
+            help="JSON file to write the boot time report to. The console log "
+            "is stored next to it.",
+        )
+        subparser.add_argument(
+            "--timeout",
+            dest="timeout",
+            action="store",
+            type=float,
+            default=300.0,
+            help="Seconds to wait for multi-user.target [default: 300].",
+        )
+        subparser.add_argument(
+            "--grace",
+            dest="grace",
+            action="store",
+            type=float,
+            default=10.0,
+            help="Seconds to wait for the systemd startup times after "
+            "multi-user.target was reached [default: 10].",
+        )
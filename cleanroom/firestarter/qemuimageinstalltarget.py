@@ -11,11 +11,13 @@ import cleanroom.firestarter.qemutools as qemu_tool
 import cleanroom.firestarter.tools as tool
 import cleanroom.helper.disk as disk
 import cleanroom.helper.mount as mount
+from cleanroom.helper.blockcopy import copy_blocks, report_progress
+from cleanroom.helper.reflink import copy_tree
 from cleanroom.helper.run import run
 from cleanroom.printer import debug, verbose, trace
 
+import fcntl
 import os
-from shutil import copyfile, copytree
 import typing
 
 
@@ -66,15 +68,9 @@ def _copy_efi(src: str, dest: str) -> int:
         for d in dirs:
             dest = os.path.join(efi_path, d)
             trace(f"Copying {os.path.join(efi_src_path, d)} to {dest}")
-            copytree(
-                os.path.join(efi_src_path, d), dest, dirs_exist_ok=True,
-            )
+            copy_tree(os.path.join(efi_src_path, d), dest)
 
-        copytree(
-            os.path.join(src, "loader"),
-            os.path.join(dest, "loader"),
-            dirs_exist_ok=True,
-        )
+        copy_tree(os.path.join(src, "loader"), os.path.join(dest, "loader"))
 
     except Exception as e:
         debug(f"Failed to install EFI: {e}.")
@@ -109,9 +105,10 @@ def create_qemu_image(
             _setup_btrfs(data_dir)
 
             trace("Copying image file")
-            copyfile(
+            copy_blocks(
                 system_image_file,
                 os.path.join(data_dir, ".images", os.path.basename(system_image_file)),
+                progress=report_progress("Copying image file"),
             )
 
             with mount.Mount(
@@ -129,6 +126,53 @@ def create_qemu_image(
     return image_path
 
 
+def create_base_qemu_image(
+    base_directory: str, *, image_size: int, system_image_file: str, tmp_dir: str,
+) -> str:
+    """Return a qcow2 base image of the system, creating it if necessary.
+
+    Base images are named after the system image file and the disk size, so
+    all VMs of one system version share one base image."""
+    system_image_name = os.path.splitext(os.path.basename(system_image_file))[0]
+    base_image = os.path.join(
+        base_directory, f"{system_image_name}_{image_size}.qcow2"
+    )
+    os.makedirs(base_directory, exist_ok=True)
+
+    # Serialize concurrent firestarter runs that need the same base image:
+    with open(base_image + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(base_image):
+            verbose(f'Reusing base image "{base_image}".')
+            return base_image
+
+        verbose(f'Creating base image "{base_image}".')
+        tmp_image = base_image + ".tmp"
+        if os.path.exists(tmp_image):
+            os.unlink(tmp_image)
+        create_qemu_image(
+            tmp_image,
+            image_size=image_size,
+            image_format="qcow2",
+            system_image_file=system_image_file,
+            tmp_dir=tmp_dir,
+        )
+        # Overlays break when their backing file changes:
+        os.chmod(tmp_image, 0o444)
+        os.rename(tmp_image, base_image)
+
+    return base_image
+
+
+def create_qemu_overlay(overlay_path: str, *, base_image: str) -> str:
+    """Create a thin qcow2 image storing all changes made on top of base_image."""
+    trace(f'Creating overlay "{overlay_path}" on top of "{base_image}".')
+    disk.create_image_file(
+        overlay_path, 0, disk_format="qcow2", backing_file=os.path.abspath(base_image)
+    )
+    return overlay_path
+
+
 class QemuImageInstallTarget(InstallTarget):
     def __init__(self) -> None:
         super().__init__("qemu-image", "Set up hdd image and start it in qemu")
@@ -136,17 +180,31 @@ class QemuImageInstallTarget(InstallTarget):
     def __call__(
         self, *, parse_result: typing.Any, tmp_dir: str, image_file: str
     ) -> int:
-        image_path = create_qemu_image(
-            os.path.join(tmp_dir, "hdd.img"),
-            image_size=parse_result.hdd_size,
-            image_format=parse_result.hdd_format,
-            system_image_file=image_file,
-            tmp_dir=tmp_dir,
-        )
+        if parse_result.base_directory:
+            base_image = create_base_qemu_image(
+                parse_result.base_directory,
+                image_size=parse_result.hdd_size,
+                system_image_file=image_file,
+                tmp_dir=tmp_dir,
+            )
+            image_path = create_qemu_overlay(
+                parse_result.overlay or os.path.join(tmp_dir, "hdd.img"),
+                base_image=base_image,
+            )
+            image_format = "qcow2"
+        else:
+            image_path = create_qemu_image(
+                os.path.join(tmp_dir, "hdd.img"),
+                image_size=parse_result.hdd_size,
+                image_format=parse_result.hdd_format,
+                system_image_file=image_file,
+                tmp_dir=tmp_dir,
+            )
+            image_format = parse_result.hdd_format
 
         return qemu_tool.run_qemu(
             parse_result,
-            drives=[f"{image_path}:{parse_result.hdd_format}",],
+            drives=[f"{image_path}:{image_format}",],
             work_directory=tmp_dir,
         )
 
@@ -170,3 +228,20 @@ class QemuImageInstallTarget(InstallTarget):
             default="qcow2",
             help="Format of HDD to generate.",
         )
+
+        subparser.add_argument(
+            "--base-directory",
+            dest="base_directory",
+            action="store",
+            default="",
+            help="Keep one qcow2 base image per system version in this directory "
+            "and boot a thin overlay on top of it.",
+        )
+        subparser.add_argument(
+            "--overlay",
+            dest="overlay",
+            action="store",
+            default="",
+            help="Where to put the overlay image when using --base-directory "
+            "[default: temporary file].",
+        )
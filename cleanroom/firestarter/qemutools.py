@@ -6,11 +6,35 @@
 """
 
 import cleanroom.firestarter.tools as tools
+from cleanroom.helper.reflink import copy_file
+from cleanroom.printer import debug, info, trace
+
+import json
 import os
-from shutil import copyfile
+import re
+import select
+import subprocess
+import time
 import typing
 
 
+# Boot milestones as seen on the serial console, in boot order:
+_MILESTONES = [
+    ("kernel", re.compile(r"Linux version \d")),
+    ("initrd", re.compile(r"Running in initrd|\(Initrd\)")),
+    ("root_mounted", re.compile(r"Reached target .*Initrd Root File System")),
+    ("switch_root", re.compile(r"Switching root\.")),
+    ("multi_user", re.compile(r"Reached target .*Multi-User System")),
+]
+_STARTUP_FINISHED = re.compile(r"Startup finished in (.*) = (.+?)\.?$")
+_STARTUP_PART = re.compile(r"(.+) \((\w+)\)")
+_ANSI = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+_QEMU = "/usr/bin/qemu-system-x86_64"
+# systemd reports the startup times right after reaching multi-user.target:
+_STARTUP_GRACE = 10.0
+
+
 def _append_network(
     hostname: str,
     *,
@@ -82,7 +106,7 @@ def _append_fs(fs: str, *, read_only: bool = False):
 
 def _append_efi(efi_vars: str):
     if not os.path.exists(efi_vars):
-        copyfile("/usr/share/ovmf/x64/OVMF_VARS.fd", efi_vars)
+        copy_file("/usr/share/ovmf/x64/OVMF_VARS.fd", efi_vars)
     return [
         "-drive",
         "if=pflash,format=raw,readonly," "file=/usr/share/ovmf/x64/OVMF_CODE.fd",
@@ -181,12 +205,19 @@ def setup_parser_for_qemu(parser: typing.Any) -> None:
     )
 
 
-def run_qemu(
-    parse_result: typing.Any, *, drives: typing.List[str] = [], work_directory: str
-) -> int:
+def _accelerator() -> typing.List[str]:
+    if os.access("/dev/kvm", os.R_OK | os.W_OK):
+        return ["--enable-kvm"]
+    debug("/dev/kvm is not usable, falling back to TCG.")
+    return ["-accel", "tcg"]
+
+
+def _qemu_arguments(
+    parse_result: typing.Any, *, drives: typing.List[str], work_directory: str
+) -> typing.List[str]:
     qemu_args = [
-        "/usr/bin/qemu-system-x86_64",
-        "--enable-kvm",
+        _QEMU,
+        *_accelerator(),
         "-cpu",
         "Penryn",  # Needed for clover to boot:-/
         "-smp",
@@ -236,6 +267,16 @@ def run_qemu(
     if parse_result.verbatim:
         qemu_args += parse_result.verbatim
 
+    return qemu_args
+
+
+def run_qemu(
+    parse_result: typing.Any, *, drives: typing.List[str] = [], work_directory: str
+) -> int:
+    qemu_args = _qemu_arguments(
+        parse_result, drives=drives, work_directory=work_directory
+    )
+
     run_str = '" "'.join(qemu_args)
     print(f'Running: "{run_str}"')
     result = tools.run(*qemu_args, work_directory=work_directory, check=False)
@@ -246,3 +287,110 @@ def run_qemu(
         print(f"Qemu stderr: {result.stderr}")
 
     return result.returncode
+
+
+def _seconds(duration: str) -> float:
+    """Convert systemd time spans like "1min 2.5s" or "800ms" to seconds."""
+    units = {"us": 0.000001, "ms": 0.001, "s": 1.0, "min": 60.0, "h": 3600.0}
+    return sum(
+        float(value) * units[unit]
+        for (value, unit) in re.findall(r"([\d.]+)(us|ms|min|s|h)", duration)
+    )
+
+
+def parse_boot_log(
+    lines: typing.Iterable[typing.Tuple[float, str]]
+) -> typing.Dict[str, typing.Any]:
+    """Find boot milestones in timestamped console lines."""
+    milestones: typing.Dict[str, typing.Optional[float]] = {
+        name: None for (name, _) in _MILESTONES
+    }
+    startup: typing.Dict[str, float] = {}
+    for (timestamp, line) in lines:
+        line = _ANSI.sub("", line)
+        for (name, pattern) in _MILESTONES:
+            if milestones[name] is None and pattern.search(line):
+                milestones[name] = timestamp
+        match = _STARTUP_FINISHED.search(line)
+        if match and not startup:
+            parts = [_STARTUP_PART.match(p) for p in match.group(1).split(" + ")]
+            startup = {p.group(2): _seconds(p.group(1)) for p in parts if p}
+            startup["total"] = _seconds(match.group(2))
+    return {"milestones": milestones, "systemd_analyze": startup}
+
+
+def benchmark_qemu(
+    parse_result: typing.Any,
+    *,
+    drives: typing.List[str] = [],
+    work_directory: str,
+    report_file: str,
+    timeout: float,
+    grace: float = _STARTUP_GRACE,
+) -> int:
+    """Boot headless, record boot milestones from the serial console.
+
+    The VM is stopped once systemd reported its startup times or grace
+    seconds after multi-user.target was reached, whatever comes first."""
+    qemu_args = _qemu_arguments(
+        parse_result, drives=drives, work_directory=work_directory
+    )
+    qemu_args += ["-display", "none", "-monitor", "none", "-serial", "stdio"]
+
+    console_file = os.path.splitext(report_file)[0] + ".console.log"
+    lines: typing.List[typing.Tuple[float, str]] = []
+
+    trace(f'Running: "{" ".join(qemu_args)}"')
+    start = time.monotonic()
+    process = subprocess.Popen(
+        qemu_args,
+        cwd=work_directory,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    assert process.stdout
+    pending = b""
+    reached = False
+    finished = False
+    deadline = timeout
+    try:
+        while not (reached and finished):
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            if not select.select([process.stdout], [], [], min(remaining, 1.0))[0]:
+                continue
+            data = os.read(process.stdout.fileno(), 65536)
+            if not data:
+                break  # qemu exited
+            now = time.monotonic() - start
+            pending += data
+            *complete, pending = pending.split(b"\n")
+            for line in complete:
+                text = line.decode("utf-8", "replace").rstrip("\r")
+                lines.append((now, text))
+                clean = _ANSI.sub("", text)
+                if not reached and _MILESTONES[-1][1].search(clean):
+                    reached = True
+                    deadline = min(deadline, now + grace)
+                if _STARTUP_FINISHED.search(clean):
+                    finished = True
+    finally:
+        process.kill()
+        process.wait()
+
+    with open(console_file, "w", encoding="utf-8") as f:
+        for (timestamp, text) in lines:
+            f.write(f"[{timestamp:10.3f}] {text}\n")
+
+    report = parse_boot_log(lines)
+    report["accelerator"] = "kvm" if "--enable-kvm" in qemu_args else "tcg"
+    report["reached_multi_user"] = reached
+    report["timeout"] = timeout
+    report["console_log"] = console_file
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+
+    info(f'Boot benchmark written to "{report_file}".')
+    return 0 if reached else 1
@@ -7,28 +7,228 @@
 
 
 from cleanroom.firestarter.installtarget import InstallTarget
+from cleanroom.helper.blockcopy import BLOCK_SIZE
+from cleanroom.printer import debug, error, trace, verbose
 import cleanroom.firestarter.tools as tool
 
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
+import subprocess
+import tempfile
 import typing
 
 
-def _tar(efi_fs: str, rootfs: str, *, tarball_name: str, efi_tarball_name: str) -> int:
+_TAR = "/usr/bin/tar"
 
-    # Extract data
+# Compressor binaries and the arguments to compress stdin to stdout with them.
+# {threads} and {level} get filled in before use.
+_COMPRESSORS: typing.Dict[str, typing.Tuple[str, typing.List[str]]] = {
+    "zstd": ("/usr/bin/zstd", ["-T{threads}", "-{level}", "-q", "-c"]),
+    "xz": ("/usr/bin/xz", ["-T{threads}", "-{level}", "-q", "-c"]),
+    "gzip": ("/usr/bin/gzip", ["-{level}", "-n", "-c"]),
+}
+
+_DEFAULT_LEVELS = {"zstd": 3, "xz": 6, "gzip": 6}
+
+_SUFFIXES = {
+    ".zst": "zstd",
+    ".tzst": "zstd",
+    ".xz": "xz",
+    ".txz": "xz",
+    ".gz": "gzip",
+    ".tgz": "gzip",
+}
+
+# Suffixes tar --auto-compress knows, but that have no compressor above:
+_UNSUPPORTED_SUFFIXES = (
+    ".bz2",
+    ".tbz",
+    ".tbz2",
+    ".tz2",
+    ".lz",
+    ".tlz",
+    ".lzma",
+    ".lzo",
+    ".lz4",
+    ".Z",
+    ".taz",
+    ".taZ",
+)
+
+
+def _compression_for(tarball: str, compression: str) -> str:
+    if compression != "auto":
+        return compression
+    for (suffix, compressor) in _SUFFIXES.items():
+        if tarball.endswith(suffix):
+            return compressor
+    for suffix in _UNSUPPORTED_SUFFIXES:
+        if tarball.endswith(suffix):
+            raise ValueError(
+                f'No compressor for "{suffix}" files, use one of '
+                f'{", ".join(sorted(_SUFFIXES.keys()))} or pass --compression.'
+            )
+    return "none"
+
+
+def _tar_command(directory: str) -> typing.List[str]:
+    # Sort entries and drop all data that depends on the machine or time
+    # the tarball is created on, so the same image always produces the same
+    # tarball.
+    return [
+        _TAR,
+        "--create",
+        "--file=-",
+        f"--directory={directory}",
+        "--sort=name",
+        "--numeric-owner",
+        "--format=posix",
+        "--pax-option=exthdr.name=%d/PaxHeaders/%f,delete=atime,delete=ctime",
+        ".",
+    ]
+
+
+def _compressor_command(
+    compression: str, *, level: int, threads: int
+) -> typing.List[str]:
+    (binary, arguments) = _COMPRESSORS[compression]
+    if not level:
+        level = _DEFAULT_LEVELS[compression]
+    return [binary] + [a.format(threads=threads, level=level) for a in arguments]
+
+
+def _write_tarball(
+    directory: str, tarball: str, *, compression: str, level: int, threads: int
+) -> str:
+    """Stream a tarball of directory into tarball and return its SHA256.
+
+    The tarball is written under a temporary name and only renamed into
+    place once tar and the compressor succeeded."""
+    compression = _compression_for(tarball, compression)
+    verbose(f'Creating "{tarball}" from "{directory}" ({compression}).')
+
+    # stderr goes into files: A full stderr pipe would block the pipeline.
+    processes: typing.List[typing.Tuple[subprocess.Popen, typing.IO[bytes]]] = []
+
+    def start(command: typing.List[str], stdin: typing.Any) -> subprocess.Popen:
+        trace('Running: "{}"...'.format('" "'.join(command)))
+        stderr = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            command, stdin=stdin, stdout=subprocess.PIPE, stderr=stderr
+        )
+        processes.append((process, stderr))
+        return process
+
+    tar = start(_tar_command(directory), subprocess.DEVNULL)
+    output = tar.stdout
+    assert output
+
+    if compression != "none":
+        compressor = start(
+            _compressor_command(compression, level=level, threads=threads), output
+        )
+        output.close()  # Only the compressor reads from tar now
+        output = compressor.stdout
+        assert output
+
+    digest = hashlib.sha256()
+    tmp_tarball = f"{tarball}.tmp"
+    try:
+        with open(tmp_tarball, "wb") as f:
+            while True:
+                data = output.read(BLOCK_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+                f.write(data)
+        output.close()
+
+        for (p, stderr) in processes:
+            if p.wait() != 0:
+                stderr.seek(0)
+                raise subprocess.CalledProcessError(
+                    returncode=p.returncode, cmd=p.args, stderr=stderr.read()
+                )
+        os.rename(tmp_tarball, tarball)
+    except BaseException:
+        for (p, _) in processes:
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+        if os.path.exists(tmp_tarball):
+            os.remove(tmp_tarball)
+        raise
+    finally:
+        for (_, stderr) in processes:
+            stderr.close()
+
+    result = digest.hexdigest()
+    debug(f'Created "{tarball}", SHA256: {result}.')
+    return result
+
+
+def _write_checksums(checksum_file: str, checksums: typing.Dict[str, str]) -> None:
+    """Write checksums in the format "sha256sum --check" understands."""
+    directory = os.path.dirname(os.path.abspath(checksum_file))
+    with open(checksum_file, "w") as f:
+        for (tarball, checksum) in sorted(checksums.items()):
+            f.write(f"{checksum}  {os.path.relpath(tarball, directory)}\n")
+
+
+def _tar(
+    efi_fs: str,
+    rootfs: str,
+    *,
+    tarball_name: str,
+    efi_tarball_name: str,
+    compression: str = "auto",
+    level: int = 0,
+    threads: int = 0,
+    checksum_file: str = "",
+) -> int:
+    jobs = [
+        (d, t) for (d, t) in ((efi_fs, efi_tarball_name), (rootfs, tarball_name)) if t
+    ]
+
+    # Fail before creating anything if a compressor is missing:
+    for (_, tarball) in jobs:
+        try:
+            _compression_for(tarball, compression)
+        except ValueError as e:
+            error(f'Can not create "{tarball}": {e}')
+            return 1
+
+    # Both tarballs get created at the same time: Reading is from different
+    # filesystems and the compressors are multi-threaded anyway.
+    checksums: typing.Dict[str, str] = {}
     result = 0
-    if efi_tarball_name:
-        result = tool.run(
-            "/usr/bin/bash",
-            "-c",
-            f'( cd {efi_fs} ; tar -cf "{efi_tarball_name}" --auto-compress .) ',
-        ).returncode
-    if tarball_name:
-        result += tool.run(
-            "/usr/bin/bash",
-            "-c",
-            f'( cd {rootfs} ; tar -cf "{tarball_name}" --auto-compress .) ',
-        ).returncode
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [
+            (
+                tarball,
+                executor.submit(
+                    _write_tarball,
+                    directory,
+                    tarball,
+                    compression=compression,
+                    level=level,
+                    threads=threads,
+                ),
+            )
+            for (directory, tarball) in jobs
+        ]
+        for (tarball, future) in futures:
+            try:
+                checksums[tarball] = future.result()
+            except (OSError, subprocess.CalledProcessError) as e:
+                stderr = getattr(e, "stderr", None)
+                details = f"\n{stderr.decode('utf-8')}" if stderr else ""
+                error(f'Failed to create "{tarball}": {e}{details}')
+                result += 1
+
+    if checksum_file and checksums:
+        _write_checksums(checksum_file, checksums)
 
     return result
 
@@ -52,6 +252,42 @@ class TarballInstallTarget(InstallTarget):
             help="The tarball containing the root filesystem image [Default: empty -- skip].",
         )
 
+        subparser.add_argument(
+            "--compression",
+            action="store",
+            dest="compression",
+            choices=["auto", "none"] + sorted(_COMPRESSORS.keys()),
+            default="auto",
+            help="Compression to use. [Default: auto -- pick by file extension]",
+        )
+
+        subparser.add_argument(
+            "--compression-level",
+            action="store",
+            dest="compression_level",
+            type=int,
+            default=0,
+            help="Compression level. [Default: 0 -- the compressor's default]",
+        )
+
+        subparser.add_argument(
+            "--threads",
+            action="store",
+            dest="threads",
+            type=int,
+            default=0,
+            help="Compression threads per tarball. [Default: 0 -- all CPUs]",
+        )
+
+        subparser.add_argument(
+            "--checksum-file",
+            action="store",
+            dest="checksum_file",
+            default="",
+            help="Write SHA256 checksums of the tarballs to this file. "
+            "[Default: empty -- skip]",
+        )
+
     def __call__(
         self, *, parse_result: typing.Any, tmp_dir: str, image_file: str
     ) -> int:
@@ -67,6 +303,10 @@ class TarballInstallTarget(InstallTarget):
                 r,
                 tarball_name=parse_result.tarball,
                 efi_tarball_name=parse_result.efi_tarball,
+                compression=parse_result.compression,
+                level=parse_result.compression_level,
+                threads=parse_result.threads,
+                checksum_file=parse_result.checksum_file,
             ),
             image_file=image_file,
             tmp_dir=tmp_dir,
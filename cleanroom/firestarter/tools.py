@@ -6,15 +6,25 @@
 """
 
 
+from __future__ import annotations
+
 from cleanroom.printer import trace, verbose, debug
+from cleanroom.helper.blockcopy import BLOCK_SIZE
+from cleanroom.helper.chunkstore import ChunkStore, is_chunk_store
 import cleanroom.helper.disk as disk
 import cleanroom.helper.mount as mount
 
+import bisect
+import hashlib
+import json
 import os
 import subprocess
 import typing
 
 
+_INDEX_VERSION = 1
+
+
 # Library:
 
 
@@ -58,27 +68,108 @@ def run_borg(*args: str, work_directory: str = "") -> subprocess.CompletedProces
     return run("/usr/bin/borg", *args, work_directory=work_directory, env=env)
 
 
+def _archive_names(repository: str) -> typing.List[str]:
+    if is_chunk_store(repository):
+        return ChunkStore(repository).archives()
+
+    borg_list = run_borg("list", "--short", repository)
+    return [line for line in borg_list.stdout.decode("utf-8").split("\n") if line]
+
+
+def _repository_stamp(repository: str) -> str:
+    """Return a string that changes whenever archives are added or removed."""
+    if is_chunk_store(repository):
+        return str(os.stat(os.path.join(repository, "archives")).st_mtime_ns)
+    if os.path.isdir(repository):
+        # Local borg repository: Every transaction writes a new index file.
+        transactions = [
+            int(f[6:])
+            for f in os.listdir(repository)
+            if f.startswith("index.") and f[6:].isdigit()
+        ]
+        if transactions:
+            return f"transaction:{max(transactions)}"
+
+    info = json.loads(run_borg("info", "--json", repository).stdout)
+    return f'{info["repository"]["id"]}:{info["repository"]["last_modified"]}'
+
+
+def _index_file(repository: str) -> str:
+    cache_directory = os.environ.get(
+        "XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")
+    )
+    key = hashlib.sha256(os.path.abspath(repository).encode("utf-8")).hexdigest()
+    return os.path.join(cache_directory, "cleanroom", "firestarter", f"{key}.json")
+
+
+class ArchiveIndex:
+    """Versions of all systems in a repository.
+
+    The index is cached on disk and only rebuilt once the repository
+    changed."""
+
+    def __init__(self, systems: typing.Dict[str, typing.List[str]]) -> None:
+        self._systems = systems
+
+    @staticmethod
+    def load(repository: str) -> ArchiveIndex:
+        stamp = _repository_stamp(repository)
+        index_file = _index_file(repository)
+        try:
+            with open(index_file, "r") as f:
+                data = json.load(f)
+            if data.get("version") == _INDEX_VERSION and data.get("stamp") == stamp:
+                trace(f'Using archive index "{index_file}".')
+                return ArchiveIndex(data["systems"])
+        except (OSError, ValueError):
+            pass
+
+        verbose(f'Indexing archives in "{repository}".')
+        systems: typing.Dict[str, typing.List[str]] = {}
+        for archive in _archive_names(repository):
+            (system_name, _, version) = archive.rpartition("-")
+            if system_name:
+                systems.setdefault(system_name, []).append(version)
+        for versions in systems.values():
+            versions.sort()
+
+        try:
+            os.makedirs(os.path.dirname(index_file), exist_ok=True)
+            with open(index_file + ".tmp", "w") as f:
+                json.dump(
+                    {"version": _INDEX_VERSION, "stamp": stamp, "systems": systems}, f
+                )
+            os.rename(index_file + ".tmp", index_file)
+        except OSError as e:
+            debug(f'Failed to write archive index "{index_file}": {e}.')
+
+        return ArchiveIndex(systems)
+
+    def systems(self) -> typing.List[str]:
+        return sorted(self._systems.keys())
+
+    def versions(self, system_name: str) -> typing.List[str]:
+        """Versions of system_name, oldest first."""
+        return self._systems.get(system_name, [])
+
+    def find(self, system_name: str, version: str = "") -> str:
+        """Return the archive of system_name in version (or the latest one)."""
+        versions = self.versions(system_name)
+        if not versions:
+            return ""
+        if not version or version == "latest":
+            return f"{system_name}-{versions[-1]}"
+        pos = bisect.bisect_left(versions, version)
+        if pos < len(versions) and versions[pos] == version:
+            return f"{system_name}-{version}"
+        return ""
+
+
 def find_archive(
     system_name: str, *, repository: str, version: str = ""
 ) -> typing.Tuple[str, str]:
-    borg_list = run_borg("list", repository)
-
-    archive_to_use = ""
-    for line in borg_list.stdout.decode("utf-8").split("\n"):
-        if not line.startswith(system_name):
-            continue
-        trace(f"Borg list: {line}.")
-        versioned_system_name = line.split(" ")[0]
-        assert versioned_system_name[len(system_name)] == "-"
-        current_version = versioned_system_name[len(system_name) + 1 :]
-        if version:
-            if current_version == version:
-                archive_to_use = versioned_system_name
-                break
-        else:
-            if not archive_to_use or versioned_system_name > archive_to_use:
-                archive_to_use = versioned_system_name
-
+    archive_to_use = ArchiveIndex.load(repository).find(system_name, version)
+    trace(f'Archive for "{system_name}" in version "{version}": {archive_to_use}.')
     return archive_to_use, archive_to_use[len(system_name) + 1 :]
 
 
@@ -87,7 +178,7 @@ def execute_with_system_mounted(
 ) -> int:
     assert os.path.isfile(image_file)
 
-    with disk.NbdDevice(image_file, disk_format="raw", read_only=True) as device:
+    with disk.attach_image(image_file, disk_format="raw", read_only=True) as device:
         verbose("Mounting EFI...")
         device.wait_for_device_node(partition=1)
         with mount.Mount(
@@ -100,7 +191,7 @@ def execute_with_system_mounted(
             with mount.Mount(
                 device.device(2),
                 os.path.join(tmp_dir, "root"),
-                fs_type="squashfs",
+                fs_type="",  # squashfs or erofs: Let mount figure it out
                 options="ro",
             ) as root:
 
@@ -110,6 +201,64 @@ def execute_with_system_mounted(
     return result
 
 
+def _image_file_name(files: typing.Iterable[str]) -> str:
+    """Return the image file of an archive.
+
+    Exports hold exactly one file: The image. Its name does not need to
+    contain the version of the archive (e.g. for retagged archives)."""
+    image_files = list(files)
+    if len(image_files) != 1:
+        raise OSError(f"Expected one image file in archive, got {image_files}.")
+    return image_files[0]
+
+
+class BorgExtractStream:
+    """Stream the image file of a system out of a borg archive.
+
+    Yields the image file name and a pipe producing its contents."""
+
+    def __init__(self, *, repository: str, system_name: str, version: str) -> None:
+        (archive, _) = find_archive(
+            system_name, repository=repository, version=version
+        )
+        if not archive:
+            raise OSError("Failed to find repository or system.")
+
+        self._archive = f"{repository}::{archive}"
+        self._process: typing.Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> typing.Tuple[str, typing.BinaryIO]:
+        paths = run_borg("list", "--format", "{path}{NL}", self._archive)
+        image_file = _image_file_name(
+            p for p in paths.stdout.decode("utf-8").split("\n") if p
+        )
+
+        env = os.environ
+        env["BORG_UNKNOWN_UNENCRYPTED_ACCESS_IS_OK"] = "yes"
+        env["BORG_RELOCATED_REPO_ACCESS_IS_OK"] = "yes"
+        trace(f'Streaming "{image_file}" out of "{self._archive}".')
+        self._process = subprocess.Popen(
+            ["/usr/bin/borg", "extract", "--stdout", self._archive, image_file],
+            env=env,
+            stdout=subprocess.PIPE,
+            bufsize=BLOCK_SIZE,
+        )
+        assert self._process.stdout
+        return (image_file, typing.cast(typing.BinaryIO, self._process.stdout))
+
+    def __exit__(
+        self, exc_type: typing.Any, exc_val: typing.Any, exc_tb: typing.Any
+    ) -> None:
+        assert self._process and self._process.stdout
+        self._process.stdout.close()
+        returncode = self._process.wait()
+        # borg uses 1 for warnings:
+        if exc_type is None and returncode >= 2:
+            raise subprocess.CalledProcessError(
+                returncode=returncode, cmd=self._process.args
+            )
+
+
 class BorgMount:
     def __init__(
         self, mnt_point: str, *, repository: str, system_name: str, version: str,
@@ -117,29 +266,80 @@ class BorgMount:
         if not os.path.isdir(mnt_point):
             raise OSError(f'Mount point "{mnt_point}" is not a directory.')
 
-        (archive, _) = find_archive(system_name, repository=repository, version=version)
+        (archive, _) = find_archive(
+            system_name, repository=repository, version=version
+        )
         if not archive:
             raise OSError("Failed to find repository or system.")
 
         self._mnt_point = mnt_point
         self._repository = repository
         self._archive = archive
-        self._version = version
 
     def __enter__(self) -> typing.Any:
         run_borg("mount", f"{self._repository}::{self._archive}", self._mnt_point)
 
         # find image file:
-        image_files = [
+        image_file = _image_file_name(
             f
             for f in os.listdir(self._mnt_point)
-            if self._version in f and os.path.isfile(os.path.join(self._mnt_point, f))
-        ]
-        assert len(image_files) == 1
-
-        return os.path.join(self._mnt_point, image_files[0])
+            if os.path.isfile(os.path.join(self._mnt_point, f))
+        )
+        return os.path.join(self._mnt_point, image_file)
 
     def __exit__(
         self, exc_type: typing.Any, exc_val: typing.Any, exc_tb: typing.Any
     ) -> None:
         mount.umount(self._mnt_point)
+
+
+class ChunkStoreExtract:
+    """Extract the image file of a system from a chunk store.
+
+    Chunks are read in parallel and written straight into the image file.
+    """
+
+    def __init__(
+        self, directory: str, *, repository: str, system_name: str, version: str,
+    ) -> None:
+        if not os.path.isdir(directory):
+            raise OSError(f'"{directory}" is not a directory.')
+
+        (archive, _) = find_archive(
+            system_name, repository=repository, version=version
+        )
+        if not archive:
+            raise OSError("Failed to find repository or system.")
+
+        self._directory = directory
+        self._store = ChunkStore(repository)
+        self._archive = archive
+
+    def __enter__(self) -> typing.Any:
+        name = _image_file_name(self._store.files(self._archive).keys())
+
+        image_file = os.path.join(self._directory, name)
+        verbose(f'Extracting "{name}" from chunk store.')
+        self._store.extract_file(self._archive, name, image_file)
+        return image_file
+
+    def __exit__(
+        self, exc_type: typing.Any, exc_val: typing.Any, exc_tb: typing.Any
+    ) -> None:
+        pass
+
+
+def open_image(
+    directory: str, *, repository: str, system_name: str, version: str
+) -> typing.Any:
+    """Make the image file of a system available in directory."""
+    if is_chunk_store(repository):
+        return ChunkStoreExtract(
+            directory,
+            repository=repository,
+            system_name=system_name,
+            version=version,
+        )
+    return BorgMount(
+        directory, repository=repository, system_name=system_name, version=version
+    )
@@ -20,6 +20,10 @@ import os.path
 import traceback
 
 
+# Marks systems stored without running their export commands:
+DEV_BUILD_MARKER = "dev_build"
+
+
 class Generator:
     """Drives the generation of systems."""
 
@@ -66,11 +70,16 @@ class Generator:
         command_manager: CommandManager,
         repository_base_directory: str = "",
         ignore_errors: bool = False,
+        skip_export: bool = False,
     ) -> None:
-        """Generate all systems in the dependency tree."""
+        """Generate all systems in the dependency tree.
+
+        With skip_export set, export commands are left out. Systems stored
+        that way get regenerated by the next run exporting them."""
 
         exe = Executor(
             scratch_directory=work_directory.scratch_directory,
+            shared_cache_directory=work_directory.shared_cache_directory,
             systems_definition_directory=self._systems_manager.systems_definition_directory,
             command_manager=command_manager,
             repository_base_directory=repository_base_directory,
@@ -91,19 +100,31 @@ class Generator:
 
             h1(f'Generate "{system_name}" ({target_distribution})')
             try:
-                if os.path.isdir(
-                    os.path.join(work_directory.storage_directory, system_name)
+                storage = os.path.join(work_directory.storage_directory, system_name)
+                if not skip_export and os.path.exists(
+                    os.path.join(storage, DEV_BUILD_MARKER)
                 ):
+                    verbose("Stored without export, regenerating.")
+                    work_directory.clear_system_storage(system_name)
+
+                if os.path.isdir(storage):
                     verbose("Already in storage, skipping.")
                 else:
                     work_directory.clear_scratch_directory()
 
+                    to_execute = exec_obj_list
+                    if skip_export:
+                        to_execute = [e for e in exec_obj_list if e.command != "export"]
+
                     exe.run(
                         system_name,
                         base_system_name,
-                        exec_obj_list,
+                        to_execute,
                         storage_directory=work_directory.storage_directory,
                     )
+
+                    if len(to_execute) != len(exec_obj_list):
+                        open(os.path.join(storage, DEV_BUILD_MARKER), "w").close()
             except Exception as e:
                 self._report_error(system_name, e, ignore_errors=ignore_errors)
                 failed_systems += 1
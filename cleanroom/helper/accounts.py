@@ -0,0 +1,534 @@
+# -*- coding: utf-8 -*-
+"""Edit passwd, shadow, group and gshadow of a system in-process.
+
+Changes follow the rules of the shadow-utils useradd, usermod, groupadd and
+groupmod tools (including their id allocation), but are collected in memory
+and written out in one go.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..exceptions import GenerateError
+from ..printer import debug, trace
+
+from contextlib import contextmanager
+import datetime
+import os
+import time
+import typing
+
+
+COMMANDS = ("groupadd", "groupmod", "useradd", "usermod")
+
+_active: typing.Dict[str, "AccountDatabase"] = {}
+
+
+def _read_key_values(path: str, separator: str) -> typing.Dict[str, str]:
+    result: typing.Dict[str, str] = {}
+    if not os.path.isfile(path):
+        return result
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split(separator, 1) if separator else line.split(None, 1)
+            if len(parts) == 2:
+                result[parts[0].strip()] = parts[1].strip().strip('"')
+    return result
+
+
+def _number(value: typing.Optional[str], default: int) -> int:
+    if value is None:
+        return default
+    try:
+        return int(value, 0)
+    except ValueError:
+        try:
+            return int(value)
+        except ValueError:
+            return default
+
+
+def _today() -> int:
+    """Days since the epoch (honoring SOURCE_DATE_EPOCH like shadow-utils)."""
+    now = _number(os.environ.get("SOURCE_DATE_EPOCH"), int(time.time()))
+    days = now // (24 * 60 * 60)
+    return days if days > 0 else -1
+
+
+def _optional(value: int) -> str:
+    return "" if value < 0 else str(value)
+
+
+def _expire_days(expire: str) -> int:
+    if expire in ("", "None", "-1"):
+        return -1
+    if expire.isdigit():
+        return int(expire)
+    try:
+        date = datetime.datetime.strptime(expire, "%Y-%m-%d").date()
+    except ValueError:
+        raise GenerateError(f'Invalid expire date "{expire}".')
+    return (date - datetime.date(1970, 1, 1)).days
+
+
+def _members(value: str) -> typing.List[str]:
+    return [m for m in value.split(",") if m]
+
+
+class _Table:
+    """The lines of one colon separated database file."""
+
+    def __init__(self, path: str, field_count: int) -> None:
+        self.path = path
+        self.exists = os.path.isfile(path)
+        self.changed = False
+        self._field_count = field_count
+        self.rows: typing.List[typing.List[str]] = []
+        if self.exists:
+            with open(path, "r") as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        line = line[:-1]
+                    self.rows.append(line.split(":"))
+
+    def find(self, name: str) -> typing.Optional[typing.List[str]]:
+        for row in self.rows:
+            if row[0] == name:
+                # Pad short lines (e.g. groups without member field):
+                row += [""] * (self._field_count - len(row))
+                return row
+        return None
+
+    def ids(self) -> typing.Set[int]:
+        result: typing.Set[int] = set()
+        for row in self.rows:
+            if len(row) > 2 and row[2].isdigit():
+                result.add(int(row[2]))
+        return result
+
+    def append(self, row: typing.List[str]) -> None:
+        assert len(row) == self._field_count
+        self.rows.append(row)
+        self.changed = True
+
+    def rename(self, row: typing.List[str], name: str) -> None:
+        # shadow-utils drops the old entry and appends the renamed one:
+        self.rows.remove(row)
+        row[0] = name
+        self.rows.append(row)
+        self.changed = True
+
+    def write(self) -> None:
+        if not self.exists or not self.changed:
+            return
+        st = os.stat(self.path)
+        tmp_file = self.path + "+"
+        with open(tmp_file, "w") as f:
+            for row in self.rows:
+                f.write(":".join(row) + "\n")
+        os.chown(tmp_file, st.st_uid, st.st_gid)
+        os.chmod(tmp_file, st.st_mode & 0o7777)
+        os.rename(tmp_file, self.path)
+        self.changed = False
+        trace(f'Wrote "{self.path}".')
+
+
+class AccountDatabase:
+    """passwd, shadow, group and gshadow of a system."""
+
+    def __init__(self, root_directory: str) -> None:
+        self._root_directory = root_directory
+        etc = os.path.join(root_directory, "etc")
+        self._passwd = _Table(os.path.join(etc, "passwd"), 7)
+        self._shadow = _Table(os.path.join(etc, "shadow"), 9)
+        self._group = _Table(os.path.join(etc, "group"), 4)
+        self._gshadow = _Table(os.path.join(etc, "gshadow"), 4)
+        if not self._passwd.exists or not self._group.exists:
+            raise GenerateError(f'No passwd or group file found in "{root_directory}".')
+        self._login_defs = _read_key_values(os.path.join(etc, "login.defs"), "")
+        self._useradd_defaults = _read_key_values(
+            os.path.join(etc, "default/useradd"), "="
+        )
+
+    @property
+    def root_directory(self) -> str:
+        return self._root_directory
+
+    def _def(self, key: str, default: int) -> int:
+        return _number(self._login_defs.get(key), default)
+
+    def _def_bool(self, key: str, default: bool) -> bool:
+        value = self._login_defs.get(key)
+        if value is None:
+            return default
+        return value.lower() == "yes"
+
+    def _id_range(self, kind: str, system: bool) -> typing.Tuple[int, int]:
+        id_min = self._def(f"{kind}_MIN", 1000)
+        if system:
+            return (
+                self._def(f"SYS_{kind}_MIN", 101),
+                self._def(f"SYS_{kind}_MAX", id_min - 1),
+            )
+        return (id_min, self._def(f"{kind}_MAX", 60000))
+
+    @staticmethod
+    def _find_new_id(
+        used: typing.Set[int],
+        id_range: typing.Tuple[int, int],
+        *,
+        system: bool,
+        preferred: typing.Optional[int] = None,
+    ) -> int:
+        id_min, id_max = id_range
+        if preferred is not None and id_min <= preferred <= id_max:
+            if preferred not in used:
+                return preferred
+
+        in_range = [i for i in used if id_min <= i <= id_max]
+        if system:
+            # System ids are handed out from the top of the range downwards:
+            candidate = (min(in_range) if in_range else id_max + 1) - 1
+            if candidate >= id_min:
+                return candidate
+            candidates: typing.Iterable[int] = range(id_max, id_min - 1, -1)
+        else:
+            candidate = (max(in_range) if in_range else id_min - 1) + 1
+            if candidate <= id_max:
+                return candidate
+            candidates = range(id_min, id_max + 1)
+
+        for candidate in candidates:
+            if candidate not in used:
+                return candidate
+        raise GenerateError(f"No free id left in range {id_min}-{id_max}.")
+
+    def _group_row(self, group: typing.Any) -> typing.List[str]:
+        g = str(group)
+        if g.isdigit():
+            name = next(
+                (r[0] for r in self._group.rows if len(r) > 2 and r[2] == g), ""
+            )
+        else:
+            name = g
+        row = self._group.find(name) if name else None
+        if row is None:
+            raise GenerateError(f'Group "{group}" does not exist.')
+        return row
+
+    def _user_row(self, user_name: str) -> typing.List[str]:
+        row = self._passwd.find(user_name)
+        if row is None:
+            raise GenerateError(f'User "{user_name}" does not exist.')
+        return row
+
+    def _add_group_row(self, name: str, gid: int, password: str = "") -> None:
+        self._group.append(
+            [
+                name,
+                password if password and not self._gshadow.exists else "x",
+                str(gid),
+                "",
+            ]
+        )
+        if self._gshadow.exists:
+            self._gshadow.append([name, password or "!", "", ""])
+
+    def _set_supplementary_groups(
+        self, user_name: str, groups: str, *, append: bool
+    ) -> None:
+        wanted = {self._group_row(g)[0] for g in _members(groups)}
+        for table in (self._group, self._gshadow):
+            for row in table.rows:
+                if len(row) < 4:
+                    if row[0] not in wanted:
+                        continue
+                    row += [""] * (4 - len(row))
+                members = _members(row[3])
+                if row[0] in wanted:
+                    if user_name not in members:
+                        row[3] = ",".join(members + [user_name])
+                        table.changed = True
+                elif not append and user_name in members:
+                    row[3] = ",".join(m for m in members if m != user_name)
+                    table.changed = True
+
+    def groupadd(
+        self,
+        group_name: str,
+        *,
+        gid: int = -1,
+        force: bool = False,
+        system: bool = False,
+    ) -> None:
+        """Add a group, like groupadd does."""
+        if self._group.find(group_name) is not None:
+            if force:
+                debug(f'Group "{group_name}" exists already.')
+                return
+            raise GenerateError(f'Group "{group_name}" exists already.')
+
+        used = self._group.ids()
+        if gid >= 0 and gid in used:
+            if not force:
+                raise GenerateError(f'GID "{gid}" is already in use.')
+            gid = -1
+        if gid < 0:
+            gid = self._find_new_id(used, self._id_range("GID", system), system=system)
+
+        self._add_group_row(group_name, gid)
+        trace(f'Added group "{group_name}" ({gid}).')
+
+    def groupmod(
+        self, group_name: str, *, gid: int = -1, password: str = "", rename: str = ""
+    ) -> None:
+        """Modify an existing group, like groupmod does."""
+        row = self._group_row(group_name)
+        if row[0] != group_name:
+            raise GenerateError(f'Group "{group_name}" does not exist.')
+        shadow_row = self._gshadow.find(group_name)
+
+        if gid >= 0 and str(gid) != row[2]:
+            if gid in self._group.ids():
+                raise GenerateError(f'GID "{gid}" is already in use.')
+            old_gid = row[2]
+            row[2] = str(gid)
+            self._group.changed = True
+            # Users with this primary group move along:
+            for user in self._passwd.rows:
+                if len(user) > 3 and user[3] == old_gid:
+                    user[3] = str(gid)
+                    self._passwd.changed = True
+
+        if password:
+            if shadow_row is not None:
+                shadow_row[1] = password
+                self._gshadow.changed = True
+            else:
+                row[1] = password
+                self._group.changed = True
+
+        if rename:
+            if self._group.find(rename) is not None:
+                raise GenerateError(f'Group "{rename}" exists already.')
+            self._group.rename(row, rename)
+            if shadow_row is not None:
+                self._gshadow.rename(shadow_row, rename)
+
+    def useradd(
+        self,
+        user_name: str,
+        *,
+        comment: str = "",
+        home: str = "",
+        gid: typing.Any = -1,
+        uid: int = -1,
+        shell: str = "",
+        groups: str = "",
+        password: str = "",
+        expire: typing.Optional[str] = None,
+    ) -> None:
+        """Add a new user, like useradd does."""
+        if self._passwd.find(user_name) is not None:
+            raise GenerateError(f'User "{user_name}" exists already.')
+
+        used_uids = self._passwd.ids()
+        if uid >= 0:
+            if uid in used_uids:
+                raise GenerateError(f'UID "{uid}" is already in use.')
+        else:
+            uid = self._find_new_id(
+                used_uids, self._id_range("UID", False), system=False
+            )
+
+        user_group = gid == -1 and self._def_bool("USERGROUPS_ENAB", False)
+        if user_group:
+            if self._group.find(user_name) is not None:
+                raise GenerateError(
+                    f'Group "{user_name}" exists already, pass its gid to '
+                    "add the user to it."
+                )
+            gid = self._find_new_id(
+                self._group.ids(),
+                self._id_range("GID", False),
+                system=False,
+                preferred=uid,
+            )
+        elif gid == -1:
+            gid = _number(self._useradd_defaults.get("GROUP"), 100)
+        else:
+            gid = int(self._group_row(gid)[2])
+
+        if not home:
+            home = os.path.join(self._useradd_defaults.get("HOME", "/home"), user_name)
+        if not shell:
+            shell = self._useradd_defaults.get("SHELL", "/bin/bash")
+
+        self._passwd.append(
+            [
+                user_name,
+                "x" if self._shadow.exists else (password or "!"),
+                str(uid),
+                str(gid),
+                comment,
+                home,
+                shell,
+            ]
+        )
+        if self._shadow.exists:
+            self._shadow.append(
+                [
+                    user_name,
+                    password or "!",
+                    _optional(_today()),
+                    _optional(self._def("PASS_MIN_DAYS", -1)),
+                    _optional(self._def("PASS_MAX_DAYS", -1)),
+                    _optional(self._def("PASS_WARN_AGE", -1)),
+                    _optional(_number(self._useradd_defaults.get("INACTIVE"), -1)),
+                    _optional(
+                        _expire_days(
+                            self._useradd_defaults.get("EXPIRE", "")
+                            if expire is None
+                            else expire
+                        )
+                    ),
+                    "",
+                ]
+            )
+        if user_group:
+            self._add_group_row(user_name, gid)
+        if groups:
+            self._set_supplementary_groups(user_name, groups, append=True)
+        trace(f'Added user "{user_name}" ({uid}:{gid}).')
+
+    def usermod(
+        self,
+        user_name: str,
+        *,
+        comment: str = "",
+        home: str = "",
+        gid: typing.Any = -1,
+        uid: int = -1,
+        lock: typing.Optional[bool] = None,
+        rename: str = "",
+        shell: str = "",
+        append: bool = False,
+        groups: str = "",
+        password: str = "",
+        expire: typing.Optional[str] = None,
+    ) -> None:
+        """Modify an existing user, like usermod does."""
+        row = self._user_row(user_name)
+        shadow_row = self._shadow.find(user_name)
+        old_ids = (int(row[2]), int(row[3]))
+
+        if comment:
+            row[4] = comment
+        if home:
+            row[5] = home
+        if shell:
+            row[6] = shell
+        if gid != -1:
+            row[3] = self._group_row(gid)[2]
+        if uid >= 0 and str(uid) != row[2]:
+            if uid in self._passwd.ids():
+                raise GenerateError(f'UID "{uid}" is already in use.')
+            row[2] = str(uid)
+        self._passwd.changed = True
+
+        password_row = (shadow_row, 1) if shadow_row is not None else (row, 1)
+        if password:
+            password_row[0][1] = password
+            if shadow_row is not None:
+                shadow_row[2] = _optional(_today())
+        if lock is True and not password_row[0][1].startswith("!"):
+            password_row[0][1] = "!" + password_row[0][1]
+        elif lock is False and password_row[0][1].startswith("!"):
+            if len(password_row[0][1]) == 1:
+                raise GenerateError(
+                    f'Unlocking "{user_name}" would result in a passwordless account.'
+                )
+            password_row[0][1] = password_row[0][1][1:]
+        if expire is not None and shadow_row is not None:
+            shadow_row[7] = _optional(_expire_days(expire))
+        if shadow_row is not None:
+            self._shadow.changed = True
+
+        if groups:
+            self._set_supplementary_groups(user_name, groups, append=append)
+
+        if rename and rename != user_name:
+            if self._passwd.find(rename) is not None:
+                raise GenerateError(f'User "{rename}" exists already.')
+            self._passwd.rename(row, rename)
+            if shadow_row is not None:
+                self._shadow.rename(shadow_row, rename)
+            for table in (self._group, self._gshadow):
+                for group_row in table.rows:
+                    for index in (2, 3) if table is self._gshadow else (3,):
+                        if len(group_row) <= index:
+                            continue
+                        members = _members(group_row[index])
+                        if user_name in members:
+                            group_row[index] = ",".join(
+                                rename if m == user_name else m for m in members
+                            )
+                            table.changed = True
+
+        new_ids = (int(row[2]), int(row[3]))
+        if new_ids != old_ids:
+            self._chown_home(row[5], old_ids, new_ids)
+
+    def _chown_home(
+        self,
+        home: str,
+        old_ids: typing.Tuple[int, int],
+        new_ids: typing.Tuple[int, int],
+    ) -> None:
+        """Move files in the home directory over to changed ids, like usermod."""
+        home_directory = os.path.join(self._root_directory, home.lstrip("/"))
+        if not home or home == "/" or not os.path.isdir(home_directory):
+            return
+
+        def fix(path: str) -> None:
+            st = os.lstat(path)
+            new_uid = new_ids[0] if st.st_uid == old_ids[0] else -1
+            new_gid = new_ids[1] if st.st_gid == old_ids[1] else -1
+            if new_uid >= 0 or new_gid >= 0:
+                os.chown(path, new_uid, new_gid, follow_symlinks=False)
+
+        fix(home_directory)
+        for root, dirs, files in os.walk(home_directory):
+            for name in dirs + files:
+                fix(os.path.join(root, name))
+
+    def commit(self) -> None:
+        """Write all changed files."""
+        # Files are replaced, so cached user and group data gets invalidated:
+        for table in (self._group, self._gshadow, self._passwd, self._shadow):
+            table.write()
+        debug(f'Account changes written to "{self._root_directory}".')
+
+
+@contextmanager
+def transaction(root_directory: str) -> typing.Iterator[AccountDatabase]:
+    """Collect all account changes to root_directory and write them at the end.
+
+    Nested transactions for the same root directory share the outer one.
+    Nothing gets written if the with block raises.
+    """
+    database = _active.get(root_directory)
+    if database is not None:
+        yield database
+        return
+
+    database = AccountDatabase(root_directory)
+    _active[root_directory] = database
+    try:
+        yield database
+        database.commit()
+    finally:
+        del _active[root_directory]
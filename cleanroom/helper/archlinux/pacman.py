@@ -7,6 +7,7 @@
 
 from ...printer import debug, info
 from ...systemcontext import SystemContext
+from ..reflink import copy_file, copy_tree
 from ..run import run
 from ..mount import umount_all, mount
 
@@ -248,7 +249,7 @@ def _copy_state(system_context: SystemContext, internal_pacman: bool) -> None:
     outside = _db_directory(system_context, False)
     inside = _db_directory(system_context, True)
     debug("Copying configuration file.")
-    shutil.copyfile(
+    copy_file(
         _config_file(system_context, not internal_pacman),
         _config_file(system_context, internal_pacman),
     )
@@ -257,17 +258,19 @@ def _copy_state(system_context: SystemContext, internal_pacman: bool) -> None:
     if internal_pacman:
         shutil.rmtree(inside)
         info("Copy pacman DB into the filesystem.")
-        shutil.copytree(outside, inside)
+        copy_tree(outside, inside, preserve=True)
         info("Copy pacman GPG data into the filesystem.")
         shutil.rmtree(gpg_directory(system_context, True))
-        shutil.copytree(
-            gpg_directory(system_context, False), gpg_directory(system_context, True)
+        copy_tree(
+            gpg_directory(system_context, False),
+            gpg_directory(system_context, True),
+            preserve=True,
         )
         debug("Removing pacman DB outside the filesystem.")
         shutil.rmtree(outside)
     else:
         debug("Copy pacman DB out of the filesystem.")
-        shutil.copytree(inside, outside)
+        copy_tree(inside, outside, preserve=True)
         debug("Removing pacman DB inside the filesystem.")
         shutil.rmtree(inside)
 
@@ -351,6 +354,30 @@ def pacman(
             )
 
 
+def installed_packages(db_directory: str) -> typing.List[typing.Tuple[str, str]]:
+    """Return name and version of all packages in a pacman "local" database.
+
+    Only %NAME% and %VERSION% of the "desc" files are read, so the result
+    does not depend on e.g. when the packages were installed."""
+    if not os.path.isdir(db_directory):
+        return []
+
+    packages: typing.List[typing.Tuple[str, str]] = []
+    for entry in sorted(os.listdir(db_directory)):
+        desc = os.path.join(db_directory, entry, "desc")
+        if not os.path.isfile(desc):
+            continue
+        with open(desc, "r") as f:
+            lines = [line.strip() for line in f]
+        fields = {
+            lines[i]: lines[i + 1]
+            for i in range(len(lines) - 1)
+            if lines[i] in ("%NAME%", "%VERSION%")
+        }
+        packages.append((fields.get("%NAME%", entry), fields.get("%VERSION%", "")))
+    return packages
+
+
 def pacman_report(
     system_context: SystemContext, directory: str, *, pacman_command: str
 ) -> None:
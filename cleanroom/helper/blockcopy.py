@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""Copy (mostly sparse) images onto files and block devices.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..exceptions import GenerateError
+from ..printer import error, info, trace
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import errno
+import fcntl
+import hashlib
+import mmap
+import os
+import stat
+import struct
+import sys
+import time
+import typing
+
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+# From linux/fs.h:
+_BLKZEROOUT = 0x127F
+_BLKGETSIZE64 = 0x80081272
+
+_SECTOR_SIZE = 512
+
+_ZEROES = bytes(BLOCK_SIZE)
+
+Progress = typing.Callable[[int, int], None]
+
+
+def report_progress(label: str, *, interval: float = 1.0) -> Progress:
+    """Return a progress callback that prints at most once per interval."""
+    last = [0.0]
+
+    def report(done: int, total: int) -> None:
+        now = time.monotonic()
+        if now - last[0] < interval and done != total:
+            return
+        last[0] = now
+        if total:
+            info(f"{label}: {done * 100 // total}% ({done}/{total} bytes).")
+        else:
+            info(f"{label}: {done} bytes.")
+
+    return report
+
+
+def _is_zero(data: memoryview) -> bool:
+    return _ZEROES.startswith(data)
+
+
+def _data_ranges(fd: int, size: int) -> typing.Iterator[typing.Tuple[int, int, bool]]:
+    """Yield (offset, length, has_data) covering all of fd."""
+    offset = 0
+    while offset < size:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:  # Only a hole left
+                yield (offset, size - offset, False)
+                return
+            if e.errno in (errno.EINVAL, errno.EOPNOTSUPP):
+                yield (offset, size - offset, True)
+                return
+            raise
+        if data > offset:
+            yield (offset, data - offset, False)
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), size)
+        yield (data, hole - data, True)
+        offset = hole
+
+
+class _Destination:
+    """Write blocks into a file, block device or a pipe."""
+
+    def __init__(self, destination: str, progress: typing.Optional[Progress]) -> None:
+        self.name = destination
+        self.progress = progress
+        self.error: typing.Optional[Exception] = None
+        self.block_device = False
+        self.pipe = destination == "-"
+        self.size = -1
+        self.fd = -1
+
+    def open(self) -> None:
+        if self.pipe:
+            self.fd = sys.stdout.buffer.fileno()
+            return
+
+        if os.path.exists(self.name) and stat.S_ISBLK(os.stat(self.name).st_mode):
+            self.block_device = True
+            self.fd = os.open(self.name, os.O_WRONLY | getattr(os, "O_DIRECT", 0))
+            size = bytearray(8)
+            fcntl.ioctl(self.fd, _BLKGETSIZE64, size)
+            self.size = struct.unpack("Q", size)[0]
+        else:
+            # A truncated file reads as zeroes, so holes need no writes.
+            self.fd = os.open(self.name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    def _buffered(self) -> None:
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        if flags & getattr(os, "O_DIRECT", 0):
+            fcntl.fcntl(self.fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+
+    def write(self, offset: int, data: memoryview) -> None:
+        if (offset | len(data)) % _SECTOR_SIZE:
+            # O_DIRECT needs sector aligned writes.
+            self._buffered()
+        done = 0
+        while done < len(data):
+            if self.pipe:
+                done += os.write(self.fd, data[done:])
+            else:
+                done += os.pwrite(self.fd, data[done:], offset + done)
+
+    def zero(self, offset: int, length: int, zeroes: memoryview) -> None:
+        if not self.pipe and not self.block_device:
+            return
+        if self.block_device and (offset | length) % _SECTOR_SIZE == 0:
+            try:
+                fcntl.ioctl(self.fd, _BLKZEROOUT, struct.pack("QQ", offset, length))
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL):
+                    raise
+        while length > 0:
+            count = min(length, len(zeroes))
+            self.write(offset, zeroes[:count])
+            offset += count
+            length -= count
+
+    def fail(self, e: Exception) -> None:
+        error(f'Copying into "{self.name}" failed: {e}')
+        self.error = e
+        self.close()
+
+    def close(self) -> None:
+        if self.fd >= 0 and not self.pipe:
+            os.close(self.fd)
+        self.fd = -1
+
+    def finish(self, size: int) -> None:
+        if self.pipe:
+            return
+        if not self.block_device:
+            os.ftruncate(self.fd, size)
+        os.fsync(self.fd)
+        self.close()
+
+
+def _hash_zeroes(digest: typing.Any, length: int) -> None:
+    while length > 0:
+        count = min(length, BLOCK_SIZE)
+        digest.update(memoryview(_ZEROES)[:count])
+        length -= count
+
+
+def _verify(destination: _Destination, size: int, expected: str) -> None:
+    trace(f'Verifying "{destination.name}".')
+    digest = hashlib.sha256()
+    direct = getattr(os, "O_DIRECT", 0) if destination.block_device else 0
+    buffer = mmap.mmap(-1, BLOCK_SIZE)
+    view = memoryview(buffer)
+    fd = os.open(destination.name, os.O_RDONLY | direct)
+    try:
+        offset = 0
+        while offset < size:
+            # Read whole blocks to keep O_DIRECT happy, hash only what was written.
+            count = os.preadv(fd, [view], offset)
+            if count == 0:
+                break
+            digest.update(view[: min(count, size - offset)])
+            offset += count
+    finally:
+        os.close(fd)
+
+    if digest.hexdigest() != expected:
+        raise GenerateError(
+            f'Verification of "{destination.name}" failed: Checksum mismatch.'
+        )
+
+
+def _open_destinations(
+    destinations: typing.Sequence[str],
+    size: int,
+    progress: typing.Optional[typing.Callable[[str], Progress]],
+) -> typing.List[_Destination]:
+    targets: typing.List[_Destination] = []
+    for d in destinations:
+        target = _Destination(d, progress(d) if progress else None)
+        try:
+            target.open()
+        except OSError as e:
+            target.fail(e)
+        else:
+            if target.size >= 0 and size > target.size:
+                target.fail(
+                    GenerateError(f'"{d}" is too small: {target.size} < {size} bytes.')
+                )
+        targets.append(target)
+    return targets
+
+
+def _copy(
+    read_block: typing.Callable[[memoryview], int],
+    ranges: typing.Iterable[typing.Tuple[int, int, bool]],
+    destinations: typing.Sequence[str],
+    *,
+    size: int,
+    verify: bool,
+    progress: typing.Optional[typing.Callable[[str], Progress]],
+) -> typing.Tuple[str, typing.Dict[str, Exception]]:
+    """Copy data into all destinations at once.
+
+    A failing destination gets dropped, the others continue."""
+    targets = _open_destinations(destinations, size, progress)
+
+    def alive() -> typing.List[_Destination]:
+        return [t for t in targets if t.error is None]
+
+    digest = hashlib.sha256()
+    # mmap memory is page aligned as required by O_DIRECT. Two buffers let
+    # the next block get read while the last one is still being written.
+    buffers = [memoryview(mmap.mmap(-1, BLOCK_SIZE)) for _ in range(2)]
+    zeroes = memoryview(mmap.mmap(-1, BLOCK_SIZE))
+    pending: typing.List[typing.Tuple[_Destination, Future]] = []
+    total = 0
+    skipped = 0
+
+    def settle() -> None:
+        for (target, future) in pending:
+            try:
+                future.result()
+            except Exception as e:
+                target.fail(e)
+        pending.clear()
+        for target in alive():
+            if target.progress:
+                target.progress(total, size)
+
+    with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor:
+
+        def submit(operation: typing.Callable[..., None], *args: typing.Any) -> None:
+            for target in alive():
+                pending.append((target, executor.submit(operation, target, *args)))
+
+        try:
+            block_number = 0
+            for (offset, length, has_data) in ranges:
+                if not alive():
+                    break
+                if not has_data:
+                    settle()
+                    submit(_Destination.zero, offset, length, zeroes)
+                    _hash_zeroes(digest, length)
+                    skipped += length
+                    total = offset + length
+                    continue
+
+                end = offset + length
+                while offset < end:
+                    view = buffers[block_number % 2]
+                    block_number += 1
+                    count = read_block(view[: min(BLOCK_SIZE, end - offset)])
+                    if count == 0:
+                        break
+                    block = view[:count]
+                    digest.update(block)
+                    settle()
+                    if _is_zero(block):
+                        submit(_Destination.zero, offset, count, zeroes)
+                        skipped += count
+                    else:
+                        submit(_Destination.write, offset, block)
+                    offset += count
+                    total = offset
+                if offset < end:
+                    break  # End of stream
+        finally:
+            settle()
+            for target in alive():
+                try:
+                    target.finish(total)
+                except OSError as e:
+                    target.fail(e)
+
+        result = digest.hexdigest()
+        trace(
+            f"Copied {total} bytes into {len(alive())} destination(s) ({skipped} "
+            f"bytes of zeroes skipped), SHA256: {result}."
+        )
+
+        if verify:
+            for target in alive():
+                if not target.pipe:
+                    pending.append(
+                        (target, executor.submit(_verify, target, total, result))
+                    )
+            settle()
+
+    return (result, {t.name: t.error for t in targets if t.error is not None})
+
+
+def _single(result: typing.Tuple[str, typing.Dict[str, Exception]]) -> str:
+    for e in result[1].values():
+        raise e
+    return result[0]
+
+
+def copy_blocks(
+    source: str,
+    destination: str,
+    *,
+    verify: bool = True,
+    progress: typing.Optional[Progress] = None,
+) -> str:
+    """Copy source into destination, skipping holes and blocks of zeroes.
+
+    destination can be a file, a block device or "-" for stdout. Holes
+    stay holes in files and get zeroed out on block devices (which is fast
+    on devices supporting it).
+
+    Returns the SHA256 of the data. With verify set the destination is read
+    back and checked against it."""
+    return _single(
+        copy_blocks_to_all(
+            source,
+            [destination],
+            verify=verify,
+            progress=(lambda _: progress) if progress else None,
+        )
+    )
+
+
+def copy_blocks_to_all(
+    source: str,
+    destinations: typing.Sequence[str],
+    *,
+    verify: bool = True,
+    progress: typing.Optional[typing.Callable[[str], Progress]] = None,
+) -> typing.Tuple[str, typing.Dict[str, Exception]]:
+    """Copy source into all destinations, reading it only once.
+
+    progress is called with each destination and returns the progress
+    callback to use for it (report_progress fits).
+
+    Returns the SHA256 of the data and the errors of the destinations that
+    failed. See copy_blocks for details."""
+    with open(source, "rb") as src:
+        fd = src.fileno()
+        size = os.fstat(fd).st_size
+        position = [0]
+
+        def read_block(view: memoryview) -> int:
+            count = os.preadv(fd, [view], position[0])
+            position[0] += count
+            return count
+
+        def ranges() -> typing.Iterator[typing.Tuple[int, int, bool]]:
+            for (offset, length, has_data) in _data_ranges(fd, size):
+                position[0] = offset
+                yield (offset, length, has_data)
+
+        return _copy(
+            read_block,
+            ranges(),
+            destinations,
+            size=size,
+            verify=verify,
+            progress=progress,
+        )
+
+
+def copy_stream(
+    source: typing.BinaryIO,
+    destination: str,
+    *,
+    size: int = 0,
+    verify: bool = True,
+    progress: typing.Optional[Progress] = None,
+) -> str:
+    """Copy a stream into destination, skipping blocks of zeroes.
+
+    size is only used for progress reporting and may be 0 if unknown.
+    See copy_blocks for the rest."""
+    return _single(
+        copy_stream_to_all(
+            source,
+            [destination],
+            size=size,
+            verify=verify,
+            progress=(lambda _: progress) if progress else None,
+        )
+    )
+
+
+def copy_stream_to_all(
+    source: typing.BinaryIO,
+    destinations: typing.Sequence[str],
+    *,
+    size: int = 0,
+    verify: bool = True,
+    progress: typing.Optional[typing.Callable[[str], Progress]] = None,
+) -> typing.Tuple[str, typing.Dict[str, Exception]]:
+    """Copy a stream into all destinations, see copy_blocks_to_all."""
+
+    def read_block(view: memoryview) -> int:
+        filled = 0
+        while filled < len(view):
+            count = source.readinto(view[filled:])  # type: ignore
+            if not count:
+                break
+            filled += count
+        return filled
+
+    return _copy(
+        read_block,
+        [(0, sys.maxsize, True)],
+        destinations,
+        size=size,
+        verify=verify,
+        progress=progress,
+    )
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""A local, content-addressed chunk store for exported images.
+
+The store is a directory with this layout:
+
+    chunkstore.json          store configuration (format version, compression)
+    chunks/<xx>/<sha256>     compressed chunk data, named by the uncompressed sha256
+    archives/<name>.json     index: the list of chunks making up each file
+
+Files are split at content-defined boundaries, so that data that moves
+around between two versions of an image still produces mostly identical
+chunks. Successive versions of a system share all unchanged chunks.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import debug, trace, verbose
+
+from concurrent.futures import ThreadPoolExecutor
+import bisect
+import hashlib
+import json
+import lzma
+import os
+import threading
+import typing
+import zlib
+
+
+_FORMAT_VERSION = 1
+_CONFIG_FILE = "chunkstore.json"
+
+MIN_CHUNK_SIZE = 256 * 1024  # 256 KiB
+NORMAL_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+MAX_CHUNK_SIZE = 4 * 1024 * 1024  # 4 MiB
+
+# Chunks end where the gear hash of the preceding _WINDOW bytes has all
+# bits of a mask cleared (FastCDC with normalized chunking): A stricter mask
+# applies below NORMAL_CHUNK_SIZE, a looser one above. Boundaries only
+# depend on the bytes right in front of them, so they realign right after
+# inserted or removed data.
+#
+# Hashing every position in Python is far too slow, so the hash is only
+# calculated where a cheap prefilter matches: The data is translated into
+# 4 byte classes and searched for a pattern of 6 classes (on average once
+# every 4KiB), both of which happens in C.
+_WINDOW = 64
+_HASH_MASK = (1 << 64) - 1
+_STRICT_MASK = 0xF0C0_0000_0000_0303  # 10 bits: 4KiB * 1024 = 4MiB
+_LOOSE_MASK = 0xD000_0000_0000_0302  # 6 bits: 4KiB * 64 = 256KiB
+
+
+def _table_value(name: str, index: int) -> int:
+    # Derived from sha256, so chunk boundaries never change between runs or
+    # Python versions.
+    digest = hashlib.sha256(f"cleanroom-chunkstore-{name}-{index}".encode())
+    return int.from_bytes(digest.digest()[:8], "little")
+
+
+_GEAR = [_table_value("gear", b) for b in range(256)]
+_CLASSES = bytes(_table_value("class", b) % 4 for b in range(256))
+_PATTERN = bytes(_table_value("pattern", i) % 4 for i in range(6))
+
+_READ_SIZE = 32 * 1024 * 1024
+
+COMPRESSIONS = ("none", "zlib", "lzma")
+
+
+class ChunkRef(typing.NamedTuple):
+    digest: str
+    offset: int
+    size: int
+
+
+def is_chunk_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, _CONFIG_FILE))
+
+
+def _gear_hash(data: bytes, end: int) -> int:
+    """The gear hash after reading data up to end."""
+    h = 0
+    for b in data[max(0, end - _WINDOW) : end]:
+        h = ((h << 1) + _GEAR[b]) & _HASH_MASK
+    return h
+
+
+def _candidates(data: bytes, start: int) -> typing.List[typing.Tuple[int, bool]]:
+    """Return (end, strict) for all chunk ends in data after start.
+
+    strict is set if the end also satisfies the strict mask."""
+    classes = data.translate(_CLASSES)
+    result: typing.List[typing.Tuple[int, bool]] = []
+    pos = classes.find(_PATTERN, start)
+    while pos >= 0:
+        end = pos + len(_PATTERN)
+        h = _gear_hash(data, end)
+        if h & _LOOSE_MASK == 0:
+            result.append((end, h & _STRICT_MASK == 0))
+        pos = classes.find(_PATTERN, pos + 1)
+    return result
+
+
+def chunk_boundaries(data: bytes, *, final: bool) -> typing.List[int]:
+    """Return the end offsets of all chunks found in data.
+
+    If final is False, the data after the last boundary is left over to
+    be continued with more data.
+    """
+    candidates = _candidates(data, MIN_CHUNK_SIZE - len(_PATTERN))
+    ends = [c[0] for c in candidates]
+
+    result: typing.List[int] = []
+    start = 0
+    while len(data) - start > MIN_CHUNK_SIZE:
+        end = 0
+        index = bisect.bisect_right(ends, start + MIN_CHUNK_SIZE)
+        for (candidate, strict) in candidates[index:]:
+            if candidate > start + MAX_CHUNK_SIZE:
+                break
+            if strict or candidate > start + NORMAL_CHUNK_SIZE:
+                end = candidate
+                break
+        if not end:
+            if len(data) - start < MAX_CHUNK_SIZE:
+                break
+            end = start + MAX_CHUNK_SIZE
+        result.append(end)
+        start = end
+
+    if final and start < len(data):
+        result.append(len(data))
+    return result
+
+
+def _compress(data: bytes, compression: str, level: int) -> bytes:
+    if compression == "zlib":
+        return zlib.compress(data, level)
+    if compression == "lzma":
+        return lzma.compress(data, preset=level)
+    return data
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        return zlib.decompress(data)
+    if compression == "lzma":
+        return lzma.decompress(data)
+    return data
+
+
+class ChunkStore:
+    def __init__(self, path: str) -> None:
+        self._path = path
+        config_file = os.path.join(path, _CONFIG_FILE)
+        if not os.path.isfile(config_file):
+            raise OSError(f'"{path}" is not a chunk store.')
+        with open(config_file, "r") as f:
+            config = json.load(f)
+        if config.get("version") != _FORMAT_VERSION:
+            raise OSError(f'Chunk store "{path}" has an unsupported format version.')
+        self._compression = config.get("compression", "none")
+        self._compression_level = config.get("compression_level", 6)
+
+    @staticmethod
+    def create(
+        path: str, *, compression: str = "zlib", compression_level: int = 6
+    ) -> "ChunkStore":
+        """Open the chunk store at path, creating it if necessary."""
+        if not is_chunk_store(path):
+            assert compression in COMPRESSIONS
+            os.makedirs(os.path.join(path, "chunks"), exist_ok=True)
+            os.makedirs(os.path.join(path, "archives"), exist_ok=True)
+            with open(os.path.join(path, _CONFIG_FILE), "w") as f:
+                json.dump(
+                    {
+                        "version": _FORMAT_VERSION,
+                        "compression": compression,
+                        "compression_level": compression_level,
+                    },
+                    f,
+                )
+        return ChunkStore(path)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _chunk_file(self, digest: str) -> str:
+        return os.path.join(self._path, "chunks", digest[:2], digest)
+
+    def _index_file(self, archive: str) -> str:
+        return os.path.join(self._path, "archives", f"{archive}.json")
+
+    def _store_chunk(self, data: bytes) -> typing.Tuple[str, bool]:
+        digest = hashlib.sha256(data).hexdigest()
+        chunk_file = self._chunk_file(digest)
+        if os.path.exists(chunk_file):
+            return (digest, False)
+
+        os.makedirs(os.path.dirname(chunk_file), exist_ok=True)
+        tmp_file = f"{chunk_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(_compress(data, self._compression, self._compression_level))
+        os.rename(tmp_file, chunk_file)
+        return (digest, True)
+
+    def _load_chunk(self, digest: str) -> bytes:
+        with open(self._chunk_file(digest), "rb") as f:
+            data = _decompress(f.read(), self._compression)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise OSError(f'Chunk "{digest}" in "{self._path}" is corrupt.')
+        return data
+
+    def _add_file(
+        self, file: str, executor: ThreadPoolExecutor
+    ) -> typing.Tuple[typing.List[ChunkRef], int]:
+        chunks: typing.List[ChunkRef] = []
+        new_chunks = 0
+        offset = 0
+        pending = b""
+        with open(file, "rb") as f:
+            while True:
+                data = f.read(_READ_SIZE)
+                final = not data
+                pending += data
+
+                start = 0
+                pieces: typing.List[bytes] = []
+                for end in chunk_boundaries(pending, final=final):
+                    pieces.append(pending[start:end])
+                    start = end
+                pending = pending[start:]
+
+                for piece, (digest, is_new) in zip(
+                    pieces, executor.map(self._store_chunk, pieces)
+                ):
+                    chunks.append(
+                        ChunkRef(digest=digest, offset=offset, size=len(piece))
+                    )
+                    offset += len(piece)
+                    new_chunks += 1 if is_new else 0
+
+                if final:
+                    break
+        return (chunks, new_chunks)
+
+    def add_archive(
+        self,
+        name: str,
+        directory: str,
+        *,
+        digest: str = "",
+        max_workers: typing.Optional[int] = None,
+    ) -> None:
+        """Store all files in directory as archive name.
+
+        digest is stored alongside the archive to identify its contents.
+        """
+        index: typing.Dict[str, typing.Any] = {
+            "name": name,
+            "digest": digest,
+            "files": {},
+        }
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for f in sorted(os.listdir(directory)):
+                file = os.path.join(directory, f)
+                if not os.path.isfile(file):
+                    continue
+                chunks, new_chunks = self._add_file(file, executor)
+                verbose(
+                    f'Stored "{f}" in {len(chunks)} chunks, {new_chunks} of them new.'
+                )
+                index["files"][f] = {
+                    "size": os.path.getsize(file),
+                    "mode": os.stat(file).st_mode & 0o7777,
+                    "chunks": [[c.digest, c.size] for c in chunks],
+                }
+
+        self._write_index(name, index)
+        debug(f'Archive "{name}" written to chunk store "{self._path}".')
+
+    def _write_index(self, name: str, index: typing.Mapping[str, typing.Any]) -> None:
+        index_file = self._index_file(name)
+        with open(f"{index_file}.tmp", "w") as fi:
+            json.dump(index, fi)
+        os.rename(f"{index_file}.tmp", index_file)
+
+    def _read_index(self, archive: str) -> typing.Dict[str, typing.Any]:
+        with open(self._index_file(archive), "r") as f:
+            return json.load(f)
+
+    def retag_archive(self, archive: str, name: str) -> None:
+        """Make the contents of archive available as name, too.
+
+        Only the index gets copied, file names stay the same.
+        """
+        index = self._read_index(archive)
+        index["name"] = name
+        self._write_index(name, index)
+        debug(f'Archive "{archive}" retagged as "{name}".')
+
+    def archives(self) -> typing.List[str]:
+        """Names of all archives in the store, sorted."""
+        return sorted(
+            f[:-5]
+            for f in os.listdir(os.path.join(self._path, "archives"))
+            if f.endswith(".json")
+        )
+
+    def files(self, archive: str) -> typing.Dict[str, typing.Any]:
+        return self._read_index(archive)["files"]
+
+    def digest(self, archive: str) -> str:
+        """The digest the archive was stored with (or "")."""
+        return self._read_index(archive).get("digest", "")
+
+    def extract_file(
+        self,
+        archive: str,
+        file: str,
+        destination: str,
+        *,
+        max_workers: typing.Optional[int] = None,
+    ) -> None:
+        """Write file from archive to destination, loading chunks in parallel.
+
+        Chunks that contain only zeroes are skipped, leaving holes in the
+        destination file.
+        """
+        entry = self.files(archive)[file]
+
+        chunks: typing.List[ChunkRef] = []
+        offset = 0
+        for digest, size in entry["chunks"]:
+            chunks.append(ChunkRef(digest=digest, offset=offset, size=size))
+            offset += size
+        assert offset == entry["size"]
+
+        with open(destination, "wb") as out:
+            fd = out.fileno()
+            os.ftruncate(fd, entry["size"])
+
+            def write_chunk(chunk: ChunkRef) -> None:
+                data = self._load_chunk(chunk.digest)
+                assert len(data) == chunk.size
+                if data.count(0) != len(data):
+                    os.pwrite(fd, data, chunk.offset)
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for _ in executor.map(write_chunk, chunks):
+                    pass
+        os.chmod(destination, entry["mode"])
+        trace(f'Extracted "{file}" of "{archive}" into "{destination}".')
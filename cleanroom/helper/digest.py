@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Content digests of directory trees.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import stat
+import typing
+
+
+# Prefix of borg archive comments holding the digest of an exported system:
+DIGEST_COMMENT_PREFIX = "clrm-digest:"
+
+_READ_SIZE = 4 * 1024 * 1024
+# Files up to this size get normalized, bigger files are hashed as they are:
+_NORMALIZE_LIMIT = 1024 * 1024
+
+
+def _normalize(data: bytes, replacements: typing.Mapping[bytes, bytes]) -> bytes:
+    for (old, new) in replacements.items():
+        data = data.replace(old, new)
+    return data
+
+
+def _file_digest(path: str, replacements: typing.Mapping[bytes, bytes]) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= _NORMALIZE_LIMIT:
+            h.update(_normalize(f.read(), replacements))
+        else:
+            while True:
+                data = f.read(_READ_SIZE)
+                if not data:
+                    break
+                h.update(data)
+    return h.hexdigest()
+
+
+def _xattrs(path: str) -> typing.List[typing.Tuple[str, bytes]]:
+    try:
+        return sorted(
+            (name, os.getxattr(path, name, follow_symlinks=False))
+            for name in os.listxattr(path, follow_symlinks=False)
+        )
+    except OSError:
+        return []
+
+
+def _walk(directory: str, relative: str = "") -> typing.Iterator[os.DirEntry]:
+    with os.scandir(os.path.join(directory, relative)) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        yield entry
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk(directory, os.path.join(relative, entry.name))
+
+
+def tree_digest(
+    *paths: str,
+    extra: typing.Iterable[str] = (),
+    replacements: typing.Optional[typing.Mapping[str, str]] = None,
+    max_workers: typing.Optional[int] = None,
+) -> str:
+    """Return a sha256 over the contents and metadata of paths.
+
+    Paths can be directories or files. Paths that do not exist only
+    contribute their name.
+
+    File contents, names, modes, ownership, symlink targets, device numbers
+    and extended attributes are covered, modification times are not.
+    All replacements are applied to path names, symlink targets, the extra
+    strings and the contents of small files before hashing, so that e.g. a
+    build timestamp does not change the digest.
+
+    File contents are hashed by a pool of threads.
+    """
+    byte_replacements = {
+        k.encode("utf-8"): v.encode("utf-8") for (k, v) in (replacements or {}).items()
+    }
+
+    def normalized(value: str) -> bytes:
+        return _normalize(value.encode("utf-8", "surrogateescape"), byte_replacements)
+
+    h = hashlib.sha256()
+    for e in extra:
+        h.update(b"extra\0" + normalized(e) + b"\0")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for directory in paths:
+            h.update(b"path\0" + normalized(os.path.basename(directory)) + b"\0")
+            if os.path.isfile(directory):
+                h.update(_file_digest(directory, byte_replacements).encode("utf-8"))
+                continue
+            if not os.path.isdir(directory):
+                continue
+
+            records: typing.List[typing.Tuple[bytes, typing.Any]] = []
+            for entry in _walk(directory):
+                st = entry.stat(follow_symlinks=False)
+                rel = os.path.relpath(entry.path, directory)
+                record = normalized(
+                    f"{rel}\0{stat.S_IFMT(st.st_mode)}\0{stat.S_IMODE(st.st_mode)}\0"
+                    f"{st.st_uid}\0{st.st_gid}\0"
+                )
+                if stat.S_ISLNK(st.st_mode):
+                    record += normalized(os.readlink(entry.path))
+                elif stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+                    record += str(st.st_rdev).encode("utf-8")
+                for (name, value) in _xattrs(entry.path):
+                    record += b"\0" + name.encode("utf-8") + b"=" + value
+
+                content = (
+                    executor.submit(_file_digest, entry.path, byte_replacements)
+                    if stat.S_ISREG(st.st_mode)
+                    else None
+                )
+                records.append((record, content))
+
+            for (record, content) in records:
+                h.update(record + b"\0")
+                if content is not None:
+                    h.update(content.result().encode("utf-8"))
+                h.update(b"\n")
+
+    return h.hexdigest()
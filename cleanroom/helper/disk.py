@@ -11,14 +11,37 @@ from ..exceptions import GenerateError
 from ..printer import debug, trace, warn
 from .run import run
 
+import ctypes
+import ctypes.util
+import errno
+import fcntl
 import json
 import math
 import os
+import select
+import struct
 import subprocess
 from re import findall
 import stat
 import typing
-from time import sleep
+from time import monotonic, sleep
+
+
+# From linux/loop.h:
+_LOOP_SET_FD = 0x4C00
+_LOOP_CLR_FD = 0x4C01
+_LOOP_SET_STATUS64 = 0x4C04
+_LOOP_CONFIGURE = 0x4C0A
+_LOOP_CTL_GET_FREE = 0x4C82
+_LO_FLAGS_READ_ONLY = 1
+_LO_FLAGS_PARTSCAN = 8
+
+# From linux/inotify.h:
+_IN_ATTRIB = 0x00000004
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
 
 
 class Disk(typing.NamedTuple):
@@ -54,7 +77,66 @@ def is_block_device(path: str) -> bool:
         return False
 
 
+def _libc() -> typing.Optional[typing.Any]:
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1  # Make sure inotify is supported
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def _wait_for_block_device(path: str, timeout: float) -> bool:
+    """Wait for path to become a block device.
+
+    Uses inotify on the parent directory and falls back to polling."""
+    libc = _libc()
+    fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC) if libc else -1
+    if fd < 0:
+        return _wait_for_block_device_polling(path, timeout)
+
+    try:
+        if (
+            libc.inotify_add_watch(
+                fd,
+                os.path.dirname(path).encode("utf-8"),
+                _IN_CREATE | _IN_ATTRIB | _IN_MOVED_TO,
+            )
+            < 0
+        ):
+            return _wait_for_block_device_polling(path, timeout)
+
+        deadline = monotonic() + timeout
+        # Check after setting up the watch, so no event can get lost:
+        while not is_block_device(path):
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            if select.select([fd], [], [], remaining)[0]:
+                try:
+                    os.read(fd, 4096)
+                except BlockingIOError:
+                    pass
+        return True
+    finally:
+        os.close(fd)
+
+
+def _wait_for_block_device_polling(path: str, timeout: float) -> bool:
+    deadline = monotonic() + timeout
+    while not is_block_device(path):
+        if monotonic() > deadline:
+            return False
+        sleep(0.05)
+    return True
+
+
 def is_nbd_device_in_use(device: str, *, nbd_client_command: str = ""):
+    sys_directory = f"/sys/block/{os.path.basename(device)}"
+    if os.path.isdir(sys_directory):
+        # The kernel publishes the pid of the nbd server of connected devices:
+        return os.path.exists(os.path.join(sys_directory, "pid"))
+
     ret_val = True
     result = run(nbd_client_command or "nbd-client", "--check", device, returncode=None)
     if result.returncode == 1:
@@ -135,8 +217,18 @@ def _sfdisk_size(size: int) -> str:
 
 
 def create_image_file(
-    file_name: str, size: int, *, disk_format: str = "qcow2", qemu_img_command: str = ""
+    file_name: str,
+    size: int,
+    *,
+    disk_format: str = "qcow2",
+    qemu_img_command: str = "",
+    backing_file: str = "",
+    backing_format: str = "qcow2",
 ) -> None:
+    """Create an image file.
+
+    With a backing_file the new image only stores the changes made on top
+    of the backing file. size may be 0 to use the size of the backing file."""
     assert _is_root()
 
     if not os.path.exists(file_name):
@@ -147,14 +239,17 @@ def create_image_file(
         run("/usr/bin/chattr", "+C", file_name, returncode=None)
         trace(".... nocow attribtue set on file (if supported).")
 
+    backing_args = ["-b", backing_file, "-F", backing_format] if backing_file else []
+    size_args = [str(byte_size(size))] if size or not backing_file else []
     run(
         qemu_img_command or "/usr/bin/qemu-img",
         "create",
         "-q",
         "-f",
         disk_format,
+        *backing_args,
         file_name,
-        str(byte_size(size)),
+        *size_args,
     )
 
 
@@ -181,19 +276,114 @@ class Device:
     def close(self):
         self._device = ""
 
-    def wait_for_device_node(self, partition: typing.Optional[int] = None) -> bool:
+    def wait_for_device_node(
+        self, partition: typing.Optional[int] = None, *, timeout: float = 10.0
+    ) -> bool:
         dev = self.device(partition)
         trace(f'Waiting for "{dev}".')
-        for _ in range(20):
-            if is_block_device(dev):
-                return True
-            elif os.path.exists(dev):
-                warn(f'"{dev}" exists but is no block device!')
-            sleep(0.5)
+        if _wait_for_block_device(dev, timeout):
+            return True
+        if os.path.exists(dev):
+            warn(f'"{dev}" exists but is no block device!')
         debug(f"Could not find device node {dev}.")
         return False
 
 
+class LoopDevice(Device):
+    """A loop device for a raw image file.
+
+    Partitions on the image get their own device nodes."""
+
+    def __init__(self, file_name: str, *, read_only: bool = False) -> None:
+        assert os.path.isfile(file_name)
+
+        self._file_name = file_name
+        self._loop_fd = self._attach(file_name, read_only=read_only)
+        device = f"/dev/loop{os.minor(os.fstat(self._loop_fd).st_rdev)}"
+
+        super().__init__(device)
+
+        debug(f'Block device "{self._device}" created for file {self._file_name}.')
+
+    def __enter__(self) -> typing.Any:
+        return self
+
+    def __exit__(
+        self, exc_type: typing.Any, exc_val: typing.Any, exc_tb: typing.Any
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.device():
+            os.fsync(self._loop_fd)
+            try:
+                fcntl.ioctl(self._loop_fd, _LOOP_CLR_FD)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+            os.close(self._loop_fd)
+            trace(f"Detached {self._device} from file {self._file_name}.")
+            super().close()
+
+    def device(self, partition: typing.Optional[int] = None) -> str:
+        if partition is None:
+            return self._device
+        return f"{self._device}p{partition}"
+
+    def file_name(self) -> str:
+        return self._file_name
+
+    # Helpers:
+
+    @staticmethod
+    def _configure(loop_fd: int, file_fd: int, flags: int) -> None:
+        # struct loop_info64 with lo_flags set, all other fields zeroed:
+        info = struct.pack(
+            "=5Q4I64s64s32s2Q", 0, 0, 0, 0, 0, 0, 0, 0, flags, b"", b"", b"", 0, 0
+        )
+        # struct loop_config: fd, block_size, info and reserved space:
+        config = struct.pack("=II", file_fd, 0) + info + bytes(64)
+        try:
+            fcntl.ioctl(loop_fd, _LOOP_CONFIGURE, config)
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOTTY):
+                raise
+            # Kernels before 5.8 do not know LOOP_CONFIGURE:
+            fcntl.ioctl(loop_fd, _LOOP_SET_FD, file_fd)
+            fcntl.ioctl(loop_fd, _LOOP_SET_STATUS64, info)
+
+    @staticmethod
+    def _attach(file_name: str, *, read_only: bool) -> int:
+        assert _is_root()
+
+        mode = os.O_RDONLY if read_only else os.O_RDWR
+        flags = _LO_FLAGS_PARTSCAN | (_LO_FLAGS_READ_ONLY if read_only else 0)
+
+        file_fd = os.open(file_name, mode | os.O_CLOEXEC)
+        control_fd = os.open("/dev/loop-control", os.O_RDWR | os.O_CLOEXEC)
+        try:
+            for _ in range(32):
+                number = fcntl.ioctl(control_fd, _LOOP_CTL_GET_FREE)
+                device = f"/dev/loop{number}"
+                if not _wait_for_block_device(device, 10.0):
+                    raise GenerateError(f'Loop device "{device}" did not show up.')
+                loop_fd = os.open(device, mode | os.O_CLOEXEC)
+                try:
+                    LoopDevice._configure(loop_fd, file_fd, flags)
+                except OSError as e:
+                    os.close(loop_fd)
+                    if e.errno == errno.EBUSY:
+                        continue  # Someone else grabbed the device, try again
+                    raise
+                trace(f"Device {device} connected to file {file_name}.")
+                return loop_fd
+        finally:
+            os.close(control_fd)
+            os.close(file_fd)
+
+        raise GenerateError(f'Failed to find a free loop device for "{file_name}".')
+
+
 class NbdDevice(Device):
     @staticmethod
     def new_image_file(
@@ -352,6 +542,17 @@ class NbdDevice(Device):
         trace(f'"{device}" disconnected.')
 
 
+def attach_image(
+    file_name: str, *, disk_format: str = "raw", read_only: bool = False
+) -> Device:
+    """Make an image file available as block device.
+
+    Raw images use a loop device, everything else goes through nbd."""
+    if disk_format == "raw":
+        return LoopDevice(file_name, read_only=read_only)
+    return NbdDevice(file_name, disk_format=disk_format, read_only=read_only)
+
+
 def _nbd_device(counter: int) -> str:
     return "/dev/nbd" + str(counter)
 
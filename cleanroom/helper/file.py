@@ -9,13 +9,15 @@ from ..exceptions import GenerateError
 from ..printer import debug, info, trace, verbose
 from ..systemcontext import SystemContext
 from .group import GroupHelper
+from .reflink import copy_file, copy_tree
 from .user import UserHelper
 
-from distutils.dir_util import copy_tree
-
+import errno
+import fnmatch
 import glob
 import os
 import os.path
+import re
 import shutil
 import typing
 
@@ -90,14 +92,15 @@ def _check_file(
     work_directory: typing.Optional[str] = None,
 ) -> bool:
     """Run op on a file f."""
-    old_work_directory = os.getcwd()
+    # No chdir: That would affect all threads of the process.
     if work_directory is not None:
         work_directory = file_name(system_context, work_directory)
-        os.chdir(work_directory)
 
     to_test = f
     if os.path.isabs(f):
         to_test = file_name(system_context, f)
+    elif work_directory is not None:
+        to_test = os.path.join(work_directory, f)
 
     result = op(to_test)
 
@@ -105,9 +108,8 @@ def _check_file(
     if work_directory is None:
         trace(f"{description}: {to_test} = {result}")
     else:
-        trace(f"{description}: {to_test} (relative to {work_directory}) = {result}")
+        trace(f"{description}: {f} (relative to {work_directory}) = {result}")
 
-    os.chdir(old_work_directory)
     return result
 
 
@@ -145,11 +147,12 @@ def symlink(
     work_directory: typing.Optional[str] = None,
 ) -> None:
     """Create a symbolic link."""
-    if work_directory is not None:
-        os.chdir(file_name(system_context, work_directory))
-
     if os.path.isabs(destination):
         destination = file_name(system_context, destination)
+    elif work_directory is not None:
+        destination = os.path.join(
+            file_name(system_context, work_directory), destination
+        )
 
     if os.path.isdir(destination):
         destination = os.path.join(destination, os.path.basename(source))
@@ -385,18 +388,43 @@ def _file_op(
         op(s, d, **kwargs)
 
 
-def _copy_op(source: str, destination: str, **kwargs: typing.Any) -> None:
-    shutil.copyfile(source, destination, **kwargs)
+def _copy_op(
+    source: str, destination: str, *, preserve: bool = False, **kwargs: typing.Any
+) -> None:
+    copy_file(source, destination, preserve=preserve, **kwargs)
 
 
-def _recursive_copy_op(source: str, destination: str, **kwargs: typing.Any) -> None:
+def _recursive_copy_op(
+    source: str, destination: str, *, preserve: bool = False, **kwargs: typing.Any
+) -> None:
     if os.path.isdir(source):
         assert os.path.isdir(destination) or not os.path.exists(destination)
-        copy_tree(source, destination)
+        copy_tree(source, destination, preserve=preserve)
     else:
         assert not os.path.isdir(destination)
         assert not os.path.exists(destination)
-        shutil.copyfile(source, destination, **kwargs)
+        copy_file(source, destination, preserve=preserve, **kwargs)
+
+
+def _move_op(source: str, destination: str, **kwargs: typing.Any) -> None:
+    try:
+        os.rename(source, destination)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    # Different file systems or btrfs subvolumes: Copy and remove.
+    if os.path.isdir(source) and not os.path.islink(source):
+        copy_tree(source, destination, preserve=True)
+        shutil.rmtree(source)
+    else:
+        if os.path.isdir(destination) and not os.path.islink(destination):
+            raise OSError(f'Can not move "{source}": "{destination}" is a directory.')
+        if os.path.lexists(destination):
+            os.unlink(destination)
+        copy_file(source, destination, preserve=True, follow_symlinks=False)
+        os.unlink(source)
 
 
 def copy(
@@ -405,7 +433,12 @@ def copy(
     recursive: bool = False,
     **kwargs: typing.Any,
 ) -> None:
-    """Copy files."""
+    """Copy files.
+
+    File data is shared (reflinked) where the file system supports it.
+    Pass preserve=True to keep modes, times, ownership and extended
+    attributes.
+    """
     if recursive:
         return _file_op(
             system_context,
@@ -421,9 +454,143 @@ def move(
     system_context: typing.Optional[SystemContext], *args: str, **kwargs: typing.Any
 ) -> None:
     """Move files."""
-    return _file_op(
-        system_context, shutil.move, 'Moving "{}" to "{}".', *args, **kwargs
-    )
+    return _file_op(system_context, _move_op, 'Moving "{}" to "{}".', *args, **kwargs)
+
+
+class Removal(typing.NamedTuple):
+    pattern: str
+    recursive: bool = False
+    force: bool = False
+
+
+class _Component(typing.NamedTuple):
+    text: str
+    regex: typing.Optional[typing.Pattern[str]]  # None for literal names and "**"
+    is_recursive: bool = False  # "**" with recursive set
+
+    @property
+    def is_literal(self) -> bool:
+        return self.regex is None and not self.is_recursive
+
+    def matches(self, name: str) -> bool:
+        if self.is_literal:
+            return self.text == name
+        # Like glob: Wildcards do not match hidden files
+        if name.startswith(".") and not self.text.startswith("."):
+            return False
+        return self.regex is None or self.regex.match(name) is not None
+
+
+class _RemovalPattern(typing.NamedTuple):
+    removal: Removal
+    components: typing.Tuple[_Component, ...]
+
+
+def _compile_removal(root: str, path: str, removal: Removal) -> _RemovalPattern:
+    components: typing.List[_Component] = []
+    for c in os.path.relpath(path, root).split("/"):
+        if c == "**" and removal.recursive:
+            components.append(_Component(text=c, regex=None, is_recursive=True))
+        elif glob.has_magic(c):
+            components.append(
+                _Component(text=c, regex=re.compile(fnmatch.translate(c)))
+            )
+        else:
+            components.append(_Component(text=c, regex=None))
+    return _RemovalPattern(removal=removal, components=tuple(components))
+
+
+def _remove_match(path: str, removal: Removal) -> None:
+    trace(f'Removing "{path}" (matched "{removal.pattern}").')
+    if not os.path.exists(path):  # Dangling symlink
+        if removal.force:
+            return
+        raise GenerateError(f'Failed to delete: "{path}" does not exist.')
+    if os.path.isdir(path) and not os.path.islink(path):
+        if removal.recursive:
+            shutil.rmtree(path)
+        else:
+            os.rmdir(path)
+    else:
+        try:
+            os.unlink(path)
+        except Exception:
+            if not removal.force:
+                raise
+            verbose(f'Failed to unlink "{path}".')
+
+
+def _prune(
+    directory: str, states: typing.List[typing.Tuple[_RemovalPattern, int]]
+) -> None:
+    # "**" matches zero directories, too:
+    expanded: typing.List[typing.Tuple[_RemovalPattern, int]] = []
+    for (p, i) in states:
+        expanded.append((p, i))
+        while p.components[i].is_recursive and i + 1 < len(p.components):
+            i += 1
+            expanded.append((p, i))
+
+    if all(p.components[i].is_literal for (p, i) in expanded):
+        # Only literal names: No need to list the directory.
+        names = sorted(
+            {
+                p.components[i].text
+                for (p, i) in expanded
+                if os.path.lexists(os.path.join(directory, p.components[i].text))
+            }
+        )
+    else:
+        try:
+            names = sorted(os.listdir(directory))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+
+    for name in names:
+        path = os.path.join(directory, name)
+        child_states: typing.List[typing.Tuple[_RemovalPattern, int]] = []
+        recursing_states: typing.List[typing.Tuple[_RemovalPattern, int]] = []
+        removed = False
+        for (p, i) in expanded:
+            if not p.components[i].matches(name):
+                continue
+            # Like glob: A trailing "**" matches the directory itself, too.
+            if i + 1 == len(p.components) or (
+                all(c.is_recursive for c in p.components[i + 1 :])
+                and os.path.isdir(path)
+            ):
+                _remove_match(path, p.removal)
+                removed = True
+                break
+            child_states.append((p, i + 1))
+            if p.components[i].is_recursive:
+                recursing_states.append((p, i))
+
+        if removed or not os.path.isdir(path):
+            continue
+        # Like glob: Follow symlinks, but not while recursing into "**":
+        if not os.path.islink(path):
+            child_states += recursing_states
+        if child_states:
+            _prune(path, child_states)
+
+
+def remove_all(system_context: SystemContext, *removals: Removal) -> None:
+    """Remove all files matching any of the removals inside the system.
+
+    Unlike running remove for each pattern, this walks the file system only
+    once, visiting only directories that can contain matches. The result is
+    the same as running remove for each pattern.
+    """
+    root = file_name(system_context, "/")
+    patterns = [
+        _compile_removal(root, path, r)
+        for (path, r) in ((file_name(system_context, r.pattern), r) for r in removals)
+        if path != root
+    ]
+    debug(f"Removing {len(patterns)} patterns in one pass.")
+    if patterns:
+        _prune(root, [(p, 0) for p in patterns])
 
 
 def remove(
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Cache data parsed from files until the files change.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import trace
+
+import os
+import threading
+import typing
+
+
+T = typing.TypeVar("T")
+
+_Stamp = typing.Tuple[int, int, int, int]
+
+
+def _stamp(path: str) -> typing.Optional[_Stamp]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class FileCache(typing.Generic[T]):
+    """Parse files once and hand out the result until the file changes.
+
+    A file counts as changed when its inode, size or modification time
+    differs from when it was parsed. Tools that rewrite files in place
+    within the same timestamp tick should invalidate the cache explicitly.
+    """
+
+    def __init__(self, parse: typing.Callable[[str], T]) -> None:
+        self._parse = parse
+        self._lock = threading.Lock()
+        self._entries: typing.Dict[str, typing.Tuple[_Stamp, T]] = {}
+
+    def get(self, path: str) -> typing.Optional[T]:
+        """Return the parsed contents of path or None if path does not exist."""
+        stamp = _stamp(path)
+        if stamp is None:
+            self.invalidate(path)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+
+        trace(f'Parsing "{path}".')
+        data = self._parse(path)
+        with self._lock:
+            self._entries[path] = (stamp, data)
+        return data
+
+    def invalidate(self, path: str = "") -> None:
+        """Forget about path (or about all files)."""
+        with self._lock:
+            if path:
+                self._entries.pop(path, None)
+            else:
+                self._entries.clear()
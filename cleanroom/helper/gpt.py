@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Write GUID partition tables.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..exceptions import GenerateError
+
+import os
+import struct
+import typing
+import uuid
+import zlib
+
+
+SECTOR_SIZE = 512
+ALIGNMENT = 1024 * 1024  # 1 MiB
+
+_ENTRY_COUNT = 128
+_ENTRY_SIZE = 128
+_ENTRIES_SECTORS = (_ENTRY_COUNT * _ENTRY_SIZE) // SECTOR_SIZE
+_HEADER_FORMAT = "<8sIIIIQQQQ16sQIII"
+_ENTRY_FORMAT = "<16s16sQQQ72s"
+
+
+# Partition type GUIDs, as used by the discoverable partitions specification:
+ESP_TYPE = uuid.UUID("c12a7328-f81f-11d2-ba4b-00a0c93ec93b")
+ROOT_X86_64_TYPE = uuid.UUID("4f68bce3-e8cd-4db1-96e7-fbcaf984b709")
+ROOT_X86_64_VERITY_TYPE = uuid.UUID("2c7357ed-ebd2-46d9-aec1-23d437ec2bf5")
+
+
+class Partition(typing.NamedTuple):
+    type: uuid.UUID
+    size: int
+    uuid: uuid.UUID
+    label: str = ""
+
+
+class PlacedPartition(typing.NamedTuple):
+    partition: Partition
+    offset: int  # in bytes
+    size: int  # in bytes, rounded up to full sectors
+
+
+def _align(value: int, alignment: int) -> int:
+    return ((value + alignment - 1) // alignment) * alignment
+
+
+def layout(
+    partitions: typing.Sequence[Partition],
+) -> typing.Tuple[int, typing.List[PlacedPartition]]:
+    """Place partitions on 1MiB boundaries.
+
+    Returns the size of the disk image and the placed partitions.
+    """
+    if len(partitions) > _ENTRY_COUNT:
+        raise GenerateError(f"A GPT can hold at most {_ENTRY_COUNT} partitions.")
+
+    offset = ALIGNMENT
+    placed: typing.List[PlacedPartition] = []
+    for p in partitions:
+        size = _align(p.size, SECTOR_SIZE)
+        placed.append(PlacedPartition(partition=p, offset=offset, size=size))
+        offset = _align(offset + size, ALIGNMENT)
+
+    # Leave room for the backup GPT:
+    return (offset + ALIGNMENT, placed)
+
+
+def _protective_mbr(total_sectors: int) -> bytes:
+    entry = struct.pack(
+        "<B3sB3sII",
+        0x00,
+        b"\x00\x02\x00",
+        0xEE,
+        b"\xff\xff\xff",
+        1,
+        min(total_sectors - 1, 0xFFFFFFFF),
+    )
+    return bytes(446) + entry + bytes(48) + b"\x55\xaa"
+
+
+def _entries(placed: typing.Sequence[PlacedPartition]) -> bytes:
+    result = b""
+    for p in placed:
+        result += struct.pack(
+            _ENTRY_FORMAT,
+            p.partition.type.bytes_le,
+            p.partition.uuid.bytes_le,
+            p.offset // SECTOR_SIZE,
+            (p.offset + p.size) // SECTOR_SIZE - 1,
+            0,
+            p.partition.label.encode("utf-16-le")[:72],
+        )
+    return result.ljust(_ENTRY_COUNT * _ENTRY_SIZE, b"\0")
+
+
+def _header(
+    *,
+    current_lba: int,
+    backup_lba: int,
+    last_usable_lba: int,
+    disk_uuid: uuid.UUID,
+    entries_lba: int,
+    entries_crc: int,
+) -> bytes:
+    def pack(crc: int) -> bytes:
+        return struct.pack(
+            _HEADER_FORMAT,
+            b"EFI PART",
+            0x00010000,
+            struct.calcsize(_HEADER_FORMAT),
+            crc,
+            0,
+            current_lba,
+            backup_lba,
+            2 + _ENTRIES_SECTORS,
+            last_usable_lba,
+            disk_uuid.bytes_le,
+            entries_lba,
+            _ENTRY_COUNT,
+            _ENTRY_SIZE,
+            entries_crc,
+        )
+
+    return pack(zlib.crc32(pack(0))).ljust(SECTOR_SIZE, b"\0")
+
+
+def write_gpt(
+    fd: int,
+    total_size: int,
+    placed: typing.Sequence[PlacedPartition],
+    *,
+    disk_uuid: uuid.UUID,
+) -> None:
+    """Write protective MBR, primary and backup GPT into fd.
+
+    The file behind fd must already be total_size bytes big.
+    """
+    assert total_size % SECTOR_SIZE == 0
+
+    total_sectors = total_size // SECTOR_SIZE
+    last_lba = total_sectors - 1
+    backup_entries_lba = last_lba - _ENTRIES_SECTORS
+    last_usable_lba = backup_entries_lba - 1
+
+    for p in placed:
+        if (p.offset + p.size) // SECTOR_SIZE - 1 > last_usable_lba:
+            raise GenerateError(
+                f'Partition "{p.partition.label}" does not fit into the disk image.'
+            )
+
+    entries = _entries(placed)
+    entries_crc = zlib.crc32(entries)
+
+    primary = _header(
+        current_lba=1,
+        backup_lba=last_lba,
+        last_usable_lba=last_usable_lba,
+        disk_uuid=disk_uuid,
+        entries_lba=2,
+        entries_crc=entries_crc,
+    )
+    backup = _header(
+        current_lba=last_lba,
+        backup_lba=1,
+        last_usable_lba=last_usable_lba,
+        disk_uuid=disk_uuid,
+        entries_lba=backup_entries_lba,
+        entries_crc=entries_crc,
+    )
+
+    os.pwrite(fd, _protective_mbr(total_sectors) + primary + entries, 0)
+    os.pwrite(fd, entries + backup, backup_entries_lba * SECTOR_SIZE)
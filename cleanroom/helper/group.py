@@ -5,7 +5,8 @@
 """
 
 
-from .run import run
+from .accounts import transaction
+from .filecache import FileCache
 
 import os
 import typing
@@ -18,30 +19,51 @@ class Group(typing.NamedTuple):
     members: typing.List[str]
 
 
-def _group_data(group_file: str, name: str) -> typing.Optional[Group]:
-    if not os.path.exists(group_file):
-        return None
+class _Groups(typing.NamedTuple):
+    by_name: typing.Dict[str, Group]
+    by_gid: typing.Dict[int, Group]
+
 
+def _parse_group(group_file: str) -> _Groups:
+    groups = _Groups(by_name={}, by_gid={})
     with open(group_file, "r") as group:
         for line in group:
             if line.endswith("\n"):
                 line = line[:-1]
             current_group: typing.Any = line.split(":")
-            if current_group[0] == name:
-                current_group[2] = int(current_group[2])
-                if current_group[3] == "":
-                    current_group[3] = []
-                else:
-                    current_group[3] = list(current_group[3].split(","))
-                return Group(*current_group)
-    return Group("nobody", "x", 65534, [])
+            if len(current_group) != 4 or current_group[0] in groups.by_name:
+                continue
+            current_group[2] = int(current_group[2])
+            if current_group[3] == "":
+                current_group[3] = []
+            else:
+                current_group[3] = list(current_group[3].split(","))
+            g = Group(*current_group)
+            groups.by_name[g.name] = g
+            groups.by_gid.setdefault(g.gid, g)
+    return groups
 
 
-class GroupHelper:
-    def __init__(self, add_command: str, mod_command: str) -> None:
-        self._add_command = add_command
-        self._mod_command = mod_command
+_group_cache = FileCache(_parse_group)
+
+
+def _group_file(root_directory: str) -> str:
+    return os.path.join(root_directory, "etc/group")
+
+
+def invalidate_group_cache(root_directory: str) -> None:
+    """Re-read the group file of root_directory on next access."""
+    _group_cache.invalidate(_group_file(root_directory))
+
+
+def _group_data(group_file: str, name: str) -> typing.Optional[Group]:
+    groups = _group_cache.get(group_file)
+    if groups is None:
+        return None
+    return groups.by_name.get(name, Group("nobody", "x", 65534, []))
+
 
+class GroupHelper:
     def groupadd(
         self,
         group_name: str,
@@ -51,24 +73,29 @@ class GroupHelper:
         system: bool = False,
         root_directory: str
     ) -> bool:
-        """Execute command."""
-        command_line = [self._add_command, "--root", root_directory, group_name]
+        """Add a group.
 
-        if gid >= 0:
-            command_line += ["--gid", str(gid)]
+        The change is written right away, unless an accounts transaction
+        for root_directory is active.
+        """
+        with transaction(root_directory) as accounts:
+            accounts.groupadd(group_name, gid=gid, force=force, system=system)
+        invalidate_group_cache(root_directory)
+        return True
 
-        if force:
-            command_line += ["--force"]
-
-        if system:
-            command_line += ["--system"]
+    @staticmethod
+    def group_data(name: str, *, root_directory: str) -> typing.Optional[Group]:
+        """Get group data from group file.
 
-        return run(*command_line).returncode == 0
+        The group file is parsed once and cached until it changes.
+        """
+        return _group_data(_group_file(root_directory), name)
 
     @staticmethod
-    def group_data(name: str, *, root_directory: str) -> typing.Optional[Group]:
-        """Get group data from group file."""
-        return _group_data(os.path.join(root_directory, "etc/group"), name)
+    def group_data_by_gid(gid: int, *, root_directory: str) -> typing.Optional[Group]:
+        """Get group data of the (first) group with gid from group file."""
+        groups = _group_cache.get(_group_file(root_directory))
+        return None if groups is None else groups.by_gid.get(gid)
 
     def groupmod(
         self,
@@ -79,16 +106,12 @@ class GroupHelper:
         rename: str = "",
         root_directory: str = ""
     ) -> bool:
-        """Modify an existing group."""
-        command_line = [self._mod_command, "--root", root_directory, group_name]
-
-        if gid >= 0:
-            command_line += ["--gid", str(gid)]
-
-        if rename:
-            command_line += ["--new-name", rename]
-
-        if password:
-            command_line += ["--password", password]
-
-        return run(*command_line).returncode == 0
+        """Modify an existing group.
+
+        The change is written right away, unless an accounts transaction
+        for root_directory is active.
+        """
+        with transaction(root_directory) as accounts:
+            accounts.groupmod(group_name, gid=gid, password=password, rename=rename)
+        invalidate_group_cache(root_directory)
+        return True
@@ -0,0 +1,513 @@
+# -*- coding: utf-8 -*-
+"""Share data between files (reflinks) where the filesystem supports it.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import debug, trace
+
+from concurrent.futures import ThreadPoolExecutor
+import errno
+import fcntl
+import os
+import shutil
+import stat
+import struct
+import typing
+
+
+# From linux/fs.h:
+_FICLONE = 0x40049409
+_FICLONERANGE = 0x4020940D
+
+_COPY_CHUNK_SIZE = 16 * 1024 * 1024
+
+# errnos signaling that the filesystem (combination) can not share data:
+_NOT_SUPPORTED = (
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EXDEV,
+)
+
+
+def _clone(src_fd: int, dst_fd: int) -> bool:
+    try:
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in _NOT_SUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _clone_range(
+    src_fd: int, dst_fd: int, *, src_offset: int, dst_offset: int, length: int
+) -> bool:
+    try:
+        fcntl.ioctl(
+            dst_fd,
+            _FICLONERANGE,
+            struct.pack("qQQQ", src_fd, src_offset, length, dst_offset),
+        )
+    except OSError as e:
+        if e.errno in _NOT_SUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _copy_file_range(
+    src_fd: int, dst_fd: int, *, src_offset: int, dst_offset: int, length: int
+) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    done = 0
+    while done < length:
+        try:
+            count = os.copy_file_range(  # type: ignore
+                src_fd,
+                dst_fd,
+                min(length - done, _COPY_CHUNK_SIZE),
+                src_offset + done,
+                dst_offset + done,
+            )
+        except OSError as e:
+            if done == 0 and e.errno in _NOT_SUPPORTED:
+                return False
+            raise
+        if count == 0:
+            break  # EOF of source
+        done += count
+    return True
+
+
+def _copy_range(
+    src_fd: int, dst_fd: int, *, src_offset: int, dst_offset: int, length: int
+) -> None:
+    done = 0
+    while done < length:
+        data = os.pread(src_fd, min(length - done, _COPY_CHUNK_SIZE), src_offset + done)
+        if not data:
+            break  # EOF of source
+        os.pwrite(dst_fd, data, dst_offset + done)
+        done += len(data)
+
+
+def _copy_unshared(
+    src_fd: int, dst_fd: int, *, src_offset: int, dst_offset: int, length: int
+) -> str:
+    if _copy_file_range(
+        src_fd, dst_fd, src_offset=src_offset, dst_offset=dst_offset, length=length
+    ):
+        return "copy_file_range"
+    _copy_range(
+        src_fd, dst_fd, src_offset=src_offset, dst_offset=dst_offset, length=length
+    )
+    return "copy"
+
+
+def copy_range(
+    src_fd: int,
+    dst_fd: int,
+    *,
+    src_offset: int = 0,
+    dst_offset: int = 0,
+    length: int,
+) -> str:
+    """Copy length bytes between two open files as cheap as possible.
+
+    Tries to reflink the range first, then copy_file_range (which can do
+    server-side copies and reflinks on some filesystems) and falls back to
+    reading and writing. Reflinks need block aligned offsets, so an unaligned
+    tail of the range is copied.
+
+    Returns the method used for the bulk of the data: "reflink",
+    "copy_file_range" or "copy".
+    """
+    block_size = os.fstat(dst_fd).st_blksize or 4096
+    aligned = length - (length % block_size)
+
+    if (
+        aligned > 0
+        and src_offset % block_size == 0
+        and dst_offset % block_size == 0
+        and _clone_range(
+            src_fd,
+            dst_fd,
+            src_offset=src_offset,
+            dst_offset=dst_offset,
+            length=aligned,
+        )
+    ):
+        method = "reflink"
+        if aligned < length:
+            _copy_unshared(
+                src_fd,
+                dst_fd,
+                src_offset=src_offset + aligned,
+                dst_offset=dst_offset + aligned,
+                length=length - aligned,
+            )
+    else:
+        method = _copy_unshared(
+            src_fd, dst_fd, src_offset=src_offset, dst_offset=dst_offset, length=length
+        )
+
+    trace(
+        f"Copied {length} bytes from offset {src_offset} to {dst_offset} using {method}."
+    )
+    return method
+
+
+def copy_file_into(
+    source: str, destination_fd: int, *, offset: int = 0
+) -> typing.Tuple[int, str]:
+    """Copy all of source into destination_fd at offset.
+
+    Returns the number of bytes copied and the method used.
+    """
+    with open(source, "rb") as src:
+        size = os.fstat(src.fileno()).st_size
+        method = copy_range(
+            src.fileno(), destination_fd, dst_offset=offset, length=size
+        )
+    return (size, method)
+
+
+def clone_file(source: str, destination: str) -> str:
+    """Copy source to destination, sharing data where possible.
+
+    Returns the method used.
+    """
+    with open(destination, "wb") as dst:
+        _, method = copy_file_into(source, dst.fileno())
+    return method
+
+
+def _copy_data(source: str, destination: str) -> str:
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        if _clone(src.fileno(), dst.fileno()):
+            return "reflink"
+        return copy_range(
+            src.fileno(), dst.fileno(), length=os.fstat(src.fileno()).st_size
+        )
+
+
+def _copy_xattrs(source: str, destination: str) -> None:
+    for name in os.listxattr(source, follow_symlinks=False):
+        try:
+            os.setxattr(
+                destination,
+                name,
+                os.getxattr(source, name, follow_symlinks=False),
+                follow_symlinks=False,
+            )
+        except OSError as e:
+            if e.errno not in (errno.ENOTSUP, errno.ENODATA, errno.EINVAL, errno.EPERM):
+                raise
+
+
+def _copy_metadata(
+    source: str, destination: str, st: os.stat_result, *, preserve: bool
+) -> None:
+    if preserve:
+        # Chown first: It drops setuid/setgid bits.
+        os.chown(destination, st.st_uid, st.st_gid, follow_symlinks=False)
+        _copy_xattrs(source, destination)
+    if not stat.S_ISLNK(st.st_mode):
+        os.chmod(destination, stat.S_IMODE(st.st_mode))
+    os.utime(
+        destination, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False
+    )
+
+
+def copy_file(
+    source: str,
+    destination: str,
+    *,
+    preserve: bool = False,
+    follow_symlinks: bool = True,
+) -> str:
+    """Copy source to destination, sharing data where possible.
+
+    Like shutil.copyfile, but tries a reflink and copy_file_range before
+    copying the data. Mode, times, ownership and extended attributes are
+    copied, too, if preserve is set.
+
+    Returns the method used.
+    """
+    if not follow_symlinks and os.path.islink(source):
+        os.symlink(os.readlink(source), destination)
+        method = "symlink"
+    else:
+        method = _copy_data(source, destination)
+    if preserve:
+        _copy_metadata(
+            source,
+            destination,
+            os.stat(source, follow_symlinks=follow_symlinks),
+            preserve=True,
+        )
+    trace(f'Copied "{source}" to "{destination}" using {method}.')
+    return method
+
+
+def _copy_entry(
+    source: str, destination: str, st: os.stat_result, *, preserve: bool
+) -> str:
+    if os.path.lexists(destination):
+        os.unlink(destination)
+    if stat.S_ISLNK(st.st_mode):
+        os.symlink(os.readlink(source), destination)
+        method = "symlink"
+    elif stat.S_ISREG(st.st_mode):
+        method = _copy_data(source, destination)
+    else:
+        os.mknod(destination, st.st_mode, st.st_rdev)
+        method = "mknod"
+    _copy_metadata(source, destination, st, preserve=preserve)
+    return method
+
+
+def copy_tree(
+    source: str,
+    destination: str,
+    *,
+    preserve: bool = False,
+    max_workers: typing.Optional[int] = None,
+) -> typing.Dict[str, int]:
+    """Copy the directory source into destination.
+
+    Existing directories are merged, existing files are replaced. Symlinks
+    are copied as symlinks. Modes and times are always kept, ownership and
+    extended attributes only if preserve is set.
+
+    Files are copied by a pool of threads, sharing data where possible.
+
+    Returns how many entries were copied using which method.
+    """
+    directories: typing.List[typing.Tuple[str, str]] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for (root, dirs, files) in os.walk(source):
+            target = os.path.normpath(
+                os.path.join(destination, os.path.relpath(root, source))
+            )
+            os.makedirs(target, exist_ok=True)
+            directories.append((root, target))
+
+            for name in dirs + files:
+                src = os.path.join(root, name)
+                st = os.lstat(src)
+                if stat.S_ISDIR(st.st_mode):
+                    continue  # handled by os.walk
+                futures.append(
+                    executor.submit(
+                        _copy_entry,
+                        src,
+                        os.path.join(target, name),
+                        st,
+                        preserve=preserve,
+                    )
+                )
+
+        methods: typing.Dict[str, int] = {}
+        for f in futures:
+            method = f.result()
+            methods[method] = methods.get(method, 0) + 1
+
+    # Set directory metadata last, deepest first, so the times stick:
+    for (src, target) in reversed(directories):
+        _copy_metadata(src, target, os.lstat(src), preserve=preserve)
+
+    debug(f'Copied "{source}" to "{destination}": {methods}.')
+    return methods
+
+
+def _same_contents(source: str, destination: str) -> bool:
+    with open(source, "rb") as src, open(destination, "rb") as dst:
+        while True:
+            data = src.read(_COPY_CHUNK_SIZE)
+            if data != dst.read(_COPY_CHUNK_SIZE):
+                return False
+            if not data:
+                return True
+
+
+def _xattrs(path: str) -> typing.Dict[str, bytes]:
+    try:
+        return {
+            name: os.getxattr(path, name, follow_symlinks=False)
+            for name in os.listxattr(path, follow_symlinks=False)
+        }
+    except OSError as e:
+        if e.errno in (errno.ENOTSUP, errno.ENODATA):
+            return {}
+        raise
+
+
+def _is_unchanged(
+    source: str,
+    destination: str,
+    src_st: os.stat_result,
+    dst_st: os.stat_result,
+    *,
+    preserve: bool,
+    compare_contents: bool,
+) -> bool:
+    if (
+        src_st.st_mode != dst_st.st_mode
+        or src_st.st_size != dst_st.st_size
+        or src_st.st_mtime_ns != dst_st.st_mtime_ns
+    ):
+        return False
+    if preserve and (
+        (src_st.st_uid, src_st.st_gid) != (dst_st.st_uid, dst_st.st_gid)
+        or _xattrs(source) != _xattrs(destination)
+    ):
+        return False
+    if stat.S_ISLNK(src_st.st_mode):
+        return os.readlink(source) == os.readlink(destination)
+    if stat.S_ISREG(src_st.st_mode):
+        return not compare_contents or _same_contents(source, destination)
+    return src_st.st_rdev == dst_st.st_rdev
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def _sync_entry(
+    source: str,
+    destination: str,
+    st: os.stat_result,
+    *,
+    preserve: bool,
+    compare_contents: bool,
+) -> str:
+    try:
+        dst_st = os.lstat(destination)
+    except FileNotFoundError:
+        pass
+    else:
+        if _is_unchanged(
+            source,
+            destination,
+            st,
+            dst_st,
+            preserve=preserve,
+            compare_contents=compare_contents,
+        ):
+            return "unchanged"
+        if stat.S_ISDIR(dst_st.st_mode):
+            shutil.rmtree(destination)
+    return _copy_entry(source, destination, st, preserve=preserve)
+
+
+def _sync_link(destination: str, first: str) -> str:
+    """Make destination a hard link to first."""
+    first_st = os.lstat(first)
+    try:
+        dst_st = os.lstat(destination)
+    except FileNotFoundError:
+        pass
+    else:
+        if (dst_st.st_dev, dst_st.st_ino) == (first_st.st_dev, first_st.st_ino):
+            return "unchanged"
+        _remove(destination)
+    os.link(first, destination, follow_symlinks=False)
+    return "hardlink"
+
+
+def sync_tree(
+    source: str,
+    destination: str,
+    *,
+    preserve: bool = False,
+    compare_contents: bool = False,
+    max_workers: typing.Optional[int] = None,
+) -> typing.Dict[str, int]:
+    """Make destination an exact copy of the directory source.
+
+    Unlike copy_tree this only touches what differs: Entries missing in
+    source get removed, entries whose type, size, mtime, mode (or ownership
+    and extended attributes with preserve set) differ get copied and
+    everything else is left alone.
+    With compare_contents set, regular files that look the same are compared
+    byte by byte, too. Hard links within source stay hard links in
+    destination.
+
+    Syncing into a snapshot of an older copy of source thus only writes the
+    changed files, the rest keeps sharing data with the snapshot.
+
+    Returns how many entries were handled in which way.
+    """
+    directories: typing.List[typing.Tuple[str, str]] = []
+    removed = 0
+    # Destination of the first entry seen for each (st_dev, st_ino) that has
+    # several links and the later entries that need to link to it:
+    first_links: typing.Dict[typing.Tuple[int, int], str] = {}
+    links: typing.List[typing.Tuple[str, str]] = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        for (root, dirs, files) in os.walk(source):
+            target = os.path.normpath(
+                os.path.join(destination, os.path.relpath(root, source))
+            )
+            if os.path.lexists(target) and (
+                os.path.islink(target) or not os.path.isdir(target)
+            ):
+                os.unlink(target)
+            os.makedirs(target, exist_ok=True)
+            directories.append((root, target))
+
+            for name in set(os.listdir(target)) - set(dirs + files):
+                _remove(os.path.join(target, name))
+                removed += 1
+
+            for name in dirs + files:
+                src = os.path.join(root, name)
+                st = os.lstat(src)
+                if stat.S_ISDIR(st.st_mode):
+                    continue  # handled by os.walk
+                dst = os.path.join(target, name)
+                if st.st_nlink > 1:
+                    key = (st.st_dev, st.st_ino)
+                    if key in first_links:
+                        links.append((dst, first_links[key]))
+                        continue
+                    first_links[key] = dst
+                futures.append(
+                    executor.submit(
+                        _sync_entry,
+                        src,
+                        dst,
+                        st,
+                        preserve=preserve,
+                        compare_contents=compare_contents,
+                    )
+                )
+
+        methods: typing.Dict[str, int] = {"removed": removed} if removed else {}
+        for f in futures:
+            method = f.result()
+            methods[method] = methods.get(method, 0) + 1
+
+    # Link only once all first copies are in place:
+    for (dst, first) in links:
+        method = _sync_link(dst, first)
+        methods[method] = methods.get(method, 0) + 1
+
+    for (src, target) in reversed(directories):
+        _copy_metadata(src, target, os.lstat(src), preserve=preserve)
+
+    debug(f'Synced "{source}" into "{destination}": {methods}.')
+    return methods
@@ -8,7 +8,6 @@
 from cleanroom.exceptions import GenerateError
 from cleanroom.printer import trace
 
-import os
 import subprocess
 import typing
 
@@ -55,9 +54,6 @@ def run(
     **kwargs: typing.Any,
 ) -> subprocess.CompletedProcess:
     """Run command and trace the external command result and output."""
-    if work_directory is not None:
-        os.chdir(work_directory)
-
     if shell:
         args = ("/usr/bin/bash", "-c", _quote_args(*args))
     if chroot is not None:
@@ -87,6 +83,7 @@ def run(
             args,
             stdout=stdout_fd or subprocess.PIPE,
             stderr=stdout_fd or subprocess.PIPE,
+            cwd=work_directory,
             **kwargs,
         )
     except subprocess.TimeoutExpired as to:
@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*-
+"""Edit files with sed scripts without running sed.
+
+The subset of sed understood here is a single command with an optional
+address:
+
+    [ADDRESS[!]] s/REGEX/REPLACEMENT/[g|I|N]...
+    [ADDRESS[!]] c TEXT
+    [ADDRESS[!]] a TEXT
+    [ADDRESS[!]] i TEXT
+    [ADDRESS[!]] d
+
+where ADDRESS is a line number, "$" or /REGEX/ (or \\%REGEX%). Regular
+expressions are POSIX basic regular expressions with the GNU extensions.
+Anything else is handed to the sed binary.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..exceptions import GenerateError
+from ..printer import debug, trace
+from .run import run
+
+from contextlib import contextmanager
+import os
+import re
+import typing
+
+
+_POSIX_CLASSES = {
+    "alnum": "a-zA-Z0-9",
+    "alpha": "a-zA-Z",
+    "blank": " \\t",
+    "cntrl": "\\x00-\\x1f\\x7f",
+    "digit": "0-9",
+    "graph": "\\x21-\\x7e",
+    "lower": "a-z",
+    "print": "\\x20-\\x7e",
+    "punct": "!-/:-@\\[-`{-~",
+    "space": " \\t\\n\\r\\f\\v",
+    "upper": "A-Z",
+    "xdigit": "0-9A-Fa-f",
+}
+
+
+# GNU escapes for single characters:
+_CHARACTER_ESCAPES = {
+    "a": "\a",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "v": "\v",
+}
+# GNU escapes producing characters by number (\cX, \dNNN, \oNNN, \xHH):
+_NUMERIC_ESCAPES = "cdox"
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _bracket(pattern: str, pos: int) -> typing.Tuple[str, int]:
+    """Translate the bracket expression starting at pattern[pos] ("[")."""
+    result = "["
+    pos += 1
+    if pos < len(pattern) and pattern[pos] == "^":
+        result += "^"
+        pos += 1
+    if pos < len(pattern) and pattern[pos] == "]":
+        result += "\\]"
+        pos += 1
+    while pos < len(pattern):
+        c = pattern[pos]
+        if c == "]":
+            return (result + "]", pos + 1)
+        if c == "[" and pattern.startswith(("[=", "[."), pos):
+            raise _Unsupported()  # Equivalence classes and collating symbols
+        if c == "[" and pattern.startswith("[:", pos):
+            end = pattern.find(":]", pos + 2)
+            if end < 0 or pattern[pos + 2 : end] not in _POSIX_CLASSES:
+                raise _Unsupported()
+            result += _POSIX_CLASSES[pattern[pos + 2 : end]]
+            pos = end + 2
+            continue
+        if c in "\\[":
+            result += "\\" + c
+        else:
+            result += c
+        pos += 1
+    raise GenerateError(f'Unterminated bracket expression in "{pattern}".')
+
+
+def _regex(pattern: str, flags: int = 0) -> typing.Pattern[str]:
+    """Translate a POSIX basic regular expression (with GNU extensions)."""
+    result = ""
+    pos = 0
+    # Where "*" and "^" are special in a BRE:
+    at_start = True
+    while pos < len(pattern):
+        c = pattern[pos]
+        start, at_start = at_start, False
+        if c == "\\" and pos + 1 < len(pattern):
+            n = pattern[pos + 1]
+            pos += 2
+            if n == "|":
+                # POSIX alternation picks the longest match, python the first.
+                raise _Unsupported()
+            if n == "(":
+                result += n
+                at_start = True
+            elif n in "){}+?":
+                result += n
+            elif n.isdigit() or n in "sSwWbB":
+                result += "\\" + n
+            elif n in "<>":
+                result += "\\b"
+            elif n == "`":
+                result += "\\A"
+            elif n == "'":
+                result += "\\Z"
+            elif n in _CHARACTER_ESCAPES:
+                result += "\\" + n
+            elif n in _NUMERIC_ESCAPES:
+                raise _Unsupported()
+            else:
+                result += re.escape(n)
+            continue
+
+        pos += 1
+        if c == "[":
+            (bracket, pos) = _bracket(pattern, pos - 1)
+            result += bracket
+        elif c == ".":
+            result += "."
+        elif c == "*":
+            result += "\\*" if start else "*"
+        elif c == "^":
+            if start:
+                result += "^"
+                at_start = True
+            else:
+                result += "\\^"
+        elif c == "$":
+            at_end = pos == len(pattern) or pattern.startswith(("\\)", "\\|"), pos)
+            result += "$" if at_end else "\\$"
+        else:
+            result += re.escape(c)
+
+    try:
+        return re.compile(result, flags)
+    except re.error as e:
+        raise GenerateError(f'Invalid regular expression "{pattern}": {e}.')
+
+
+def _replacement(text: str) -> typing.List[typing.Union[str, int]]:
+    """Split a s replacement into literal strings and group numbers."""
+    parts: typing.List[typing.Union[str, int]] = []
+    literal = ""
+    pos = 0
+    while pos < len(text):
+        c = text[pos]
+        pos += 1
+        if c == "&":
+            parts += [literal, 0]
+            literal = ""
+        elif c == "\\" and pos < len(text):
+            n = text[pos]
+            pos += 1
+            if n.isdigit():
+                parts += [literal, int(n)]
+                literal = ""
+            elif n in "LlUuE" or n in _NUMERIC_ESCAPES:
+                raise _Unsupported()
+            else:
+                literal += _CHARACTER_ESCAPES.get(n, n)
+        else:
+            literal += c
+    parts.append(literal)
+    return [p for p in parts if p != ""]
+
+
+def _delimited(script: str, pos: int, delimiter: str) -> typing.Tuple[str, int]:
+    """Return the text up to the next unescaped delimiter and the position after it.
+
+    Escaped delimiters are unescaped, other escapes are kept.
+    """
+    result = ""
+    while pos < len(script):
+        c = script[pos]
+        if c == "\\" and pos + 1 < len(script):
+            n = script[pos + 1]
+            result += n if n == delimiter else c + n
+            pos += 2
+            continue
+        if c == delimiter:
+            return (result, pos + 1)
+        if c == "\n":
+            break
+        result += c
+        pos += 1
+    raise GenerateError(f'Unterminated expression in sed script "{script}".')
+
+
+def _text(argument: str) -> str:
+    """The text argument of a, i and c (GNU one-liner form)."""
+    argument = argument.lstrip()
+    if argument.startswith("\\"):
+        argument = argument[1:].lstrip("\n")
+    if "\n" in argument:
+        raise _Unsupported()  # Multi-line text or more commands
+    result = ""
+    pos = 0
+    while pos < len(argument):
+        if argument[pos] == "\\" and pos + 1 < len(argument):
+            result += argument[pos + 1]
+            pos += 2
+        else:
+            result += argument[pos]
+            pos += 1
+    return result
+
+
+class _Script:
+    def __init__(self, script: str) -> None:
+        self.script = script
+        self._line: typing.Optional[int] = None  # 0 for "$"
+        self._address: typing.Optional[typing.Pattern[str]] = None
+        self._negate = False
+
+        pos = self._parse_address(script, 0)
+        while pos < len(script) and script[pos].isspace():
+            pos += 1
+        if pos < len(script) and script[pos] == "!":
+            self._negate = True
+            pos += 1
+            while pos < len(script) and script[pos].isspace():
+                pos += 1
+        if pos >= len(script):
+            raise _Unsupported()
+
+        self._command = script[pos]
+        rest = script[pos + 1 :]
+        if self._command == "s":
+            self._parse_substitution(rest)
+        elif self._command in "aic":
+            self._text = _text(rest)
+        elif self._command == "d":
+            if rest.strip():
+                raise _Unsupported()
+        else:
+            raise _Unsupported()
+
+    def _parse_address(self, script: str, pos: int) -> int:
+        if script.startswith("/", pos) or script.startswith("\\", pos):
+            delimiter = "/" if script[pos] == "/" else script[pos + 1]
+            pos += 1 if script[pos] == "/" else 2
+            (pattern, pos) = _delimited(script, pos, delimiter)
+            flags = 0
+            if script.startswith("I", pos):
+                flags = re.IGNORECASE
+                pos += 1
+            if not pattern:
+                raise _Unsupported()  # reuse of the last regex
+            self._address = _regex(pattern, flags)
+        elif script.startswith("$", pos):
+            self._line = 0
+            pos += 1
+        else:
+            digits = re.match(r"\d+", script[pos:])
+            if digits:
+                self._line = int(digits.group(0))
+                pos += len(digits.group(0))
+        if script.startswith(",", pos):
+            raise _Unsupported()  # address ranges
+        return pos
+
+    def _parse_substitution(self, rest: str) -> None:
+        if not rest or rest[0] in "\\\n":
+            raise GenerateError(f'Invalid s command in sed script "{self.script}".')
+        delimiter = rest[0]
+        (pattern, pos) = _delimited(rest, 1, delimiter)
+        (replacement, pos) = _delimited(rest, pos, delimiter)
+        if not pattern:
+            raise _Unsupported()  # reuse of the last regex
+
+        flags = 0
+        self._global = False
+        self._occurrence = 1
+        for flag in re.findall(r"\d+|.", rest[pos:].strip()):
+            if flag == "g":
+                self._global = True
+            elif flag in "Ii":
+                flags |= re.IGNORECASE
+            elif flag.isdigit():
+                self._occurrence = int(flag)
+            else:
+                raise _Unsupported()
+        self._pattern = _regex(pattern, flags)
+        self._parts = _replacement(replacement)
+
+    def _selected(self, line: str, number: int, last: bool) -> bool:
+        if self._address is not None:
+            selected = self._address.search(line) is not None
+        elif self._line is not None:
+            selected = last if self._line == 0 else number == self._line
+        else:
+            selected = True
+        return selected != self._negate
+
+    def _substitute(self, line: str) -> str:
+        result = ""
+        count = 0
+        end = 0
+        previous_end = -1
+        for match in self._pattern.finditer(line):
+            # Unlike python, sed does not match empty right after a match:
+            if match.start() == match.end() == previous_end:
+                continue
+            previous_end = match.end()
+            count += 1
+            if count < self._occurrence:
+                continue
+            try:
+                replacement = "".join(
+                    p if isinstance(p, str) else (match.group(p) or "")
+                    for p in self._parts
+                )
+            except IndexError:
+                raise GenerateError(
+                    f'Invalid back reference in sed script "{self.script}".'
+                )
+            result += line[end : match.start()] + replacement
+            end = match.end()
+            if not self._global:
+                break
+        return result + line[end:]
+
+    def apply(
+        self, lines: typing.List[str], missing_newline: bool
+    ) -> typing.Tuple[typing.List[str], bool]:
+        """Apply the script to lines.
+
+        missing_newline is set if the last line has no newline. Like sed,
+        the result only misses its final newline if it ends with that line.
+        """
+        result: typing.List[str] = []
+        ends_with_last_line = False
+        for (number, line) in enumerate(lines, 1):
+            ends_with_last_line = number == len(lines)
+            if not self._selected(line, number, number == len(lines)):
+                result.append(line)
+            elif self._command == "s":
+                result += self._substitute(line).split("\n")
+            elif self._command == "c":
+                result.append(self._text)
+                ends_with_last_line = False
+            elif self._command == "a":
+                result += [line, self._text]
+                ends_with_last_line = False
+            elif self._command == "i":
+                result += [self._text, line]
+            else:  # "d": drop the line
+                ends_with_last_line = False
+        return (result, missing_newline and ends_with_last_line)
+
+
+def parse_script(script: str) -> typing.Optional[_Script]:
+    """Parse script, None if it is not supported in-process."""
+    try:
+        return _Script(script)
+    except _Unsupported:
+        return None
+
+
+def _apply(file: str, scripts: typing.Sequence[_Script]) -> None:
+    with open(file, "r", encoding="utf-8", errors="surrogateescape") as f:
+        contents = f.read()
+    missing_newline = not contents.endswith("\n")
+    lines = contents.split("\n")
+    if not missing_newline or not contents:
+        lines = lines[:-1]
+
+    for script in scripts:
+        trace(f'Applying sed script "{script.script}" to "{file}".')
+        (lines, missing_newline) = script.apply(lines, missing_newline)
+
+    new_contents = "\n".join(lines) + ("\n" if lines and not missing_newline else "")
+    if new_contents == contents:
+        return
+
+    # Replace the file like "sed -i" does:
+    st = os.stat(file)
+    tmp_file = os.path.join(os.path.dirname(file), f".sed_{os.path.basename(file)}")
+    with open(tmp_file, "w", encoding="utf-8", errors="surrogateescape") as f:
+        f.write(new_contents)
+    os.chown(tmp_file, st.st_uid, st.st_gid)
+    os.chmod(tmp_file, st.st_mode & 0o7777)
+    os.rename(tmp_file, file)
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self._edits: typing.Dict[str, typing.List[_Script]] = {}
+
+    def add(self, file: str, script: _Script) -> None:
+        self._edits.setdefault(file, []).append(script)
+
+    def flush(self, file: str = "") -> None:
+        files = [file] if file else list(self._edits.keys())
+        for f in files:
+            scripts = self._edits.pop(f, [])
+            if scripts:
+                debug(f'Applying {len(scripts)} sed script(s) to "{f}".')
+                _apply(f, scripts)
+
+
+_active: typing.Dict[str, _Batch] = {}
+
+
+def is_active(root_directory: str) -> bool:
+    """Is a batch for root_directory collecting edits?"""
+    return root_directory in _active
+
+
+@contextmanager
+def batch(root_directory: str) -> typing.Iterator[None]:
+    """Collect all edits to files in root_directory and apply them at the end.
+
+    Each file is read and written once, no matter how many scripts were
+    applied to it. Nested batches for the same root directory share the
+    outer one. Nothing gets written if the with block raises.
+    """
+    if root_directory in _active:
+        yield
+        return
+
+    _active[root_directory] = _Batch()
+    try:
+        yield
+        _active[root_directory].flush()
+    finally:
+        del _active[root_directory]
+
+
+def sed(
+    script: str, file: str, *, root_directory: str, sed_binary: str = "/usr/bin/sed"
+) -> None:
+    """Run sed script on file (which is inside of root_directory).
+
+    The edit is applied right away, unless a batch for root_directory is
+    active. Scripts that are not supported in-process are passed to the
+    sed binary.
+    """
+    if not os.path.isfile(file):
+        raise GenerateError(f'Can not sed "{file}": No such file.')
+
+    active = _active.get(root_directory)
+    parsed = parse_script(script)
+    if parsed is None:
+        if active:
+            active.flush(file)
+        debug(f'Running sed binary for unsupported script "{script}".')
+        run(sed_binary, "-i", "-e", script, file)
+    elif active:
+        active.add(file, parsed)
+    else:
+        _apply(file, [parsed])
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Run a graph of stages, concurrently where their dependencies allow it.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..exceptions import GenerateError
+from ..printer import debug, trace, verbose
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import time
+import typing
+
+
+class Stage(typing.NamedTuple):
+    name: str
+    function: typing.Callable[..., typing.Optional[typing.Mapping[str, typing.Any]]]
+    inputs: typing.Tuple[str, ...]
+    outputs: typing.Tuple[str, ...]
+
+
+class StageGraph:
+    """A set of stages connected by the artifacts they consume and produce.
+
+    Every stage function is called with its inputs as keyword arguments and
+    must return a mapping containing all its declared outputs.
+    """
+
+    def __init__(self, **artifacts: typing.Any) -> None:
+        self._stages: typing.Dict[str, Stage] = {}
+        self._initial_artifacts = artifacts
+        self._timings: typing.Dict[str, float] = {}
+
+    def add_stage(
+        self,
+        name: str,
+        function: typing.Callable[
+            ..., typing.Optional[typing.Mapping[str, typing.Any]]
+        ],
+        *,
+        inputs: typing.Tuple[str, ...] = (),
+        outputs: typing.Tuple[str, ...] = (),
+    ) -> None:
+        if name in self._stages:
+            raise GenerateError(f'Stage "{name}" was defined twice.')
+        self._stages[name] = Stage(
+            name=name, function=function, inputs=inputs, outputs=outputs
+        )
+
+    @property
+    def timings(self) -> typing.Mapping[str, float]:
+        """Wall clock time in seconds spent in each stage that was run."""
+        return self._timings
+
+    def _validate(self) -> None:
+        producers: typing.Dict[str, str] = {}
+        for stage in self._stages.values():
+            for o in stage.outputs:
+                if o in producers or o in self._initial_artifacts:
+                    raise GenerateError(
+                        f'Artifact "{o}" of stage "{stage.name}" is produced more than once.'
+                    )
+                producers[o] = stage.name
+
+        for stage in self._stages.values():
+            for i in stage.inputs:
+                if i not in producers and i not in self._initial_artifacts:
+                    raise GenerateError(
+                        f'Artifact "{i}" needed by stage "{stage.name}" is never produced.'
+                    )
+
+    def _run_stage(
+        self, stage: Stage, artifacts: typing.Mapping[str, typing.Any]
+    ) -> typing.Tuple[typing.Mapping[str, typing.Any], float]:
+        debug(f'Starting stage "{stage.name}".')
+        start = time.monotonic()
+        result = stage.function(**{i: artifacts[i] for i in stage.inputs}) or {}
+        duration = time.monotonic() - start
+
+        for o in stage.outputs:
+            if o not in result:
+                raise GenerateError(
+                    f'Stage "{stage.name}" did not produce artifact "{o}".'
+                )
+        return ({o: result[o] for o in stage.outputs}, duration)
+
+    def run(
+        self, *, max_workers: typing.Optional[int] = None
+    ) -> typing.Dict[str, typing.Any]:
+        """Run all stages and return all artifacts.
+
+        Stages are started as soon as all their inputs are available. The
+        first exception raised by a stage is re-raised once all stages that
+        are still running have finished. No new stages are started after a
+        failure.
+        """
+        self._validate()
+
+        artifacts: typing.Dict[str, typing.Any] = dict(self._initial_artifacts)
+        pending = dict(self._stages)
+        running: typing.Dict[Future, Stage] = {}
+        failure: typing.Optional[BaseException] = None
+
+        with ThreadPoolExecutor(
+            max_workers=max_workers or max(1, len(self._stages))
+        ) as executor:
+            while pending or running:
+                if failure is None:
+                    for stage in [
+                        s
+                        for s in pending.values()
+                        if all(i in artifacts for i in s.inputs)
+                    ]:
+                        del pending[stage.name]
+                        trace(f'Scheduling stage "{stage.name}".')
+                        future = executor.submit(self._run_stage, stage, artifacts)
+                        running[future] = stage
+
+                if not running:
+                    if failure is None:
+                        names = '", "'.join(pending.keys())
+                        raise GenerateError(
+                            f'Stages "{names}" can not be run: Dependency cycle.'
+                        )
+                    break
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    exception = future.exception()
+                    if exception is not None:
+                        debug(f'Stage "{stage.name}" failed: {exception}.')
+                        if failure is None:
+                            failure = exception
+                        continue
+
+                    outputs, duration = future.result()
+                    self._timings[stage.name] = duration
+                    verbose(f'Stage "{stage.name}" done in {duration:.2f}s.')
+                    artifacts.update(outputs)
+
+        if failure is not None:
+            raise failure
+
+        return artifacts
@@ -5,23 +5,68 @@
 """
 
 
+from ..exceptions import GenerateError
+from ..location import Location
+from ..printer import trace
 from ..systemcontext import SystemContext
 from .run import run
 
 import typing
 
 
-def systemd_enable(
-    system_context: SystemContext,
-    *services: str,
-    systemctl_command: str,
-    **kwargs: typing.Any,
+def _systemctl_enable(
+    system_context: SystemContext, systemctl_command: str, user: bool, *units: str
 ) -> None:
-    """Enable systemd service."""
     all_args = [
         f"--root={system_context.fs_directory}",
     ]
-    if kwargs.get("user", False):
+    if user:
         all_args.append("--global")
     all_args.append("enable")
-    run(systemctl_command, *all_args, *services)
+    run(systemctl_command, *all_args, *units)
+
+
+def systemd_enable(
+    system_context: SystemContext,
+    *services: str,
+    location: Location,
+    **kwargs: typing.Any,
+) -> None:
+    """Enable systemd service.
+
+    The services are only queued here: flush_systemd_enable enables all of
+    them with one systemctl call before the system gets torn down."""
+    system_context.queue_systemd_enable(
+        location, *services, user=kwargs.get("user", False)
+    )
+
+
+def flush_systemd_enable(
+    system_context: SystemContext, *, systemctl_command: str
+) -> None:
+    """Enable all queued systemd services."""
+    queued = system_context.take_systemd_enables()
+
+    for user in (False, True):
+        entries = [(l, u) for (l, is_user, u) in queued if is_user == user]
+        if not entries:
+            continue
+
+        units = list(dict.fromkeys(u for (_, units) in entries for u in units))
+        trace(f'Enabling {"user" if user else "system"} units: {", ".join(units)}.')
+        try:
+            _systemctl_enable(system_context, systemctl_command, user, *units)
+        except GenerateError:
+            # Retry one request at a time to find the one that failed:
+            for (location, requested) in entries:
+                try:
+                    _systemctl_enable(
+                        system_context, systemctl_command, user, *requested
+                    )
+                except GenerateError as e:
+                    raise GenerateError(
+                        f'Failed to enable systemd units {", ".join(requested)}.',
+                        location=location,
+                        original_exception=e,
+                    )
+            raise
@@ -5,7 +5,9 @@
 """
 
 from ..printer import debug
-from .run import run
+from .accounts import transaction
+from .filecache import FileCache
+from .group import invalidate_group_cache
 
 import os
 import typing
@@ -21,18 +23,48 @@ class User(typing.NamedTuple):
     shell: str
 
 
-def _user_data(passwd_file: str, name: str) -> typing.Optional[User]:
-    if not os.path.isfile(passwd_file):
-        return None
+class _Users(typing.NamedTuple):
+    by_name: typing.Dict[str, User]
+    by_uid: typing.Dict[int, User]
+
+
+def _parse_passwd(passwd_file: str) -> _Users:
+    users = _Users(by_name={}, by_uid={})
     with open(passwd_file, "r") as passwd:
         for line in passwd:
             if line.endswith("\n"):
                 line = line[:-1]
             current_user: typing.List[typing.Any] = line.split(":")
-            if current_user[0] == name:
-                current_user[2] = int(current_user[2])
-                current_user[3] = int(current_user[3])
-                return User(*current_user)
+            if len(current_user) != 7 or current_user[0] in users.by_name:
+                continue
+            current_user[2] = int(current_user[2])
+            current_user[3] = int(current_user[3])
+            user = User(*current_user)
+            users.by_name[user.name] = user
+            users.by_uid.setdefault(user.uid, user)
+    return users
+
+
+_passwd_cache = FileCache(_parse_passwd)
+
+
+def _passwd_file(root_directory: str) -> str:
+    return os.path.join(root_directory, "etc/passwd")
+
+
+def invalidate_user_cache(root_directory: str) -> None:
+    """Re-read the passwd and group files of root_directory on next access."""
+    _passwd_cache.invalidate(_passwd_file(root_directory))
+    invalidate_group_cache(root_directory)
+
+
+def _user_data(passwd_file: str, name: str) -> typing.Optional[User]:
+    users = _passwd_cache.get(passwd_file)
+    if users is None:
+        return None
+    user = users.by_name.get(name)
+    if user is not None:
+        return user
 
     if name == "root":
         return User("root", "x", 0, 0, "root", "/root", "/usr/bin/bash")
@@ -40,10 +72,6 @@ def _user_data(passwd_file: str, name: str) -> typing.Optional[User]:
 
 
 class UserHelper:
-    def __init__(self, add_command: str, mod_command: str) -> None:
-        self._add_command = add_command
-        self._mod_command = mod_command
-
     def useradd(
         self,
         user_name: str,
@@ -57,38 +85,26 @@ class UserHelper:
         password: str = "",
         expire: typing.Optional[str] = None,
         root_directory: str
-    ):
-        """Add a new user to the system."""
-        command = [self._add_command, "--root", root_directory, user_name]
-
-        if comment:
-            command += ["--comment", comment]
-
-        if home:
-            command += ["--home", home]
-
-        if gid >= 0:
-            command += ["--gid", str(gid)]
-
-        if uid >= 0:
-            command += ["--uid", str(uid)]
-
-        if shell:
-            command += ["--shell", shell]
-
-        if groups:
-            command += ["--groups", groups]
-
-        if password:
-            command += ["--password", password]
-
-        if expire is not None:
-            if expire == "None":
-                command.append("--expiredate")
-            else:
-                command += ["--expiredate", expire]
-
-        return run(*command).returncode == 0
+    ) -> bool:
+        """Add a new user to the system.
+
+        The change is written right away, unless an accounts transaction
+        for root_directory is active.
+        """
+        with transaction(root_directory) as accounts:
+            accounts.useradd(
+                user_name,
+                comment=comment,
+                home=home,
+                gid=gid,
+                uid=uid,
+                shell=shell,
+                groups=groups,
+                password=password,
+                expire=expire,
+            )
+        invalidate_user_cache(root_directory)
+        return True
 
     def usermod(
         self,
@@ -107,54 +123,39 @@ class UserHelper:
         expire: typing.Optional[str] = None,
         root_directory: str
     ) -> bool:
-        """Modify an existing user."""
-        command = [self._mod_command, "--root", root_directory, user_name]
-
-        if comment:
-            command += ["--comment", comment]
-
-        if home:
-            command += ["--home", home]
-
-        if gid >= 0:
-            command += ["--gid", str(gid)]
-
-        if uid >= 0:
-            command += ["--uid", str(uid)]
-
-        if lock is not None:
-            if lock:
-                command.append("--lock")
-            else:
-                command.append("--unlock")
+        """Modify an existing user.
+
+        The change is written right away, unless an accounts transaction
+        for root_directory is active.
+        """
+        with transaction(root_directory) as accounts:
+            accounts.usermod(
+                user_name,
+                comment=comment,
+                home=home,
+                gid=gid,
+                uid=uid,
+                lock=lock,
+                rename=rename,
+                shell=shell,
+                append=append,
+                groups=groups,
+                password=password,
+                expire=expire,
+            )
+        invalidate_user_cache(root_directory)
+        return True
 
-        if expire is not None:
-            if expire == "None":
-                command.append("--expiredate")
-            else:
-                command += ["--expiredate", expire]
-
-        if shell:
-            command += ["--shell", shell]
-
-        if rename:
-            command += ["--login", rename]
-
-        if append:
-            command.append("--append")
-
-        if groups:
-            command += ["--groups", groups]
-
-        if password:
-            command += ["--password", password]
-
-        if expire is not None:
-            command += ["--expiredate", expire]
+    @staticmethod
+    def user_data(name: str, *, root_directory: str) -> typing.Optional[User]:
+        """Get user data from passwd file.
 
-        return run(*command).returncode == 0
+        The passwd file is parsed once and cached until it changes.
+        """
+        return _user_data(_passwd_file(root_directory), name)
 
     @staticmethod
-    def user_data(name: str, *, root_directory: str) -> typing.Optional[User]:
-        """Get user data from passwd file."""
-        return _user_data(os.path.join(root_directory, "etc/passwd"), name)
+    def user_data_by_uid(uid: int, *, root_directory: str) -> typing.Optional[User]:
+        """Get user data of the (first) user with uid from passwd file."""
+        users = _passwd_cache.get(_passwd_file(root_directory))
+        return None if users is None else users.by_uid.get(uid)
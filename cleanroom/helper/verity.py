@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""Create dm-verity hash trees compatible with veritysetup.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..exceptions import GenerateError
+from ..printer import debug, trace
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import mmap
+import os
+import struct
+import typing
+import uuid as uuid_module
+
+
+_SUPERBLOCK_FORMAT = "<8sII16s32sIIQH6s256s168s"
+_SUPERBLOCK_SIZE = struct.calcsize(_SUPERBLOCK_FORMAT)
+assert _SUPERBLOCK_SIZE == 512
+
+# Number of hash blocks worth of digests computed in one task:
+_HASH_BLOCKS_PER_TASK = 64
+
+
+class VerityResult(typing.NamedTuple):
+    root_hash: str
+    uuid: str
+    salt: str
+    data_blocks: int
+    hash_size: int
+
+
+def _digest_size_full(algorithm: str) -> int:
+    size = hashlib.new(algorithm).digest_size
+    full = 1
+    while full < size:
+        full <<= 1
+    return full
+
+
+def _hash_blocks(
+    data: typing.Any,
+    first: int,
+    last: int,
+    *,
+    block_size: int,
+    algorithm: str,
+    salt: bytes,
+    digest_size_full: int,
+) -> bytes:
+    result = bytearray()
+    for b in range(first, last):
+        h = hashlib.new(algorithm)
+        h.update(salt)
+        h.update(data[b * block_size : (b + 1) * block_size])
+        result += h.digest().ljust(digest_size_full, b"\0")
+    return bytes(result)
+
+
+def _hash_level(
+    executor: ThreadPoolExecutor,
+    data: typing.Any,
+    block_count: int,
+    *,
+    block_size: int,
+    hash_block_size: int,
+    algorithm: str,
+    salt: bytes,
+) -> bytes:
+    digest_size_full = _digest_size_full(algorithm)
+    hashes_per_block = hash_block_size // digest_size_full
+    step = hashes_per_block * _HASH_BLOCKS_PER_TASK
+
+    # Tasks cover whole hash blocks, so their results can just be joined:
+    parts = executor.map(
+        lambda first: _hash_blocks(
+            data,
+            first,
+            min(first + step, block_count),
+            block_size=block_size,
+            algorithm=algorithm,
+            salt=salt,
+            digest_size_full=digest_size_full,
+        ),
+        range(0, block_count, step),
+    )
+    level = b"".join(parts)
+    remainder = len(level) % hash_block_size
+    if remainder:
+        level += bytes(hash_block_size - remainder)
+    return level
+
+
+def _superblock(
+    *,
+    uuid: uuid_module.UUID,
+    algorithm: str,
+    data_block_size: int,
+    hash_block_size: int,
+    data_blocks: int,
+    salt: bytes,
+) -> bytes:
+    return struct.pack(
+        _SUPERBLOCK_FORMAT,
+        b"verity\0\0",
+        1,  # superblock version
+        1,  # hash type: salt is prepended (chromeos uses 0)
+        uuid.bytes,
+        algorithm.encode("ascii"),
+        data_block_size,
+        hash_block_size,
+        data_blocks,
+        len(salt),
+        b"",
+        salt,
+        b"",
+    )
+
+
+def create_hash_tree(
+    data_file: str,
+    hash_file: str,
+    *,
+    algorithm: str = "sha256",
+    data_block_size: int = 4096,
+    hash_block_size: int = 4096,
+    salt: typing.Optional[bytes] = None,
+    uuid: typing.Optional[uuid_module.UUID] = None,
+    max_workers: typing.Optional[int] = None,
+) -> VerityResult:
+    """Write a dm-verity hash device for data_file into hash_file.
+
+    The result is the same as "veritysetup format data_file hash_file" with
+    the same salt and uuid. Blocks are hashed by several threads directly
+    from a mmap of data_file (hashlib releases the GIL while hashing).
+    """
+    if salt is None:
+        salt = os.urandom(32)
+    if uuid is None:
+        uuid = uuid_module.uuid4()
+    if len(salt) > 256:
+        raise GenerateError("The dm-verity salt must not exceed 256 bytes.")
+
+    data_size = os.path.getsize(data_file)
+    if data_size == 0 or data_size % data_block_size != 0:
+        raise GenerateError(
+            f'Size of "{data_file}" is not a multiple of {data_block_size}.'
+        )
+    data_blocks = data_size // data_block_size
+
+    debug(f'Creating dm-verity hash tree for "{data_file}" ({data_blocks} blocks).')
+
+    levels: typing.List[bytes] = []
+    with open(data_file, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        view = memoryview(mapped)
+        try:
+            current = view
+            block_count = data_blocks
+            block_size = data_block_size
+            while block_count > 1:
+                level = _hash_level(
+                    executor,
+                    current,
+                    block_count,
+                    block_size=block_size,
+                    hash_block_size=hash_block_size,
+                    algorithm=algorithm,
+                    salt=salt,
+                )
+                trace(f"dm-verity level {len(levels)}: {len(level)} bytes.")
+                levels.append(level)
+                current = memoryview(level)
+                block_count = len(level) // hash_block_size
+                block_size = hash_block_size
+
+            h = hashlib.new(algorithm)
+            h.update(salt)
+            h.update(current[:block_size])
+            root_hash = h.hexdigest()
+        finally:
+            current = None
+            view.release()
+
+    with open(hash_file, "wb") as out:
+        out.write(
+            _superblock(
+                uuid=uuid,
+                algorithm=algorithm,
+                data_block_size=data_block_size,
+                hash_block_size=hash_block_size,
+                data_blocks=data_blocks,
+                salt=salt,
+            ).ljust(hash_block_size, b"\0")
+        )
+        # The top-most level comes first on the hash device:
+        for level in reversed(levels):
+            out.write(level)
+        hash_size = out.tell()
+
+    return VerityResult(
+        root_hash=root_hash,
+        uuid=str(uuid),
+        salt=salt.hex(),
+        data_blocks=data_blocks,
+        hash_size=hash_size,
+    )
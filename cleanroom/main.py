@@ -13,6 +13,7 @@ from .helper.group import GroupHelper
 from .helper.user import UserHelper
 from .preflight import preflight_check, users_check
 from .printer import Printer, h2
+from .runsystem import run_system
 from .workdir import WorkDir
 from .systemsmanager import SystemsManager
 
@@ -22,25 +23,8 @@ import sys
 import typing
 
 
-def _parse_commandline(*arguments: str) -> typing.Any:
-    """Parse the command line options."""
-    parser = ArgumentParser(
-        description="Cleanroom OS image script generator", prog=arguments[0]
-    )
-
+def _add_common_arguments(parser: ArgumentParser) -> None:
     parser.add_argument("--verbose", action="count", default=0, help="Be verbose")
-    parser.add_argument(
-        "--list-commands",
-        dest="list_commands",
-        action="store_true",
-        help="List known commands for definition files",
-    )
-    parser.add_argument(
-        "--list-substitutions",
-        dest="list_substitutions",
-        action="store_true",
-        help="List known substitutions that can be used in definition files",
-    )
 
     parser.add_argument(
         "--ignore-errors",
@@ -87,11 +71,75 @@ def _parse_commandline(*arguments: str) -> typing.Any:
         help="Keep temporary data in work directory.",
     )
 
+
+def _parse_run_commandline(*arguments: str) -> typing.Any:
+    """Parse the command line options of "run"."""
+    parser = ArgumentParser(
+        description="Build a system without exporting it and run it in a "
+        "throw-away container",
+        prog=f"{arguments[0]} run",
+    )
+    _add_common_arguments(parser)
+
+    parser.add_argument(
+        "--shell",
+        dest="shell",
+        action="store_true",
+        help="Start a shell instead of booting the system.",
+    )
+    parser.add_argument(
+        "--rebuild",
+        dest="rebuild",
+        action="store_true",
+        help="Regenerate the system even if it is in storage already.",
+    )
+    parser.add_argument(
+        "--with-network",
+        dest="with_network",
+        action="store_true",
+        help="Share the network with the host.",
+    )
+
+    parser.add_argument(dest="system", metavar="<system>", help="system to run")
+
+    parse_result = parser.parse_args(arguments[2:])
+    parse_result.run = True
+    parse_result.list_commands = False
+    parse_result.list_substitutions = False
+    parse_result.systems = [parse_result.system]
+
+    return parse_result
+
+
+def _parse_commandline(*arguments: str) -> typing.Any:
+    """Parse the command line options."""
+    if len(arguments) > 1 and arguments[1] == "run":
+        return _parse_run_commandline(*arguments)
+
+    parser = ArgumentParser(
+        description="Cleanroom OS image script generator", prog=arguments[0]
+    )
+    _add_common_arguments(parser)
+
+    parser.add_argument(
+        "--list-commands",
+        dest="list_commands",
+        action="store_true",
+        help="List known commands for definition files",
+    )
+    parser.add_argument(
+        "--list-substitutions",
+        dest="list_substitutions",
+        action="store_true",
+        help="List known substitutions that can be used in definition files",
+    )
+
     parser.add_argument(
         dest="systems", nargs="*", metavar="<system>", help="systems to create"
     )
 
     parse_result = parser.parse_args(arguments[1:])
+    parse_result.run = False
 
     return parse_result
 
@@ -129,14 +177,8 @@ def main(*command_arguments: str) -> None:
     )
 
     btrfs_helper = BtrfsHelper(binary_manager.binary(Binaries.BTRFS))
-    user_helper = UserHelper(
-        binary_manager.binary(Binaries.USERADD),
-        binary_manager.binary(Binaries.USERMOD),
-    )
-    group_helper = GroupHelper(
-        binary_manager.binary(Binaries.GROUPADD),
-        binary_manager.binary(Binaries.GROUPMOD),
-    )
+    user_helper = UserHelper()
+    group_helper = GroupHelper()
 
     preflight_check("users", users_check, ignore_errors=args.ignore_errors)
 
@@ -173,6 +215,8 @@ def main(*command_arguments: str) -> None:
         clear_scratch_directory=args.clear_scratch_directory,
         clear_storage=args.clear_storage,
     ) as work_directory:
+        if args.run and args.rebuild:
+            work_directory.clear_system_storage(args.system)
 
         h2("Starting generation phase")
 
@@ -186,4 +230,17 @@ def main(*command_arguments: str) -> None:
             command_manager=command_manager,
             ignore_errors=args.ignore_errors,
             repository_base_directory=args.repository_base_directory,
+            skip_export=args.run,
         )
+
+        if args.run:
+            sys.exit(
+                run_system(
+                    args.system,
+                    work_directory=work_directory,
+                    btrfs_helper=btrfs_helper,
+                    nspawn=binary_manager.binary(Binaries.SYSTEMD_NSPAWN),
+                    shell=args.shell,
+                    with_network=args.with_network,
+                )
+            )
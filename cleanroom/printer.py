@@ -110,6 +110,7 @@ class Printer:
         """Constructor."""
         self._verbose = 0
         self._prefix = ""
+        self._output: typing.Optional[typing.TextIO] = None  # None: sys.stdout
 
         self.set_verbosity(verbosity)
 
@@ -137,17 +138,23 @@ class Printer:
         self._buffer = ""
 
         if buf:
-            print(">>>>>> Flushing buffer:")
-            print(buf)
-            print(">>>>>> End of Buffer <<<<<<")
+            print(">>>>>> Flushing buffer:", file=self._output)
+            print(buf, file=self._output)
+            print(">>>>>> End of Buffer <<<<<<", file=self._output)
         else:
-            print(">>>>>> No buffered output <<<<<<")
+            print(">>>>>> No buffered output <<<<<<", file=self._output)
 
     def set_verbosity(self, verbosity: int) -> None:
         """Set the verbosity."""
         self._verbose = verbosity
         self._prefix = "      " if verbosity > 0 else ""
 
+    def set_output(self, output: typing.Optional[typing.TextIO]) -> None:
+        """Print to output instead of stdout (None: back to stdout).
+
+        Use this when stdout is used for data, e.g. an image written to "-"."""
+        self._output = output
+
     @staticmethod
     def show_verbosity_level() -> None:
         if Printer.instance()._print_at_verbosity_level(3):
@@ -162,7 +169,7 @@ class Printer:
         self._buffer += buf.getvalue()
 
     def _print_impl(self, *args: str, **kwargs: typing.Any) -> None:
-        print(*args, **kwargs)
+        print(*args, file=self._output, **kwargs)
 
     def _print(self, *args: str, verbosity: int = 0) -> None:
         self._print_to_buffer(*args)
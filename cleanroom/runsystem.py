@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Boot a stored system in a container for development.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from .exceptions import GenerateError
+from .helper.btrfs import BtrfsHelper
+from .printer import h2, info, trace
+from .workdir import WorkDir
+
+import os
+import subprocess
+import typing
+
+
+def _machine_name(system_name: str) -> str:
+    return system_name[7:] if system_name.startswith("system-") else system_name
+
+
+def nspawn_command(
+    nspawn_command: str,
+    directory: str,
+    *,
+    machine: str,
+    shell: bool = False,
+    with_network: bool = False,
+) -> typing.List[str]:
+    """Build the systemd-nspawn command line to run directory."""
+    command = [
+        nspawn_command,
+        f"--directory={directory}",
+        f"--machine={machine}",
+        "--register=no",
+    ]
+    if not with_network:
+        command.append("--private-network")
+    if not shell:
+        command.append("--boot")
+    return command
+
+
+def run_system(
+    system_name: str,
+    *,
+    work_directory: WorkDir,
+    btrfs_helper: BtrfsHelper,
+    nspawn: str,
+    shell: bool = False,
+    with_network: bool = False,
+) -> int:
+    """Boot (or open a shell in) a writable snapshot of a stored system.
+
+    All changes get discarded once the container exits."""
+    fs_directory = os.path.join(work_directory.storage_directory, system_name, "fs")
+    if not os.path.isdir(fs_directory):
+        raise GenerateError(f'System "{system_name}" is not in storage.')
+    if not nspawn:
+        raise GenerateError("systemd-nspawn is not available.")
+
+    work_directory.clear_scratch_directory()
+    snapshot = os.path.join(work_directory.scratch_directory, f"run_{system_name}")
+    btrfs_helper.create_snapshot(fs_directory, snapshot)
+
+    h2(f'Running "{system_name}"')
+    try:
+        command = nspawn_command(
+            nspawn,
+            snapshot,
+            machine=_machine_name(system_name),
+            shell=shell,
+            with_network=with_network,
+        )
+        trace('Running: "{}"...'.format('" "'.join(command)))
+        result = subprocess.run(command).returncode
+    finally:
+        btrfs_helper.delete_subvolume(snapshot)
+
+    info(f'"{system_name}" exited with code {result}, all changes discarded.')
+    return result
@@ -10,7 +10,9 @@ from __future__ import annotations
 from .exceptions import GenerateError
 from .printer import error, debug, h2, trace
 from .execobject import ExecObject
+from .location import Location
 
+import copy
 import os
 import pickle
 import string
@@ -60,6 +62,7 @@ class SystemContext:
         repository_base_directory: str,
         storage_directory: str,
         timestamp: str,
+        shared_cache_directory: str = "",
     ) -> None:
         """Constructor."""
         assert scratch_directory
@@ -71,6 +74,7 @@ class SystemContext:
         self._timestamp = timestamp
         self._repository_base_directory = repository_base_directory
         self._scratch_directory = scratch_directory
+        self._shared_cache_directory = shared_cache_directory
         self._systems_definition_directory = systems_definition_directory
         self._system_storage_directory = os.path.join(storage_directory, system_name)
         self._base_storage_directory = ""
@@ -87,6 +91,9 @@ class SystemContext:
         self._hooks: typing.Dict[str, typing.List[ExecObject]] = {}
         self._hooks_that_already_ran: typing.List[str] = []
         self._substitutions: typing.MutableMapping[str, str] = {}
+        self._systemd_enables: typing.List[
+            typing.Tuple[Location, bool, typing.Tuple[str, ...]]
+        ] = []
 
         if base_system_name:
             self._base_storage_directory = os.path.join(
@@ -165,6 +172,11 @@ class SystemContext:
     def cache_directory(self) -> str:
         return os.path.join(self._scratch_directory, "cache")
 
+    @property
+    def shared_cache_directory(self) -> str:
+        """Cache shared between all systems (may be empty: no caching)."""
+        return self._shared_cache_directory
+
     @property
     def system_storage_directory(self) -> str:
         return self._system_storage_directory
@@ -217,6 +229,26 @@ class SystemContext:
     def hooks_were_run(self, hook_name: str) -> bool:
         return hook_name in self._hooks_that_already_ran
 
+    # Handle deferred systemd unit enablement:
+    def queue_systemd_enable(
+        self, location: Location, *units: str, user: bool = False
+    ) -> None:
+        """Remember units to enable when the system gets torn down."""
+        self._systemd_enables.append((copy.deepcopy(location), user, units))
+        trace(f'Queued systemd units {", ".join(units)} for enabling.')
+
+    @property
+    def has_systemd_enables(self) -> bool:
+        return bool(self._systemd_enables)
+
+    def take_systemd_enables(
+        self,
+    ) -> typing.List[typing.Tuple[Location, bool, typing.Tuple[str, ...]]]:
+        """Return and forget all queued systemd units."""
+        queued = self._systemd_enables
+        self._systemd_enables = []
+        return queued
+
     # Handle substitutions:
     @property
     def substitutions(self) -> typing.Mapping[str, str]:
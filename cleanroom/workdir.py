@@ -146,6 +146,20 @@ class WorkDir:
         # slow path:
         _clear_directory(self.storage_directory, self._btrfs_helper)
 
+        # Caches are only valid for as long as the storage is:
+        _clear_directory(self.shared_cache_directory, self._btrfs_helper)
+
+    def clear_system_storage(self, system_name: str) -> None:
+        """Remove one system from the storage directory."""
+        _clear_directory(
+            os.path.join(self.storage_directory, system_name), self._btrfs_helper
+        )
+
+    @property
+    def shared_cache_directory(self) -> str:
+        """Get the directory for caches shared between systems."""
+        return os.path.join(self._work_directory, "shared_cache")
+
     @property
     def work_directory(self) -> str:
         """Get the work directory based."""
@@ -154,7 +168,9 @@ class WorkDir:
     def _setup_work_directory(self) -> None:
         _ensure_directory(self.storage_directory, self._btrfs_helper)
         _ensure_directory(self.scratch_directory, self._btrfs_helper)
+        _ensure_directory(self.shared_cache_directory, self._btrfs_helper)
 
         info(f'WorkDir: work directory     = "{self.work_directory}".')
         debug(f'WorkDir: scratch directory  = "{self.scratch_directory}".')
         debug(f'WorkDir: storage directory  = "{self.storage_directory}".')
+        debug(f'WorkDir: shared cache       = "{self.shared_cache_directory}".')
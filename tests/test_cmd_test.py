@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Test for the _test command.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.commands._test import TestCommand as _TestCommand
+
+
+def _write_test(directory: str, name: str, body: str) -> None:
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(f"#!/bin/sh\n{body}\n")
+    os.chmod(path, 0o755)
+
+
+def test_cmd_test_collects_all_results(system_context, location):
+    tests_directory = system_context.system_tests_directory
+    os.makedirs(tests_directory)
+    os.makedirs(system_context.fs_directory)
+    _write_test(tests_directory, "01_ok", 'echo "testing $1"')
+    _write_test(tests_directory, "02_fail", "echo broken >&2; exit 3")
+    _write_test(tests_directory, "03_slow", "sleep 10")
+    _write_test(tests_directory, "04_ok", "exit 0")
+    system_context.set_substitution("TEST_TIMEOUT", "1")
+
+    with pytest.raises(SystemExit):
+        _TestCommand()(location, system_context)
+
+    with open(os.path.join(system_context.meta_directory, "test-results.json")) as f:
+        results = {t["name"]: t for t in json.load(f)["tests"]}
+    assert results["01_ok"]["passed"]
+    assert results["01_ok"]["stdout"] == "testing test_system\n"
+    assert results["02_fail"]["returncode"] == 3
+    assert results["02_fail"]["stderr"] == "broken\n"
+    assert results["03_slow"]["timeout"]
+    assert results["04_ok"]["passed"]
+
+    suite = ET.parse(
+        os.path.join(system_context.meta_directory, "test-results.xml")
+    ).getroot()
+    assert suite.get("tests") == "4"
+    assert suite.get("failures") == "1"
+    assert suite.get("errors") == "1"
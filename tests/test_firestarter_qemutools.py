@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Test for firestarter qemu tools.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+from argparse import ArgumentParser
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import cleanroom.firestarter.qemutools as qemutools
+from cleanroom.firestarter.qemutools import parse_boot_log
+
+
+def test_parse_boot_log() -> None:
+    log = [
+        (0.5, "BdsDxe: starting Boot0001"),
+        (1.0, "[    0.000000] Linux version 5.8.1-arch1-1 (linux@archlinux)"),
+        (1.9, "[    0.912000] systemd[1]: Running in initrd."),
+        (2.4, "[  OK  ] Reached target \x1b[0;1;39mInitrd Root File System\x1b[0m."),
+        (2.6, "         Starting Switch Root..."),
+        (2.7, "[    2.100000] systemd-journald[120]: Switching root."),
+        (4.0, "[  OK  ] Reached target Multi-User System."),
+        (
+            4.1,
+            "[    3.900000] systemd[1]: Startup finished in 1.2s (firmware) + "
+            "800ms (loader) + 1.104s (kernel) + 1min 2.5s (initrd) + "
+            "1.800s (userspace) = 1min 7.404s.",
+        ),
+    ]
+
+    report = parse_boot_log(log)
+
+    assert report["milestones"] == {
+        "kernel": 1.0,
+        "initrd": 1.9,
+        "root_mounted": 2.4,
+        "switch_root": 2.7,
+        "multi_user": 4.0,
+    }
+    assert report["systemd_analyze"] == pytest.approx(
+        {
+            "firmware": 1.2,
+            "loader": 0.8,
+            "kernel": 1.104,
+            "initrd": 62.5,
+            "userspace": 1.8,
+            "total": 67.404,
+        }
+    )
+
+
+def test_parse_boot_log_incomplete() -> None:
+    report = parse_boot_log([(1.0, "Linux version 5.8.1")])
+    assert report["milestones"]["kernel"] == 1.0
+    assert report["milestones"]["multi_user"] is None
+    assert report["systemd_analyze"] == {}
+
+
+def _fake_qemu(tmp_path, *lines: str) -> str:
+    """A stand-in for qemu printing lines to the console, then hanging."""
+    qemu = tmp_path / "qemu"
+    script = "".join(
+        f"sleep 0.1\nprintf '%s\\r\\n' '{line}'\n" for line in lines
+    )
+    qemu.write_text(f"#!/bin/sh\n{script}exec sleep 60\n")
+    qemu.chmod(0o755)
+    return str(qemu)
+
+
+def _benchmark(tmp_path, monkeypatch, qemu: str, **kwargs):
+    monkeypatch.setattr(qemutools, "_QEMU", qemu)
+    parser = ArgumentParser()
+    qemutools.setup_parser_for_qemu(parser)
+    report_file = str(tmp_path / "report.json")
+
+    start = time.monotonic()
+    result = qemutools.benchmark_qemu(
+        parser.parse_args(["--bios"]),
+        work_directory=str(tmp_path),
+        report_file=report_file,
+        **kwargs,
+    )
+    duration = time.monotonic() - start
+
+    with open(report_file) as f:
+        return (result, json.load(f), duration)
+
+
+def test_benchmark_qemu_waits_for_startup_times(tmp_path, monkeypatch) -> None:
+    qemu = _fake_qemu(
+        tmp_path,
+        "Linux version 5.8.1",
+        "[  OK  ] Reached target Multi-User System.",
+        "systemd[1]: Startup finished in 1.104s (kernel) + 1.800s (userspace) "
+        "= 2.904s.",
+    )
+
+    (result, report, duration) = _benchmark(
+        tmp_path, monkeypatch, qemu, timeout=30.0, grace=20.0
+    )
+
+    assert result == 0
+    assert duration < 10.0
+    assert report["reached_multi_user"]
+    assert report["milestones"]["kernel"] is not None
+    assert report["systemd_analyze"] == pytest.approx(
+        {"kernel": 1.104, "userspace": 1.8, "total": 2.904}
+    )
+    with open(report["console_log"]) as f:
+        assert "Startup finished" in f.read()
+
+
+def test_benchmark_qemu_grace_period(tmp_path, monkeypatch) -> None:
+    qemu = _fake_qemu(tmp_path, "[  OK  ] Reached target Multi-User System.")
+
+    (result, report, duration) = _benchmark(
+        tmp_path, monkeypatch, qemu, timeout=30.0, grace=0.5
+    )
+
+    assert result == 0
+    assert duration < 10.0
+    assert report["reached_multi_user"]
+    assert report["systemd_analyze"] == {}
+
+
+def test_benchmark_qemu_timeout(tmp_path, monkeypatch) -> None:
+    qemu = _fake_qemu(tmp_path, "Linux version 5.8.1")
+
+    (result, report, _) = _benchmark(tmp_path, monkeypatch, qemu, timeout=1.0)
+
+    assert result == 1
+    assert not report["reached_multi_user"]
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Test for the firestarter tarball install target.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import cleanroom.firestarter.tarballinstalltarget as tarball
+
+
+def _populate(directory: str) -> str:
+    for name in ("b", "a", "c/z", "c/y"):
+        path = os.path.join(directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(name)
+        os.utime(path, (1700000000, 1700000000))
+    return directory
+
+
+@pytest.mark.skipif(not os.path.exists(tarball._TAR), reason="tar is not installed")
+def test_tar_is_deterministic(tmp_path) -> None:
+    efi = _populate(str(tmp_path / "efi"))
+    root = _populate(str(tmp_path / "root"))
+
+    sums = str(tmp_path / "SHA256SUMS")
+    assert (
+        tarball._tar(
+            efi,
+            root,
+            tarball_name=str(tmp_path / "root.tar"),
+            efi_tarball_name=str(tmp_path / "efi.tar"),
+            checksum_file=sums,
+        )
+        == 0
+    )
+    assert not os.path.exists(str(tmp_path / "root.tar.tmp"))
+
+    with tarfile.open(str(tmp_path / "root.tar")) as t:
+        assert t.getnames() == [".", "./a", "./b", "./c", "./c/y", "./c/z"]
+
+    with open(sums) as f:
+        lines = f.read().splitlines()
+    assert [line.split("  ")[1] for line in lines] == ["efi.tar", "root.tar"]
+    subprocess.run(["sha256sum", "--check", "--quiet", sums], cwd=tmp_path, check=True)
+
+    # Access times and the time of creation must not show up in the tarball:
+    os.utime(os.path.join(root, "a"), (0, 1700000000))
+    checksum = tarball._write_tarball(
+        root, str(tmp_path / "again.tar"), compression="none", level=0, threads=0
+    )
+    assert lines[1].startswith(checksum)
+
+
+@pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd is not installed")
+def test_tar_zstd(tmp_path, monkeypatch) -> None:
+    monkeypatch.setitem(
+        tarball._COMPRESSORS,
+        "zstd",
+        (shutil.which("zstd"), tarball._COMPRESSORS["zstd"][1]),
+    )
+    root = _populate(str(tmp_path / "root"))
+    name = str(tmp_path / "root.tar.zst")
+
+    checksum = tarball._write_tarball(
+        root, name, compression="auto", level=0, threads=0
+    )
+
+    subprocess.run([shutil.which("zstd"), "-d", "-q", name], check=True)
+    with tarfile.open(name[:-4]) as t:
+        assert t.getnames() == [".", "./a", "./b", "./c", "./c/y", "./c/z"]
+    with open(name, "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == checksum
+
+
+def test_tar_failure_leaves_nothing(tmp_path) -> None:
+    name = str(tmp_path / "root.tar")
+    result = tarball._tar(
+        str(tmp_path), str(tmp_path / "missing"), tarball_name=name, efi_tarball_name=""
+    )
+    assert result == 1
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.mark.parametrize("suffix", [".tar.bz2", ".tar.lz", ".tar.lzma", ".tar.lz4"])
+def test_tar_unsupported_suffix_fails(tmp_path, suffix: str) -> None:
+    root = _populate(str(tmp_path / "root"))
+    result = tarball._tar(
+        root,
+        root,
+        tarball_name=str(tmp_path / f"root{suffix}"),
+        efi_tarball_name=str(tmp_path / "efi.tar"),
+    )
+    assert result == 1
+    assert os.listdir(str(tmp_path)) == ["root"]
+
+
+def test_compression_for() -> None:
+    assert tarball._compression_for("root.tar.zst", "auto") == "zstd"
+    assert tarball._compression_for("root.tar", "auto") == "none"
+    assert tarball._compression_for("root.img", "auto") == "none"
+    assert tarball._compression_for("root.tar.bz2", "none") == "none"
+    with pytest.raises(ValueError):
+        tarball._compression_for("root.tbz2", "auto")
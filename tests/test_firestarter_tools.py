@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Test for firestarter tools.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.firestarter.tools import ArchiveIndex, ChunkStoreExtract, find_archive
+from cleanroom.firestarter.main import main as firestarter_main
+from cleanroom.helper.chunkstore import ChunkStore
+from cleanroom.printer import Printer
+
+
+def test_archive_index(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    export = tmp_path / "export"
+    export.mkdir()
+    (export / "image.img").write_bytes(b"image")
+
+    repository = str(tmp_path / "repo")
+    store = ChunkStore.create(repository)
+    for archive in (
+        "system-example-20200102.0101",
+        "system-example-20200101.0101",
+        "other-20200103.0101",
+    ):
+        store.add_archive(archive, str(export))
+
+    index = ArchiveIndex.load(repository)
+    assert index.systems() == ["other", "system-example"]
+    assert index.versions("system-example") == ["20200101.0101", "20200102.0101"]
+    assert find_archive("system-example", repository=repository) == (
+        "system-example-20200102.0101",
+        "20200102.0101",
+    )
+    assert find_archive(
+        "system-example", repository=repository, version="20200101.0101"
+    ) == ("system-example-20200101.0101", "20200101.0101")
+    assert find_archive("system", repository=repository) == ("", "")
+    assert os.listdir(tmp_path / "cache" / "cleanroom" / "firestarter")
+
+    store.add_archive("system-example-20200104.0101", str(export))
+    (archive, _) = find_archive("system-example", repository=repository, version="latest")
+    assert archive == "system-example-20200104.0101"
+
+
+def test_extract_retagged_archive(tmp_path, monkeypatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    export = tmp_path / "export"
+    export.mkdir()
+    (export / "example_20200101.0101.img").write_bytes(b"image")
+
+    repository = str(tmp_path / "repo")
+    store = ChunkStore.create(repository)
+    store.add_archive("system-example-20200101.0101", str(export))
+    store.retag_archive("system-example-20200101.0101", "system-example-20200102.0101")
+
+    out = tmp_path / "out"
+    out.mkdir()
+    with ChunkStoreExtract(
+        str(out), repository=repository, system_name="system-example", version=""
+    ) as image_file:
+        # The image refers to itself by its original name:
+        assert os.path.basename(image_file) == "example_20200101.0101.img"
+        with open(image_file, "rb") as f:
+            assert f.read() == b"image"
+
+
+def test_copy_to_stdout_keeps_log_out_of_data(
+    tmp_path, monkeypatch, capfdbinary
+) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    image = os.urandom(3 * 1024 * 1024 + 17)
+    export = tmp_path / "export"
+    export.mkdir()
+    (export / "example_20200101.0101.img").write_bytes(image)
+
+    repository = str(tmp_path / "repo")
+    ChunkStore.create(repository).add_archive(
+        "system-example-20200101.0101", str(export)
+    )
+
+    printer = Printer.instance()
+    verbosity = printer._verbose
+    try:
+        result = firestarter_main(
+            "firestarter",
+            "--verbose",
+            "--verbose",
+            "--verbose",
+            "--verbose",
+            f"--repository={repository}",
+            "system-example",
+            "copy",
+            "--no-verify",
+            "-",
+        )
+    finally:
+        printer.set_verbosity(verbosity)
+        printer.set_output(None)
+        sys.stdout.flush()
+
+    captured = capfdbinary.readouterr()
+    assert result == 0
+    assert captured.out == image
+    assert b"Install target done" in captured.err
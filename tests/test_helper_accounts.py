@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Test for the in-process passwd/group editor.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import os
+import shutil
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.exceptions import GenerateError
+from cleanroom.helper.accounts import transaction
+
+
+_OPERATIONS = [
+    ("groupadd", "sysgrp", {"system": True}),
+    ("groupadd", "sysgrp2", {"system": True}),
+    ("groupadd", "normal", {}),
+    ("groupadd", "fixed", {"gid": 1500}),
+    ("groupadd", "fixed", {"force": True}),
+    ("groupadd", "clash", {"gid": 1500, "force": True}),
+    ("useradd", "alice", {"comment": "Alice", "groups": "wheel,users"}),
+    ("useradd", "bob", {"uid": 1502, "shell": "/bin/zsh", "home": "/srv/bob"}),
+    ("useradd", "carol", {"gid": 100, "expire": "2030-01-01", "password": "$6$ab"}),
+    ("usermod", "alice", {"groups": "users", "lock": True, "shell": "/bin/sh"}),
+    ("usermod", "bob", {"groups": "wheel", "append": True, "rename": "robert"}),
+    ("usermod", "robert", {"uid": 1600}),
+    ("usermod", "carol", {"gid": "wheel", "expire": "None"}),
+    ("groupmod", "normal", {"gid": 1700, "rename": "abnormal"}),
+    ("groupmod", "test", {"gid": 1800}),
+]
+
+_OPTIONS = {
+    "comment": "--comment",
+    "home": "--home",
+    "gid": "--gid",
+    "uid": "--uid",
+    "shell": "--shell",
+    "groups": "--groups",
+    "password": "--password",
+    "expire": "--expiredate",
+}
+
+
+def _setup_root(root: str, *, login_defs: bool) -> str:
+    os.makedirs(os.path.join(root, "etc"))
+    files = {
+        "passwd": "root:x:0:0:root:/root:/bin/bash\n"
+        "bin:x:1:1::/:/sbin/nologin\n"
+        "test:x:1000:1000:Test:/home/test:/bin/false\n",
+        "shadow": "root:!::::::\nbin:!::::::\ntest:!:19000:0:99999:7:::\n",
+        "group": "root:x:0:root\nbin:x:1:\nwheel:x:998:\nusers:x:100:\n"
+        "test:x:1000:\n",
+        "gshadow": "root:::root\nbin:::\nwheel:!::\nusers:!::\ntest:!::\n",
+    }
+    if login_defs:
+        files["login.defs"] = (
+            "UID_MIN 1000\nUID_MAX 60000\nGID_MIN 1000\nGID_MAX 60000\n"
+            "PASS_MAX_DAYS 99999\nPASS_MIN_DAYS 0\nPASS_WARN_AGE 7\n"
+            "USERGROUPS_ENAB yes\n"
+        )
+    for (name, contents) in files.items():
+        with open(os.path.join(root, "etc", name), "w") as f:
+            f.write(contents)
+    return root
+
+
+def _command_line(root: str, operation: str, name: str, kwargs: dict):
+    command = [operation, "--root", root, name]
+    for (key, value) in kwargs.items():
+        if key in ("system", "force", "append"):
+            command.append(f"--{key}")
+        elif key == "lock":
+            command.append("--lock" if value else "--unlock")
+        elif key == "rename":
+            command += ["--new-name" if operation == "groupmod" else "--login", value]
+        elif key == "expire" and value == "None":
+            command += ["--expiredate", ""]
+        else:
+            command += [_OPTIONS[key], str(value)]
+    return command
+
+
+@pytest.mark.skipif(
+    shutil.which("useradd") is None or os.geteuid() != 0,
+    reason="shadow-utils not installed or not running as root",
+)
+@pytest.mark.parametrize("login_defs", [True, False])
+def test_accounts_match_shadow_utils(tmp_path, monkeypatch, login_defs) -> None:
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1700000000")
+    tools_root = _setup_root(str(tmp_path / "tools"), login_defs=login_defs)
+    native_root = _setup_root(str(tmp_path / "native"), login_defs=login_defs)
+
+    for (operation, name, kwargs) in _OPERATIONS:
+        subprocess.run(
+            _command_line(tools_root, operation, name, kwargs),
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    with transaction(native_root) as accounts:
+        for (operation, name, kwargs) in _OPERATIONS:
+            getattr(accounts, operation)(name, **kwargs)
+
+    for f in ("passwd", "shadow", "group", "gshadow"):
+        with open(os.path.join(tools_root, "etc", f)) as expected, open(
+            os.path.join(native_root, "etc", f)
+        ) as result:
+            assert result.read() == expected.read(), f
+
+
+def test_accounts_transaction_writes_once(tmp_path) -> None:
+    root = _setup_root(str(tmp_path / "root"), login_defs=True)
+    passwd = os.path.join(root, "etc/passwd")
+    original = os.stat(passwd).st_ino
+
+    with transaction(root) as accounts:
+        accounts.groupadd("daemons", system=True)
+        accounts.useradd("alice", groups="daemons")
+        with transaction(root) as inner:
+            assert inner is accounts
+            inner.useradd("bob")
+        assert os.stat(passwd).st_ino == original
+
+    with open(passwd) as f:
+        assert f.read().endswith(
+            "alice:x:1001:1001::/home/alice:/bin/bash\n"
+            "bob:x:1002:1002::/home/bob:/bin/bash\n"
+        )
+    with open(os.path.join(root, "etc/group")) as f:
+        assert "daemons:x:997:alice\n" in f.read()
+
+
+def test_accounts_transaction_discards_on_error(tmp_path) -> None:
+    root = _setup_root(str(tmp_path / "root"), login_defs=True)
+    with open(os.path.join(root, "etc/passwd")) as f:
+        before = f.read()
+
+    with pytest.raises(GenerateError):
+        with transaction(root) as accounts:
+            accounts.useradd("alice")
+            accounts.useradd("alice")
+
+    with open(os.path.join(root, "etc/passwd")) as f:
+        assert f.read() == before
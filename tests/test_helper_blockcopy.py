@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Test for the block copy engine.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.helper.blockcopy import (
+    BLOCK_SIZE,
+    copy_blocks,
+    copy_blocks_to_all,
+    copy_stream,
+)
+
+
+def _sparse_image(path: str) -> bytes:
+    with open(path, "wb") as f:
+        f.truncate(6 * BLOCK_SIZE + 7)
+        f.seek(100)
+        f.write(os.urandom(BLOCK_SIZE))
+        f.seek(3 * BLOCK_SIZE)
+        f.write(bytes(BLOCK_SIZE))  # allocated zeroes
+        f.seek(5 * BLOCK_SIZE + 3)
+        f.write(b"tail")
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_copy_blocks(tmp_path) -> None:
+    source = str(tmp_path / "source.img")
+    destination = str(tmp_path / "destination.img")
+    data = _sparse_image(source)
+    with open(destination, "wb") as f:
+        f.write(os.urandom(8 * BLOCK_SIZE))
+
+    progress = []
+    digest = copy_blocks(
+        source, destination, progress=lambda d, t: progress.append((d, t))
+    )
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    with open(destination, "rb") as f:
+        assert f.read() == data
+    assert os.stat(destination).st_blocks * 512 < len(data)
+    assert progress[-1] == (len(data), len(data))
+
+
+def test_copy_stream(tmp_path) -> None:
+    source = str(tmp_path / "source.img")
+    destination = str(tmp_path / "destination.img")
+    data = _sparse_image(source)
+
+    with open(source, "rb") as f:
+        digest = copy_stream(f, destination)
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    with open(destination, "rb") as f:
+        assert f.read() == data
+
+
+def test_copy_blocks_to_all_isolates_failures(tmp_path) -> None:
+    source = str(tmp_path / "source.img")
+    data = _sparse_image(source)
+    good = [str(tmp_path / "one.img"), str(tmp_path / "two.img")]
+    bad = str(tmp_path / "missing" / "three.img")
+
+    (digest, errors) = copy_blocks_to_all(source, [good[0], bad, good[1]])
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert list(errors.keys()) == [bad]
+    for g in good:
+        with open(g, "rb") as f:
+            assert f.read() == data
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Test for the chunk store helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import os
+import random
+import sys
+import typing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.helper.chunkstore import (
+    MAX_CHUNK_SIZE,
+    MIN_CHUNK_SIZE,
+    ChunkStore,
+    chunk_boundaries,
+    is_chunk_store,
+)
+from cleanroom.firestarter.tools import find_archive
+
+
+def _random_bytes(size: int, seed: int) -> bytes:
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, "little")
+
+
+def _chunk_count(store: ChunkStore) -> int:
+    return sum(
+        len(files) for _, _, files in os.walk(os.path.join(store.path, "chunks"))
+    )
+
+
+def test_chunk_boundaries_bounds() -> None:
+    data = _random_bytes(20 * 1024 * 1024, 1) + bytes(20 * 1024 * 1024)
+    ends = chunk_boundaries(data, final=True)
+
+    assert ends[-1] == len(data)
+    start = 0
+    for end in ends[:-1]:
+        assert MIN_CHUNK_SIZE < end - start <= MAX_CHUNK_SIZE
+        start = end
+
+
+def test_chunk_boundaries_realign_after_insertion() -> None:
+    def chunks(data: bytes) -> typing.Set[bytes]:
+        start = 0
+        result = set()
+        for end in chunk_boundaries(data, final=True):
+            result.add(data[start:end])
+            start = end
+        return result
+
+    image = _random_bytes(32 * 1024 * 1024, 4)
+    original = chunks(image)
+    assert len(original) > 16
+
+    for size in (100, 300 * 1024, 700 * 1024):
+        inserted = _random_bytes(size, size)
+        changed = chunks(image[: 5 * 1024 * 1024] + inserted + image[5 * 1024 * 1024 :])
+        assert len(original & changed) >= 0.8 * len(original), size
+
+
+@pytest.mark.parametrize("compression", ["none", "zlib", "lzma"])
+def test_chunk_store_round_trip(tmp_path, compression) -> None:
+    export = tmp_path / "export"
+    export.mkdir()
+    image = _random_bytes(6 * 1024 * 1024, 2) + bytes(10 * 1024 * 1024) + b"end"
+    (export / "system_1.img").write_bytes(image)
+
+    store = ChunkStore.create(str(tmp_path / "repo"), compression=compression)
+    assert is_chunk_store(store.path)
+    store.add_archive("system-1", str(export))
+
+    assert store.archives() == ["system-1"]
+    target = tmp_path / "out.img"
+    store.extract_file("system-1", "system_1.img", str(target), max_workers=4)
+    assert target.read_bytes() == image
+
+
+def test_chunk_store_shares_chunks_between_versions(tmp_path) -> None:
+    base = _random_bytes(24 * 1024 * 1024, 3)
+    store = ChunkStore.create(str(tmp_path / "repo"))
+
+    for version, data in (("1", base), ("2", b"inserted" + base)):
+        export = tmp_path / f"export_{version}"
+        export.mkdir()
+        (export / f"system_{version}.img").write_bytes(data)
+        store.add_archive(f"system-{version}", str(export))
+        if version == "1":
+            first_count = _chunk_count(store)
+
+    # Only the first chunk differs after data was inserted at the front:
+    assert _chunk_count(store) == first_count + 1
+
+    assert find_archive("system", repository=store.path) == ("system-2", "2")
+    assert find_archive("system", repository=store.path, version="1") == (
+        "system-1",
+        "1",
+    )
+
+
+def test_chunk_store_retag(tmp_path) -> None:
+    export = tmp_path / "export"
+    export.mkdir()
+    (export / "system_1.img").write_bytes(b"image")
+
+    store = ChunkStore.create(str(tmp_path / "repo"))
+    store.add_archive("system-1", str(export), digest="abc")
+    store.retag_archive("system-1", "system-2")
+
+    assert store.archives() == ["system-1", "system-2"]
+    assert store.digest("system-2") == "abc"
+    assert list(store.files("system-2").keys()) == ["system_1.img"]
+    store.extract_file("system-2", "system_1.img", str(tmp_path / "out.img"))
+    assert (tmp_path / "out.img").read_bytes() == b"image"
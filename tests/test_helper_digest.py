@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Test for the tree digest helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.helper.digest import tree_digest
+
+
+def _make_tree(base, timestamp: str) -> str:
+    root = base / "fs"
+    (root / "etc").mkdir(parents=True)
+    (root / "etc" / "os-release").write_text(f'VERSION_ID="{timestamp}"\n')
+    (root / "usr").mkdir()
+    (root / "usr" / "data").write_bytes(b"x" * 2 * 1024 * 1024)
+    os.symlink(f"/boot/{timestamp}.efi", root / "etc" / "kernel")
+    return str(root)
+
+
+def test_tree_digest_ignores_timestamp_and_mtime(tmp_path) -> None:
+    first = _make_tree(tmp_path / "a", "20201010")
+    second = _make_tree(tmp_path / "b", "20201111")
+    os.utime(os.path.join(second, "usr", "data"), (0, 0))
+
+    assert tree_digest(first, replacements={"20201010": "@TS@"}) == tree_digest(
+        second, replacements={"20201111": "@TS@"}
+    )
+    assert tree_digest(first) != tree_digest(second)
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda root: open(os.path.join(root, "usr", "data"), "ab").write(b"y"),
+        lambda root: os.chmod(os.path.join(root, "usr", "data"), 0o600),
+        lambda root: os.mkdir(os.path.join(root, "usr", "new")),
+    ],
+)
+def test_tree_digest_detects_changes(tmp_path, change) -> None:
+    root = _make_tree(tmp_path, "1")
+    before = tree_digest(root, extra=["a=1"])
+    assert tree_digest(root, extra=["a=2"]) != before
+
+    change(root)
+
+    assert tree_digest(root, extra=["a=1"]) != before
+
+
+def test_tree_digest_of_files(tmp_path) -> None:
+    file = tmp_path / "vmlinuz"
+    file.write_bytes(b"kernel")
+    before = tree_digest(str(file), str(tmp_path / "missing"))
+
+    file.write_bytes(b"other kernel")
+
+    assert tree_digest(str(file), str(tmp_path / "missing")) != before
@@ -8,7 +8,9 @@
 import pytest  # type: ignore
 
 import os
+import stat
 import sys
+import threading
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
@@ -102,3 +104,37 @@ def test_partitioner(tmpdir) -> None:
 
         assert partitioner.is_partitioned()
         assert partitioner.label() == "gpt"
+
+
+def test_wait_for_device_node(tmpdir) -> None:
+    if os.geteuid() != 0:
+        pytest.skip("This test needs root to run.")
+
+    node = os.path.join(tmpdir, "device")
+    os.mknod(node, stat.S_IFBLK | 0o600, os.makedev(7, 0))
+    device = disk.Device(node)
+
+    threading.Timer(
+        0.1, lambda: os.mknod(node + "1", stat.S_IFBLK | 0o600, os.makedev(7, 1))
+    ).start()
+    assert device.wait_for_device_node(partition=1, timeout=5)
+    assert not device.wait_for_device_node(partition=2, timeout=0.1)
+
+def test_loop_device(tmpdir) -> None:
+    if os.geteuid() != 0 or not os.path.exists("/dev/loop-control"):
+        pytest.skip("This test needs root and loop devices to run.")
+
+    image = os.path.join(tmpdir, "image")
+    with open(image, "wb") as f:
+        f.truncate(disk.byte_size("8m"))
+
+    with disk.attach_image(image) as device:
+        assert isinstance(device, disk.LoopDevice)
+        with open(device.device(), "r+b") as d:
+            d.seek(4096)
+            d.write(b"data")
+        assert device.device(2) == device.device() + "p2"
+
+    with open(image, "rb") as f:
+        f.seek(4096)
+        assert f.read(4) == b"data"
@@ -134,6 +134,28 @@ def test_dir_to_dir_recursive_copy(populated_system_context: SystemContext) -> N
     assert _read_file(os.path.join(fs, "home/bin/ls")) == "/usr/bin/ls"
 
 
+def test_dir_recursive_copy_keeps_metadata(
+    populated_system_context: SystemContext,
+) -> None:
+    fs = populated_system_context.fs_directory
+    os.chmod(os.path.join(fs, "usr/bin/ls"), 0o751)
+    os.utime(os.path.join(fs, "usr/bin/ls"), (1000, 2000))
+    os.symlink("ls", os.path.join(fs, "usr/bin/dir"))
+    os.symlink("/does/not/exist", os.path.join(fs, "usr/bin/dangling"))
+
+    filehelper.copy(
+        populated_system_context, "/usr", "/home", recursive=True, preserve=True
+    )
+
+    copied = os.path.join(fs, "home/usr/bin")
+    assert _read_file(os.path.join(copied, "ls")) == "/usr/bin/ls"
+    assert os.stat(os.path.join(copied, "ls")).st_mode & 0o7777 == 0o751
+    assert os.stat(os.path.join(copied, "ls")).st_mtime == 2000
+    assert os.readlink(os.path.join(copied, "dir")) == "ls"
+    assert os.readlink(os.path.join(copied, "dangling")) == "/does/not/exist"
+    assert _read_file(os.path.join(fs, "home/usr/lib/libz")) == "/usr/lib/libz"
+
+
 def test_file_to_file_move(populated_system_context: SystemContext) -> None:
     fs = populated_system_context.fs_directory
     filehelper.move(populated_system_context, "/usr/bin/ls", "/etc/foo")
@@ -180,3 +202,112 @@ def test_dir_to_dir_move(populated_system_context: SystemContext) -> None:
     filehelper.move(populated_system_context, "/usr/bin", "/home")
     assert not os.path.isfile(os.path.join(fs, "usr/bin/ls"))
     assert _read_file(os.path.join(fs, "home/bin/ls")) == "/usr/bin/ls"
+
+
+def _tree(directory: str) -> typing.Set[str]:
+    return {
+        os.path.relpath(os.path.join(root, f), directory)
+        for (root, dirs, files) in os.walk(directory)
+        for f in dirs + files
+    }
+
+
+@pytest.mark.parametrize(
+    ("pattern", "recursive"),
+    [
+        pytest.param("/usr/bin/*", False, id="wildcard"),
+        pytest.param("/usr/*/l*", False, id="wildcard directory"),
+        pytest.param("/usr/lib", True, id="recursive directory"),
+        pytest.param("/home/**/*.txt", True, id="double star"),
+        pytest.param("/home/*", True, id="hidden files"),
+        pytest.param("/home/.*", False, id="dotfiles"),
+        pytest.param("/home/**", True, id="trailing double star"),
+        pytest.param("/home/test/**/", True, id="trailing double star slash"),
+        pytest.param("/home/**/*.txt", False, id="double star not recursive"),
+        pytest.param("/does/not/exist", True, id="missing"),
+        pytest.param("/does/not/exist", False, id="missing not recursive"),
+    ],
+)
+def test_remove_all_matches_remove(
+    populated_system_context: SystemContext, pattern: str, recursive: bool
+) -> None:
+    fs = populated_system_context.fs_directory
+    with open(os.path.join(fs, "home/.hidden"), "w") as f:
+        f.write("hidden")
+    os.makedirs(os.path.join(fs, "home/test/deep/er"))
+    with open(os.path.join(fs, "home/test/deep/er/file.txt"), "w") as f:
+        f.write("deep")
+
+    filehelper.remove_all(
+        populated_system_context,
+        filehelper.Removal(pattern=pattern, recursive=recursive, force=True),
+        filehelper.Removal(pattern="/etc/passwd"),
+    )
+    fused = _tree(fs)
+
+    # Compare with removing one pattern at a time:
+    os.rename(fs, fs + ".fused")
+    os.makedirs(os.path.join(fs, "usr/bin"))
+    os.makedirs(os.path.join(fs, "usr/lib"))
+    os.makedirs(os.path.join(fs, "etc"))
+    os.makedirs(os.path.join(fs, "home/test/deep/er"))
+    for f in (
+        "usr/bin/ls",
+        "usr/bin/grep",
+        "usr/lib/libz",
+        "etc/passwd",
+        "home/test/example.txt",
+        "home/.hidden",
+        "home/test/deep/er/file.txt",
+    ):
+        with open(os.path.join(fs, f), "w") as fd:
+            fd.write(f)
+
+    filehelper.remove(
+        populated_system_context, pattern, recursive=recursive, force=True
+    )
+    filehelper.remove(populated_system_context, "/etc/passwd")
+
+    assert fused == _tree(fs)
+    assert "etc/passwd" not in fused
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        pytest.param("/usr/bin/dangling", id="dangling symlink"),
+        pytest.param("usr/bin/ls", id="relative path"),
+        pytest.param("/../etc/passwd", id="outside root directory"),
+    ],
+)
+def test_remove_all_errors_like_remove(
+    populated_system_context: SystemContext, pattern: str
+) -> None:
+    fs = populated_system_context.fs_directory
+    os.symlink("/does/not/exist", os.path.join(fs, "usr/bin/dangling"))
+
+    with pytest.raises(cleanroom.exceptions.GenerateError):
+        filehelper.remove(populated_system_context, pattern)
+    with pytest.raises(cleanroom.exceptions.GenerateError):
+        filehelper.remove_all(populated_system_context, filehelper.Removal(pattern))
+
+
+def test_work_directory_is_not_entered(
+    populated_system_context: SystemContext,
+) -> None:
+    fs = populated_system_context.fs_directory
+    cwd = os.getcwd()
+
+    assert filehelper.isfile(populated_system_context, "ls", work_directory="/usr/bin")
+    assert filehelper.exists(
+        populated_system_context, "../lib/libz", work_directory="/usr/bin"
+    )
+    assert not filehelper.isdir(
+        populated_system_context, "ls", work_directory="/usr/bin"
+    )
+    filehelper.symlink(
+        populated_system_context, "../bin/ls", "ls", work_directory="/usr/lib"
+    )
+
+    assert os.readlink(os.path.join(fs, "usr/lib/ls")) == "../bin/ls"
+    assert os.getcwd() == cwd
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Test for the GPT and reflink helpers.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import os
+import struct
+import sys
+import uuid
+import zlib
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.exceptions import GenerateError
+from cleanroom.helper.gpt import (
+    ESP_TYPE,
+    ROOT_X86_64_TYPE,
+    SECTOR_SIZE,
+    Partition,
+    layout,
+    write_gpt,
+)
+from cleanroom.helper.reflink import copy_file_into
+
+
+def _read_header(data: bytes, lba: int):
+    header = data[lba * SECTOR_SIZE : lba * SECTOR_SIZE + 92]
+    fields = struct.unpack("<8sIIIIQQQQ16sQIII", header)
+    assert fields[0] == b"EFI PART"
+    assert zlib.crc32(header[:16] + b"\0\0\0\0" + header[20:]) == fields[3]
+    return fields
+
+
+def test_gpt_layout_and_contents(tmp_path) -> None:
+    esp = tmp_path / "esp.img"
+    esp.write_bytes(b"E" * 5000)
+    root = tmp_path / "root.img"
+    root.write_bytes(b"R" * (3 * 1024 * 1024))
+
+    disk_uuid = uuid.uuid4()
+    total_size, placed = layout(
+        (
+            Partition(type=ESP_TYPE, size=5000, uuid=uuid.uuid4(), label="ESP"),
+            Partition(
+                type=ROOT_X86_64_TYPE,
+                size=3 * 1024 * 1024,
+                uuid=uuid.uuid4(),
+                label="root",
+            ),
+        )
+    )
+    assert [p.offset for p in placed] == [1024 * 1024, 2 * 1024 * 1024]
+    assert placed[0].size == 5120
+    assert total_size == 6 * 1024 * 1024
+
+    image = tmp_path / "disk.img"
+    with open(image, "wb") as fd:
+        fd.truncate(total_size)
+        write_gpt(fd.fileno(), total_size, placed, disk_uuid=disk_uuid)
+        for f, p in zip((esp, root), placed):
+            assert (
+                copy_file_into(str(f), fd.fileno(), offset=p.offset)[0]
+                == p.partition.size
+            )
+
+    data = image.read_bytes()
+    assert len(data) == total_size
+    assert data[510:512] == b"\x55\xaa"
+    assert data[450] == 0xEE
+
+    last_lba = total_size // SECTOR_SIZE - 1
+    primary = _read_header(data, 1)
+    backup = _read_header(data, last_lba)
+    assert primary[5:7] == (1, last_lba)
+    assert backup[5:7] == (last_lba, 1)
+    assert uuid.UUID(bytes_le=primary[9]) == disk_uuid
+
+    entries = data[2 * SECTOR_SIZE : 34 * SECTOR_SIZE]
+    assert zlib.crc32(entries) == primary[13] == backup[13]
+    assert data[backup[10] * SECTOR_SIZE : (backup[10] + 32) * SECTOR_SIZE] == entries
+
+    type_guid, part_guid, first, last, _, name = struct.unpack(
+        "<16s16sQQQ72s", entries[:128]
+    )
+    assert uuid.UUID(bytes_le=type_guid) == ESP_TYPE
+    assert uuid.UUID(bytes_le=part_guid) == placed[0].partition.uuid
+    assert (first, last) == (2048, 2048 + 10 - 1)
+    assert name.decode("utf-16-le").rstrip("\0") == "ESP"
+
+    assert data[placed[0].offset : placed[0].offset + 5000] == b"E" * 5000
+    assert data[placed[0].offset + 5000 : placed[1].offset] == bytes(
+        placed[1].offset - placed[0].offset - 5000
+    )
+    assert data[placed[1].offset : placed[1].offset + 3 * 1024 * 1024] == b"R" * (
+        3 * 1024 * 1024
+    )
+
+
+def test_gpt_partition_does_not_fit(tmp_path) -> None:
+    total_size, placed = layout(
+        (Partition(type=ESP_TYPE, size=1024 * 1024, uuid=uuid.uuid4()),)
+    )
+    with open(tmp_path / "disk.img", "wb") as fd:
+        fd.truncate(total_size - 1024 * 1024)
+        with pytest.raises(GenerateError):
+            write_gpt(
+                fd.fileno(), total_size - 1024 * 1024, placed, disk_uuid=uuid.uuid4()
+            )
@@ -14,7 +14,6 @@ import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from cleanroom.binarymanager import BinaryManager, Binaries
 from cleanroom.helper.group import GroupHelper
 
 
@@ -76,11 +75,7 @@ def test_missing_group_data(user_setup) -> None:
 
 
 def test_add_group(user_setup) -> None:
-    binary_manager = BinaryManager()
-    group_helper = GroupHelper(
-        binary_manager.binary(Binaries.GROUPADD),
-        binary_manager.binary(Binaries.GROUPMOD),
-    )
+    group_helper = GroupHelper()
     group_helper.groupadd("addedgroup", gid=1200, root_directory=user_setup)
 
     result = GroupHelper.group_data("addedgroup", root_directory=user_setup)
@@ -94,11 +89,7 @@ def test_add_group(user_setup) -> None:
 
 
 def test_mod_group(user_setup) -> None:
-    binary_manager = BinaryManager()
-    group_helper = GroupHelper(
-        binary_manager.binary(Binaries.GROUPADD),
-        binary_manager.binary(Binaries.GROUPMOD),
-    )
+    group_helper = GroupHelper()
     group_helper.groupmod("test", rename="tester", root_directory=user_setup)
 
     result = GroupHelper.group_data("tester", root_directory=user_setup)
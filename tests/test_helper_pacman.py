@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Test for the pacman helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.helper.archlinux.pacman import installed_packages
+
+
+def _add_package(db: str, name: str, version: str, install_date: str) -> None:
+    directory = os.path.join(db, f"{name}-{version}")
+    os.makedirs(directory)
+    with open(os.path.join(directory, "desc"), "w") as f:
+        f.write(
+            f"%NAME%\n{name}\n\n%VERSION%\n{version}\n\n"
+            f"%INSTALLDATE%\n{install_date}\n\n"
+        )
+    with open(os.path.join(directory, "files"), "w") as f:
+        f.write("%FILES%\nusr/\n")
+
+
+def test_installed_packages(tmp_path) -> None:
+    first = str(tmp_path / "first")
+    _add_package(first, "linux", "6.1.1-1", "1700000000")
+    _add_package(first, "systemd", "254.1-1", "1700000000")
+
+    second = str(tmp_path / "second")
+    _add_package(second, "systemd", "254.1-1", "1700000100")
+    _add_package(second, "linux", "6.1.1-1", "1700000200")
+
+    assert installed_packages(first) == [
+        ("linux", "6.1.1-1"),
+        ("systemd", "254.1-1"),
+    ]
+    assert installed_packages(first) == installed_packages(second)
+    assert installed_packages(str(tmp_path / "missing")) == []
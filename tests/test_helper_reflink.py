@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Test for the reflink copy helpers.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import os
+import pytest  # type: ignore
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.helper.reflink import copy_tree, sync_tree
+
+
+def _write(path: str, contents: str, mtime: int = 1700000000) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(contents)
+    os.utime(path, (mtime, mtime))
+
+
+def test_sync_tree(tmp_path) -> None:
+    old = str(tmp_path / "old")
+    _write(os.path.join(old, "same"), "same")
+    _write(os.path.join(old, "changed"), "old")
+    _write(os.path.join(old, "gone/file"), "gone")
+    _write(os.path.join(old, "dir_becomes_link/file"), "x")
+    _write(os.path.join(old, "sneaky"), "aaa")
+
+    new = str(tmp_path / "new")
+    _write(os.path.join(new, "same"), "same")
+    _write(os.path.join(new, "changed"), "new", mtime=1700000100)
+    _write(os.path.join(new, "added/file"), "added")
+    _write(os.path.join(new, "sneaky"), "bbb")  # Same size and mtime!
+    os.symlink("same", os.path.join(new, "dir_becomes_link"))
+
+    target = str(tmp_path / "target")
+    copy_tree(old, target)
+    inode = os.stat(os.path.join(target, "same")).st_ino
+
+    methods = sync_tree(new, target)
+    assert methods["unchanged"] == 2
+    assert methods["removed"] == 1
+    assert methods["symlink"] == 1
+
+    assert sorted(os.listdir(target)) == [
+        "added",
+        "changed",
+        "dir_becomes_link",
+        "same",
+        "sneaky",
+    ]
+    assert os.stat(os.path.join(target, "same")).st_ino == inode
+    assert os.readlink(os.path.join(target, "dir_becomes_link")) == "same"
+    with open(os.path.join(target, "changed")) as f:
+        assert f.read() == "new"
+    with open(os.path.join(target, "sneaky")) as f:
+        assert f.read() == "aaa"
+
+    sync_tree(new, target, compare_contents=True)
+    with open(os.path.join(target, "sneaky")) as f:
+        assert f.read() == "bbb"
+    assert sync_tree(new, target, compare_contents=True) == {"unchanged": 5}
+
+
+def test_sync_tree_keeps_hard_links(tmp_path) -> None:
+    source = str(tmp_path / "source")
+    _write(os.path.join(source, "a/file"), "data")
+    os.link(os.path.join(source, "a/file"), os.path.join(source, "b"))
+    os.link(os.path.join(source, "a/file"), os.path.join(source, "c"))
+
+    target = str(tmp_path / "target")
+    _write(os.path.join(target, "c"), "other")
+
+    methods = sync_tree(source, target)
+    assert methods["hardlink"] == 2
+
+    inodes = {os.lstat(os.path.join(target, f)).st_ino for f in ("a/file", "b", "c")}
+    assert len(inodes) == 1
+    assert os.lstat(os.path.join(target, "b")).st_nlink == 3
+
+    assert sync_tree(source, target) == {"unchanged": 3}
+
+
+def test_sync_tree_compares_xattrs(tmp_path) -> None:
+    source = str(tmp_path / "source")
+    _write(os.path.join(source, "file"), "data")
+
+    target = str(tmp_path / "target")
+    copy_tree(source, target, preserve=True)
+    try:
+        os.setxattr(os.path.join(source, "file"), "user.test", b"value")
+    except OSError as e:
+        pytest.skip(f"No xattr support: {e}")
+
+    assert sync_tree(source, target) == {"unchanged": 1}
+    assert "unchanged" not in sync_tree(source, target, preserve=True)
+    assert os.getxattr(os.path.join(target, "file"), "user.test") == b"value"
+    assert sync_tree(source, target, preserve=True) == {"unchanged": 1}
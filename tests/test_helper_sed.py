@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Test for the in-process sed helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import os
+import shutil
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.exceptions import GenerateError
+from cleanroom.helper.sed import batch, parse_script, sed
+
+
+_INPUT = """# Example configuration
+hosts: files resolve dns
+CHASSIS=vm
+#ProcessSizeMax=2G
+  # SystemUseMax=
+RuleFile=/etc/usbguard/rules.conf
+Exec=/usr/bin/app --flag
+MODULES=()
+path (with) {braces} + a? b|c
+aaa bbb aaa bbb
+x41 A Aa ab
+/boot/initramfs-linux.img"""
+
+
+_NATIVE = [
+    "/^hosts\\s*:/ s/resolve/mdns_minimal [NOTFOUND=return] resolve/",
+    '/^CHASSIS=/ cCHASSIS="server"',
+    "/^\\s*#*\\s*ProcessSizeMax=/ cProcessSizeMax=10M",
+    "/^\\s*#*\\s*SystemUseMax=/ cSystemUseMax=100M",
+    "/RuleFile=\\/etc/ cRuleFile=/var/etc/usbguard/rules.conf",
+    "/^Exec=.*$/ s!^Exec=!Exec=/usr/bin/firejail !",
+    "s/^CHASSIS=.*$/CHASSIS=container/",
+    "/^MODULES=/ cMODULES=(btrfs ext4)",
+    "s%/initramfs-linux.*.img%/initrd%",
+    "s/aaa/x/2",
+    "s/aaa/x/g",
+    "s/\\(a*\\) \\(b*\\)/\\2 \\1 [&]/",
+    "s/(with) {braces} + a? b|c/literal/",
+    "s/b\\+/B/g",
+    "s/[[:space:]]\\+/_/g",
+    "s/[^a-z]//g",
+    "s/A/x/Ig",
+    "/^#/ d",
+    "/^#/! d",
+    "$ d",
+    "3 a\\appended line",
+    "/^MODULES/ i inserted line",
+    "s/^*//",
+    "s/a*/-/g",
+    "s/e$/E/",
+    "s/[xyo]/0/g",
+    "2!d",
+    "$ a\\appended line",
+    "$ i\\inserted line",
+    "$ cchanged line",
+    "$ s/img/i\\nmg/",
+    "$ d",
+]
+
+# Scripts that look supported but must be handed to the sed binary:
+_FALLBACK = [
+    "a foo\ns/x/y/",
+    "3 a\\\nfirst\\\nsecond",
+    "s/\\x41/Z/",
+    "s/\\d65/Z/",
+    "s/\\o101/Z/",
+    "s/\\cA/Z/",
+    "s/A/\\x5a/",
+    "s/[[=a=]]/Z/g",
+    "s/[[.a.]]/Z/g",
+    "s/x\\|y\\|o/0/g",
+    "s/\\t\\|\\r/_/g",
+    "s/a\\|ab/X/g",
+]
+
+
+@pytest.mark.parametrize("final_newline", ["\n", ""], ids=["newline", "no newline"])
+@pytest.mark.parametrize("script", _NATIVE + _FALLBACK)
+@pytest.mark.skipif(shutil.which("sed") is None, reason="sed is not installed")
+def test_sed_matches_sed_binary(tmp_path, script: str, final_newline: str) -> None:
+    assert (parse_script(script) is not None) == (script in _NATIVE)
+
+    expected = tmp_path / "expected.conf"
+    expected.write_text(_INPUT + final_newline)
+    subprocess.run(["sed", "-i", "-e", script, str(expected)], check=True)
+
+    result = tmp_path / "result.conf"
+    result.write_text(_INPUT + final_newline)
+    sed(script, str(result), root_directory=str(tmp_path))
+
+    assert result.read_text() == expected.read_text()
+
+
+@pytest.mark.parametrize(
+    "script", ["1,3 d", "s/a/b/w out", "/a/ {p}", "s/a/\\U&/", "p", "s//x/"]
+)
+def test_sed_unsupported_scripts(script: str) -> None:
+    assert parse_script(script) is None
+
+
+def test_sed_batch(tmp_path) -> None:
+    config = tmp_path / "config"
+    config.write_text("a=1\nb=2\n")
+    os.chmod(config, 0o640)
+
+    with batch(str(tmp_path)):
+        sed("/^a=/ ca=10", str(config), root_directory=str(tmp_path))
+        sed("s/=10/=11/", str(config), root_directory=str(tmp_path))
+        # Unsupported scripts get the queued edits applied first:
+        sed("1,1 s/a/A/", str(config), root_directory=str(tmp_path))
+        sed("/^b=/ cb=20", str(config), root_directory=str(tmp_path))
+        assert config.read_text() == "A=11\nb=2\n"
+
+    assert config.read_text() == "A=11\nb=20\n"
+    assert os.stat(config).st_mode & 0o777 == 0o640
+
+
+def test_sed_missing_file(tmp_path) -> None:
+    with pytest.raises(GenerateError):
+        sed("s/a/b/", str(tmp_path / "missing"), root_directory=str(tmp_path))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Test for the stage graph helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.exceptions import GenerateError
+from cleanroom.helper.stages import StageGraph
+
+
+def test_stage_graph_linear() -> None:
+    graph = StageGraph(start=1)
+    graph.add_stage(
+        "a", lambda start: {"a": start + 1}, inputs=("start",), outputs=("a",)
+    )
+    graph.add_stage("b", lambda a: {"b": a * 10}, inputs=("a",), outputs=("b",))
+
+    result = graph.run()
+
+    assert result == {"start": 1, "a": 2, "b": 20}
+    assert set(graph.timings.keys()) == {"a", "b"}
+
+
+def test_stage_graph_concurrent() -> None:
+    # Both stages wait for each other, so this only passes when run in parallel:
+    barrier = threading.Barrier(2, timeout=10)
+
+    def stage(name: str):
+        barrier.wait()
+        return {name: name}
+
+    graph = StageGraph()
+    graph.add_stage("left", lambda: stage("l"), outputs=("l",))
+    graph.add_stage("right", lambda: stage("r"), outputs=("r",))
+    graph.add_stage(
+        "join", lambda l, r: {"j": l + r}, inputs=("l", "r"), outputs=("j",)
+    )
+
+    assert graph.run()["j"] == "lr"
+
+
+def test_stage_graph_failure() -> None:
+    ran = []
+
+    def fail():
+        raise GenerateError("Failed")
+
+    graph = StageGraph()
+    graph.add_stage("fail", fail, outputs=("x",))
+    graph.add_stage("after", lambda x: ran.append(x), inputs=("x",))
+
+    with pytest.raises(GenerateError):
+        graph.run()
+    assert not ran
+
+
+@pytest.mark.parametrize(
+    "stages",
+    [
+        pytest.param([("a", (), ("x",)), ("b", (), ("x",))], id="duplicate output"),
+        pytest.param([("a", ("y",), ("x",))], id="missing input"),
+        pytest.param([("a", ("y",), ("x",)), ("b", ("x",), ("y",))], id="cycle"),
+        pytest.param([("a", (), ("x",)), ("b", (), ("y",))], id="missing output"),
+    ],
+)
+def test_stage_graph_errors(stages) -> None:
+    graph = StageGraph()
+    for name, inputs, outputs in stages:
+        graph.add_stage(name, lambda **_: {"x": None}, inputs=inputs, outputs=outputs)
+
+    with pytest.raises(GenerateError):
+        graph.run()
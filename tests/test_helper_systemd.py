@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Test for the systemd helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.exceptions import GenerateError
+from cleanroom.helper.systemd import flush_systemd_enable, systemd_enable
+from cleanroom.location import Location
+
+
+def _systemctl(tmp_path) -> str:
+    """A systemctl stand-in that logs its arguments and fails on broken units."""
+    log = tmp_path / "systemctl.log"
+    script = tmp_path / "systemctl"
+    script.write_text(
+        "#!/bin/sh\n"
+        f'echo "$@" >> {log}\n'
+        'case "$*" in *broken*) exit 1;; esac\n'
+    )
+    os.chmod(script, 0o755)
+    return str(script)
+
+
+def _calls(tmp_path):
+    return (tmp_path / "systemctl.log").read_text().splitlines()
+
+
+def test_systemd_enable_batches(tmp_path, system_context) -> None:
+    systemctl = _systemctl(tmp_path)
+    fs = system_context.fs_directory
+    location = Location(file_name="system.def", line_number=1)
+
+    systemd_enable(system_context, "a.service", "b.service", location=location)
+    systemd_enable(system_context, "pipewire.socket", location=location, user=True)
+    systemd_enable(system_context, "b.service", "c.timer", location=location)
+    assert system_context.has_systemd_enables
+
+    flush_systemd_enable(system_context, systemctl_command=systemctl)
+
+    assert _calls(tmp_path) == [
+        f"--root={fs} enable a.service b.service c.timer",
+        f"--root={fs} --global enable pipewire.socket",
+    ]
+    assert not system_context.has_systemd_enables
+
+
+def test_systemd_enable_reports_location(tmp_path, system_context) -> None:
+    systemctl = _systemctl(tmp_path)
+    location = Location(file_name="system.def", line_number=3)
+
+    systemd_enable(system_context, "a.service", location=location)
+    systemd_enable(system_context, "broken.service", location=location.next_line())
+    location.next_line()
+
+    with pytest.raises(GenerateError) as e:
+        flush_systemd_enable(system_context, systemctl_command=systemctl)
+    assert str(e.value.location) == "system.def:4"
+    assert len(_calls(tmp_path)) == 3
@@ -14,7 +14,6 @@ import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from cleanroom.binarymanager import BinaryManager, Binaries
 from cleanroom.helper.user import UserHelper
 
 
@@ -95,10 +94,7 @@ def test_missing_user_data(user_setup) -> None:
 
 
 def test_add_user(user_setup) -> None:
-    binary_manager = BinaryManager()
-    user_helper = UserHelper(
-        binary_manager.binary(Binaries.USERADD), binary_manager.binary(Binaries.USERMOD)
-    )
+    user_helper = UserHelper()
     user_helper.useradd(
         "addeduser",
         comment="freshly added user",
@@ -123,10 +119,7 @@ def test_add_user(user_setup) -> None:
 
 
 def test_mod_user(user_setup) -> None:
-    binary_manager = BinaryManager()
-    user_helper = UserHelper(
-        binary_manager.binary(Binaries.USERADD), binary_manager.binary(Binaries.USERMOD)
-    )
+    user_helper = UserHelper()
     user_helper.usermod(
         "test",
         comment="freshly added user",
@@ -145,3 +138,17 @@ def test_mod_user(user_setup) -> None:
         "home": "/home/test",
         "shell": "/usr/bin/nologin",
     }
+
+
+def test_user_data_follows_file_changes(user_setup) -> None:
+    assert UserHelper.user_data("test", root_directory=user_setup).uid == 10001
+    assert UserHelper.user_data_by_uid(10002, root_directory=user_setup).name == "test1"
+
+    passwd_path = os.path.join(user_setup, "etc/passwd")
+    with open(passwd_path, "a") as passwd:
+        passwd.write("late:x:10010:10001:Late user:/home/late:/bin/false\n")
+
+    result = UserHelper.user_data("late", root_directory=user_setup)
+    assert result
+    assert result.uid == 10010
+    assert UserHelper.user_data_by_uid(10010, root_directory=user_setup) == result
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Test for the dm-verity hash tree helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import pytest  # type: ignore
+
+import hashlib
+import os
+import shutil
+import subprocess
+import struct
+import sys
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.exceptions import GenerateError
+from cleanroom.helper.verity import create_hash_tree
+
+
+def _naive_tree(data: bytes, block_size: int, salt: bytes):
+    """Straight forward reimplementation, one level at a time."""
+    levels = []
+    current = data
+    while len(current) > block_size:
+        digests = b"".join(
+            hashlib.sha256(salt + current[i : i + block_size]).digest()
+            for i in range(0, len(current), block_size)
+        )
+        if len(digests) % block_size:
+            digests += bytes(block_size - len(digests) % block_size)
+        levels.append(digests)
+        current = digests
+    return (hashlib.sha256(salt + current[:block_size]).hexdigest(), levels)
+
+
+@pytest.mark.parametrize(
+    ("blocks", "expected_levels"),
+    [(1, 0), (2, 1), (16, 1), (17, 2), (300, 3)],
+)
+def test_verity_hash_tree(tmp_path, blocks, expected_levels) -> None:
+    block_size = 512  # 16 digests per hash block
+    data = os.urandom(blocks * block_size)
+    salt = os.urandom(32)
+    data_file = tmp_path / "data.img"
+    data_file.write_bytes(data)
+    hash_file = tmp_path / "hash.img"
+
+    result = create_hash_tree(
+        str(data_file),
+        str(hash_file),
+        data_block_size=block_size,
+        hash_block_size=block_size,
+        salt=salt,
+        uuid=uuid.UUID(int=42),
+        max_workers=4,
+    )
+
+    root_hash, levels = _naive_tree(data, block_size, salt)
+    assert len(levels) == expected_levels
+    assert result.root_hash == root_hash
+    assert result.data_blocks == blocks
+
+    hash_data = hash_file.read_bytes()
+    assert len(hash_data) == result.hash_size
+    assert hash_data[block_size:] == b"".join(reversed(levels))
+
+    signature, version, hash_type, sb_uuid, algorithm, dbs, hbs, count, salt_size = (
+        struct.unpack("<8sII16s32sIIQH", hash_data[:82])
+    )
+    assert signature == b"verity\0\0"
+    assert (version, hash_type) == (1, 1)
+    assert uuid.UUID(bytes=sb_uuid) == uuid.UUID(int=42)
+    assert algorithm.rstrip(b"\0") == b"sha256"
+    assert (dbs, hbs, count) == (block_size, block_size, blocks)
+    assert hash_data[88 : 88 + salt_size] == salt
+
+
+def test_verity_unaligned_data(tmp_path) -> None:
+    data_file = tmp_path / "data.img"
+    data_file.write_bytes(b"x" * 4097)
+    with pytest.raises(GenerateError):
+        create_hash_tree(str(data_file), str(tmp_path / "hash.img"))
+
+
+@pytest.mark.skipif(
+    shutil.which("veritysetup") is None, reason="veritysetup is not installed"
+)
+def test_verity_veritysetup_verify(tmp_path) -> None:
+    data_file = tmp_path / "data.img"
+    data_file.write_bytes(os.urandom(4096 * 1000))
+    hash_file = tmp_path / "hash.img"
+
+    result = create_hash_tree(str(data_file), str(hash_file))
+
+    subprocess.run(
+        ["veritysetup", "verify", str(data_file), str(hash_file), result.root_hash],
+        check=True,
+    )
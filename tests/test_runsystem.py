@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Test for running stored systems in a container.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from cleanroom.main import _parse_commandline
+from cleanroom.runsystem import nspawn_command
+
+
+def test_parse_run_commandline() -> None:
+    args = _parse_commandline(
+        "clrm", "run", "--work-directory=/tmp/work", "--shell", "system-example"
+    )
+    assert args.run
+    assert args.shell
+    assert not args.rebuild
+    assert args.systems == ["system-example"]
+    assert args.work_directory == "/tmp/work"
+
+    args = _parse_commandline("clrm", "system-example", "system-other")
+    assert not args.run
+    assert args.systems == ["system-example", "system-other"]
+
+
+def test_nspawn_command() -> None:
+    assert nspawn_command("/usr/bin/systemd-nspawn", "/tmp/fs", machine="example") == [
+        "/usr/bin/systemd-nspawn",
+        "--directory=/tmp/fs",
+        "--machine=example",
+        "--register=no",
+        "--private-network",
+        "--boot",
+    ]
+    assert nspawn_command(
+        "nspawn", "/tmp/fs", machine="example", shell=True, with_network=True
+    ) == ["nspawn", "--directory=/tmp/fs", "--machine=example", "--register=no"]